@@ -0,0 +1,121 @@
+import time
+import argparse
+import json
+import numpy as np
+import torch
+
+from multiprocessing import Pool
+
+from train_cmaes import PolicyNetwork, get_num_params, load_array_in_model, \
+                        init_eval, evaluate_population
+from utils.make_env import make_env
+
+
+def serial_eval(env, policy, solutions, seed, config, nb_agents):
+    """
+    Previous implementation: candidates evaluated one after the other, one
+    forward pass of a single candidate per step.
+    """
+    returns = np.zeros((len(solutions), config.n_eps_per_eval))
+    for sol_i in range(len(solutions)):
+        load_array_in_model(solutions[sol_i], policy)
+        np.random.seed(seed)
+        for eval_i in range(config.n_eps_per_eval):
+            obs = env.reset()
+            ep_return = 0.0
+            for et_i in range(config.episode_length):
+                torch_obs = torch.Tensor(np.vstack(obs))
+                actions = policy(torch_obs)
+                agent_actions = [ac.data.numpy() for ac in actions]
+                next_obs, rewards, dones, infos = env.step(agent_actions)
+                ep_return += sum(rewards) / nb_agents
+                if dones[0]:
+                    break
+                obs = next_obs
+            returns[sol_i, eval_i] = ep_return
+    return returns
+
+def fitness(returns):
+    return np.array([-sum(sol_returns) / len(sol_returns)
+                     for sol_returns in returns])
+
+
+@torch.no_grad()
+def run(args):
+    sce_conf = {}
+    if args.sce_conf_path is not None:
+        with open(args.sce_conf_path) as cf:
+            sce_conf = json.load(cf)
+    nb_agents = sce_conf['nb_agents']
+
+    torch.set_num_threads(1)
+    env = make_env(args.env_path, sce_conf,
+                   discrete_action=args.discrete_action)
+    num_in_pol = env.observation_space[0].shape[0]
+    if args.discrete_action:
+        num_out_pol = env.action_space[0].n
+    else:
+        num_out_pol = env.action_space[0].shape[0]
+    policy = PolicyNetwork(num_in_pol, num_out_pol, args.hidden_dim,
+                           linear=args.linear,
+                           discrete_action=args.discrete_action)
+    policy.eval()
+    n_params = get_num_params(policy)
+
+    print(f"Population evaluation, {args.n_eps_per_eval} episodes of "
+          f"{args.episode_length} steps per candidate, times in s")
+    print(f"{'pop_size':>8} {'serial':>10} {'batched':>10} {'speedup':>8}")
+    for pop_size in args.pop_sizes:
+        np.random.seed(args.seed)
+        solutions = list(np.random.uniform(-5, 5, size=(pop_size, n_params)))
+        seed = np.random.randint(1e9)
+
+        chunk_size = int(np.ceil(pop_size / args.n_workers))
+        if args.n_workers > 1:
+            pool = Pool(args.n_workers, initializer=init_eval,
+                        initargs=(args, sce_conf, chunk_size))
+        else:
+            pool = None
+        init_eval(args, sce_conf, pop_size)
+
+        start = time.perf_counter()
+        ref = serial_eval(env, policy, solutions, seed, args, nb_agents)
+        t_serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        returns, _, _ = evaluate_population(
+            solutions, seed, pool, args.n_workers)
+        t_batched = time.perf_counter() - start
+
+        # Same fitness as the serial loop and as evaluating each candidate 
+        # alone
+        alone = np.concatenate([
+            evaluate_population([sol], seed)[0] for sol in solutions])
+        assert np.array_equal(fitness(returns), fitness(ref))
+        assert np.array_equal(fitness(returns), fitness(alone))
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+        print(f"{pop_size:>8} {t_serial:>10.3f} {t_batched:>10.3f} "
+              f"{t_serial / t_batched:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the evaluation of a CMA-ES population.")
+    parser.add_argument("env_path", help="Path to the environment")
+    parser.add_argument("--sce_conf_path", default=None, type=str,
+                        help="Path to the scenario config file")
+    parser.add_argument("--discrete_action", action='store_true')
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--pop_sizes", type=int, nargs="+",
+                        default=[4, 8, 16, 32, 64])
+    parser.add_argument("--n_workers", default=1, type=int)
+    parser.add_argument("--n_eps_per_eval", default=1, type=int)
+    parser.add_argument("--episode_length", default=100, type=int)
+    parser.add_argument("--hidden_dim", default=8, type=int)
+    parser.add_argument("--linear", action='store_true')
+    args = parser.parse_args()
+
+    run(args)
@@ -7,8 +7,8 @@ import numpy as np
 import pandas as pd
 import torch.nn as nn
 import torch.nn.functional as F
+from multiprocessing import Pool
 from tqdm import tqdm
-from torch.autograd import Variable
 from tensorboardX import SummaryWriter
 from utils.make_env import get_paths, load_scenario_config, make_env
 
@@ -42,7 +42,7 @@ class PolicyNetwork(nn.Module):
             self.fc_out.weight.data.uniform_(-3e-3, 3e-3)
             self.out_fn = torch.tanh
         else:  # one hot argmax
-            self.out_fn = lambda x: (x == x.max(1, keepdim=True)[0]).float()
+            self.out_fn = lambda x: (x == x.max(-1, keepdim=True)[0]).float()
 
     def forward(self, X):
         """
@@ -79,6 +79,197 @@ def save_model(model, path):
     torch.save(model.state_dict(), path)
 
 
+def get_batched_params(solutions, model):
+    """
+    Splits the parameter arrays of a population of candidates into the 
+    parameters of each layer of the model, stacked over candidates.
+    Inputs:
+        solutions (list): Parameter arrays of each candidate, in the order of
+            the model's state dict (as for load_array_in_model).
+        model (PolicyNetwork): Policy network giving the parameter shapes.
+    Outputs:
+        batched_params (dict): For each parameter of the model, tensor of 
+            this parameter for each candidate, dim=(n_cands, *param_shape).
+    """
+    param_array = torch.from_numpy(np.array(solutions)).float()
+    batched_params = {}
+    for key, value in model.state_dict().items():
+        size = np.prod(value.shape)
+        batched_params[key] = param_array[:, :size].reshape(
+            -1, *value.shape).contiguous()
+        param_array = param_array[:, size:]
+    return batched_params
+
+
+def batched_policy_forward(model, batched_params, X):
+    """
+    Forward pass of all candidates of a population at once, each layer 
+    applies the weights of each candidate to its batch of observations with
+    F.linear, so actions are exactly the same as with nn.Linear layers 
+    loaded with load_array_in_model.
+    Inputs:
+        model (PolicyNetwork): Policy network giving the architecture.
+        batched_params (dict): Parameters of each candidate, as returned by 
+            get_batched_params.
+        X (torch.Tensor): Batch of observations of each candidate, 
+            dim=(n_cands, batch_size, input_dim).
+    Outputs:
+        out (torch.Tensor): Actions of each candidate, dim=(n_cands, 
+            batch_size, out_dim).
+    """
+    def linear(name, x):
+        weights = batched_params[name + ".weight"]
+        biases = batched_params[name + ".bias"]
+        return torch.stack([
+            F.linear(x[c_i], weights[c_i], biases[c_i]) 
+            for c_i in range(x.shape[0])])
+    x = model.nonlin(linear("fc_in", X))
+    if not model.linear:
+        for fc in model.fc_hidden:
+            x = model.nonlin(fc(x))
+        x = linear("fc_out", x)
+    out = model.out_fn(x)
+    return out
+
+
+# Environments and policy of the evaluation process, created once by init_eval
+eval_context = {}
+
+def init_eval(config, sce_conf, n_envs):
+    """
+    Creates the environments, one per candidate evaluated at the same time, 
+    and the policy giving the architecture of the candidates in the current 
+    process. The global numpy random state is left unchanged.
+    """
+    torch.set_num_threads(1)
+    rng_state = np.random.get_state()
+    eval_context["envs"] = [
+        make_env(config.env_path, sce_conf, 
+                 discrete_action=config.discrete_action)
+        for _ in range(n_envs)]
+    np.random.set_state(rng_state)
+    env = eval_context["envs"][0]
+    num_in_pol = env.observation_space[0].shape[0]
+    if config.discrete_action:
+        num_out_pol = env.action_space[0].n
+    else:
+        num_out_pol = env.action_space[0].shape[0]
+    eval_context["policy"] = PolicyNetwork(
+        num_in_pol, num_out_pol, config.hidden_dim, linear=config.linear, 
+        discrete_action=config.discrete_action)
+    eval_context["policy"].eval()
+    eval_context["nb_agents"] = sce_conf['nb_agents']
+    eval_context["n_eps_per_eval"] = config.n_eps_per_eval
+    eval_context["episode_length"] = config.episode_length
+
+@torch.no_grad()
+def eval_candidates(solutions, seed):
+    """
+    Evaluates candidates on n_eps_per_eval episodes each, with one 
+    environment per candidate stepped in lockstep and one batched forward 
+    pass of all running candidates per step. Each candidate gets its own 
+    random stream seeded with seed, used when resetting its environment, so
+    its evaluation does not depend on the other candidates evaluated with it
+    (environments are expected to draw random numbers only when reset, as 
+    the scenarios of this repository do).
+    Inputs:
+        solutions (list): Parameter arrays of each candidate.
+        seed (int): Seed of the evaluation episodes.
+    Outputs:
+        returns (np.ndarray): Return of each episode, dim=(n_cands, 
+            n_eps_per_eval).
+        success (np.ndarray): Success of each episode, dim=(n_cands, 
+            n_eps_per_eval).
+        ep_length (np.ndarray): Length of each episode, dim=(n_cands, 
+            n_eps_per_eval).
+        rng_state (tuple): Numpy random state of the last candidate at the 
+            end of its evaluation.
+    """
+    n_cands = len(solutions)
+    envs = eval_context["envs"][:n_cands]
+    policy = eval_context["policy"]
+    nb_agents = eval_context["nb_agents"]
+    n_eps_per_eval = eval_context["n_eps_per_eval"]
+    episode_length = eval_context["episode_length"]
+    params = get_batched_params(solutions, policy)
+
+    # Random stream of each candidate, swapped in the global numpy random 
+    # state before resetting its environment
+    np.random.seed(seed)
+    rng_states = [np.random.get_state()] * n_cands
+
+    returns = np.zeros((n_cands, n_eps_per_eval))
+    success = np.zeros((n_cands, n_eps_per_eval))
+    ep_length = np.full(
+        (n_cands, n_eps_per_eval), episode_length, dtype=float)
+    for eval_i in range(n_eps_per_eval):
+        # Reset envs
+        obs = []
+        for c_i in range(n_cands):
+            np.random.set_state(rng_states[c_i])
+            obs.append(envs[c_i].reset())
+            rng_states[c_i] = np.random.get_state()
+        running = np.arange(n_cands)
+        running_params = params
+        for et_i in range(episode_length):
+            # Rearrange observations to fit in the model
+            torch_obs = torch.Tensor(
+                np.stack([np.vstack(obs[c_i]) for c_i in running]))
+
+            actions = batched_policy_forward(
+                policy, running_params, torch_obs).numpy()
+
+            # Environments step
+            still_running = []
+            for b_i, c_i in enumerate(running):
+                next_obs, rewards, dones, infos = envs[c_i].step(
+                    list(actions[b_i]))
+
+                returns[c_i, eval_i] += sum(rewards) / nb_agents
+
+                if dones[0]:
+                    success[c_i, eval_i] = 1
+                    ep_length[c_i, eval_i] = et_i + 1
+                else:
+                    obs[c_i] = next_obs
+                    still_running.append(c_i)
+            if len(still_running) == 0:
+                break
+            if len(still_running) < len(running):
+                running = np.array(still_running)
+                running_params = {
+                    key: value[running] for key, value in params.items()}
+    
+    return returns, success, ep_length, rng_states[-1]
+
+def evaluate_population(solutions, seed, pool=None, n_workers=1):
+    """
+    Evaluates all candidates of a population, split in n_workers chunks 
+    evaluated in the worker processes of pool (or in the current process if
+    pool is None). Returns the same values as evaluating each candidate 
+    alone with eval_candidates, and leaves the global numpy random state as
+    after the evaluation of the last candidate.
+    Inputs:
+        solutions (list): Parameter arrays of each candidate.
+        seed (int): Seed of the evaluation episodes.
+        pool (multiprocessing.Pool): Pool of processes initialised with 
+            init_eval, default None.
+        n_workers (int): Number of chunks of candidates, default 1.
+    Outputs:
+        returns, success, ep_length (np.ndarray): See eval_candidates.
+    """
+    chunks = [c for c in np.array_split(np.array(solutions), n_workers) 
+              if len(c) > 0]
+    if pool is None:
+        results = [eval_candidates(c, seed) for c in chunks]
+    else:
+        results = pool.starmap(eval_candidates, [(c, seed) for c in chunks])
+    returns, success, ep_length, rng_states = zip(*results)
+    np.random.set_state(rng_states[-1])
+    return np.concatenate(returns), np.concatenate(success), \
+        np.concatenate(ep_length)
+
+
 def run(config):
     # Get paths for saving logs and model
     run_dir, model_cp_path, log_dir = get_paths(config)
@@ -121,6 +312,16 @@ def run(config):
                                     {'seed': config.seed})
     print('Pop_size =', es.popsize)
 
+    # Initialise evaluation, in n_workers processes evaluating a chunk of 
+    # the population each
+    chunk_size = int(np.ceil(es.popsize / config.n_workers))
+    if config.n_workers > 1:
+        pool = Pool(config.n_workers, initializer=init_eval, 
+                    initargs=(config, sce_conf, chunk_size))
+    else:
+        pool = None
+        init_eval(config, sce_conf, chunk_size)
+
     # Get number of evaluation rounds we'll perform
     n_evals = int(config.n_episodes / (es.popsize * config.n_eps_per_eval)) + 1
     
@@ -144,54 +345,19 @@ def run(config):
         # Initialize seed for this round of evaluations
         seed = np.random.randint(1e9)
 
-        # Perform one evaluation for each solution
-        tell_rewards = []
+        # Evaluate all solutions
+        returns, success, ep_length = evaluate_population(
+            solutions, seed, pool, config.n_workers)
         eval_perfs = {
-            'returns': np.zeros((es.popsize, config.n_eps_per_eval)),
-            'success': np.zeros((es.popsize, config.n_eps_per_eval)),
-            'ep_length': np.zeros((es.popsize, config.n_eps_per_eval))
+            'returns': returns,
+            'success': success,
+            'ep_length': ep_length
         }
-        for sol_i in range(es.popsize):
-            # Load solution in model
-            load_array_in_model(solutions[sol_i], policy)
-            
-            # Seed eval
-            np.random.seed(seed)
-
-            # Perform n_eps_per_eval episodes and average the rewards
-            for eval_i in range(config.n_eps_per_eval):
-                # Reset env
-                obs = env.reset()
-                ep_return = 0.0
-                ep_success = 0
-                ep_length = config.episode_length
-                for et_i in range(config.episode_length):
-                    # Rearrange observations to fit in the model
-                    torch_obs = Variable(torch.Tensor(np.vstack(obs)),
-                                        requires_grad=False)
-                
-                    actions = policy(torch_obs)
-
-                    # Convert actions to numpy arrays
-                    agent_actions = [ac.data.numpy() for ac in actions]
-
-                    next_obs, rewards, dones, infos = env.step(agent_actions)
-                    
-                    ep_return += sum(rewards) / nb_agents
-                    
-                    if dones[0]:
-                        ep_success = 1
-                        ep_length = et_i + 1
-                        break
-                    
-                    obs = next_obs
-                eval_perfs['returns'][sol_i, eval_i] = ep_return
-                eval_perfs['success'][sol_i, eval_i] = ep_success
-                eval_perfs['ep_length'][sol_i, eval_i] = ep_length
-
-            # Store average rewards of current solution
-            tell_rewards.append(-sum(eval_perfs['returns'][sol_i]) /
-                config.n_eps_per_eval)
+
+        # Store average rewards of each solution
+        tell_rewards = [
+            -sum(sol_returns) / config.n_eps_per_eval 
+            for sol_returns in returns]
 
         # Update CMA-ES model
         es.tell(solutions, tell_rewards)
@@ -236,6 +402,9 @@ def run(config):
     load_array_in_model(solutions[best_sol_i], policy)
     save_model(policy, model_cp_path)   
     env.close()
+    if pool is not None:
+        pool.close()
+        pool.join()
     logger.export_scalars_to_json(str(log_dir / 'summary.json'))
     logger.close()
     # Log csv
@@ -263,6 +432,8 @@ if __name__ == '__main__':
     parser.add_argument("--hidden_dim", default=8, type=int)
     parser.add_argument("--linear", action='store_true')
     parser.add_argument("--n_eps_per_eval", default=1, type=int)
+    parser.add_argument("--n_workers", default=1, type=int,
+                        help="Number of processes evaluating the population")
 
     config = parser.parse_args()
 
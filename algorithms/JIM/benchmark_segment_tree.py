@@ -0,0 +1,99 @@
+import time
+import argparse
+import numpy as np
+
+from utils.prio_buffer import SumSegmentTree, MinSegmentTree
+
+
+def loop_set(tree, start, end, val, size):
+    """ Previous implementation: set items one by one, each walking the tree
+    up to the root. """
+    for idx in range(start, end):
+        tree[idx % size] = val
+
+def range_set(tree, start, end, val, size):
+    tree.set_range(start, end, val, size)
+
+def recursive_reduce(tree, start, end):
+    """ Previous implementation: recursive descent from the root. """
+    def helper(start, end, node, node_start, node_end):
+        if start == node_start and end == node_end:
+            return tree._value[node]
+        mid = (node_start + node_end) // 2
+        if end <= mid:
+            return helper(start, end, 2 * node, node_start, mid)
+        else:
+            if mid + 1 <= start:
+                return helper(start, end, 2 * node + 1, mid + 1, node_end)
+            else:
+                return tree._operation(
+                    helper(start, mid, 2 * node, node_start, mid),
+                    helper(mid + 1, end, 2 * node + 1, mid + 1, node_end))
+    return helper(start, end - 1, 1, 0, tree._capacity - 1)
+
+def iterative_reduce(tree, start, end):
+    return tree.reduce(start, end)
+
+def time_fn(fn, inputs_list):
+    start = time.perf_counter()
+    for inputs in inputs_list:
+        fn(*inputs)
+    return (time.perf_counter() - start) / len(inputs_list)
+
+
+def run(args):
+    capacity = 1
+    while capacity < args.buffer_size:
+        capacity *= 2
+    rng = np.random.default_rng(args.seed)
+
+    print(f"Segment trees of capacity {capacity} (buffer of size "
+          f"{args.buffer_size}), times in ms")
+    print(f"{'n_insert':>8} {'loop set':>10} {'range set':>10} {'speedup':>8}")
+    for n_insert in args.n_inserts:
+        # Insertions at random positions, some wrapping around the buffer
+        starts = rng.integers(0, args.buffer_size, size=args.n_repeats)
+        vals = rng.random(args.n_repeats) + 0.1
+        times = []
+        trees = []
+        for set_fn in (loop_set, range_set):
+            sums = SumSegmentTree(capacity)
+            mins = MinSegmentTree(capacity)
+            inputs_list = []
+            for s, v in zip(starts, vals):
+                inputs_list.append((sums, s, s + n_insert, v, args.buffer_size))
+                inputs_list.append((mins, s, s + n_insert, v, args.buffer_size))
+            times.append(time_fn(set_fn, inputs_list) * 2)
+            trees.append((sums, mins))
+        for old_tree, new_tree in zip(*trees):
+            assert np.allclose(old_tree._value, new_tree._value)
+        print(f"{n_insert:>8} {times[0] * 1000:>10.3f} "
+              f"{times[1] * 1000:>10.3f} {times[0] / times[1]:>7.1f}x")
+
+    sums = SumSegmentTree(capacity)
+    sums.set_range(0, args.buffer_size, rng.random(args.buffer_size) + 0.1)
+    inputs_list = []
+    for _ in range(args.n_repeats):
+        start, end = np.sort(rng.integers(0, capacity + 1, size=2))
+        if start == end:
+            end += 1
+        inputs_list.append((sums, int(start), int(end)))
+        assert np.isclose(recursive_reduce(sums, start, end),
+                          iterative_reduce(sums, start, end))
+    t_rec = time_fn(recursive_reduce, inputs_list)
+    t_it = time_fn(iterative_reduce, inputs_list)
+    print(f"{'reduce':>8} {t_rec * 1000:>10.3f} {t_it * 1000:>10.3f} "
+          f"{t_rec / t_it:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark of the segment trees of the prioritized "
+                    "replay buffers.")
+    parser.add_argument("--buffer_size", type=int, default=100000)
+    parser.add_argument("--n_inserts", type=int, nargs="+",
+                        default=[1, 8, 32, 128, 1024])
+    parser.add_argument("--n_repeats", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args)
@@ -1,5 +1,5 @@
-import math
 import torch
+import numpy as np
 from torch.nn import functional as F
 
 from .networks import MLPNetwork
@@ -154,7 +154,9 @@ class E2S_NovelD(IntrinsicReward):
         self.ablation = ablation
         # NovelD parameters
         self.scale_fac = scale_fac
-        self.last_nov = None
+        # Last state novelty in each parallel environment, NaN at the start
+        # of episodes
+        self.last_nov = np.full(1, np.nan)
         # Models
         self.rnd = None
         self.e3b = None
@@ -164,11 +166,14 @@ class E2S_NovelD(IntrinsicReward):
             self.e3b = E3B(
                 input_dim, act_dim, enc_dim, hidden_dim, ridge, lr, device)
     
-    def init_new_episode(self):
+    def init_new_episode(self, n_envs=1, env_ids=None):
         if self.rnd is not None:
-            self.last_nov = None
+            if env_ids is None:
+                self.last_nov = np.full(n_envs, np.nan)
+            else:
+                self.last_nov[env_ids] = np.nan
         if self.e3b is not None:
-            self.e3b.init_new_episode()
+            self.e3b.init_new_episode(n_envs, env_ids)
     
     def set_train(self, device):
         if self.rnd is not None:
@@ -182,36 +187,44 @@ class E2S_NovelD(IntrinsicReward):
         if self.e3b is not None:
             self.e3b.set_eval(device)
         
-    def get_reward(self, state):
+    def get_reward(self, state, env_ids=None):
         """
         Get intrinsic reward for the given state.
         Inputs:
-            state (torch.Tensor): State from which to generate the reward,
-                dim=(1, state_dim).
+            state (torch.Tensor): States from which to generate the rewards,
+                one for each parallel environment, dim=(n_envs, state_dim).
+            env_ids (list): Indexes of the environments of the states, all if
+                None.
         Outputs:
-            int_reward (float): Intrinsic reward for the input state.
+            int_reward (numpy.ndarray): Intrinsic rewards for the input 
+                states, dim=(n_envs,).
+            crits (dict): Values of the two criteria composing the rewards,
+                "LLEC" and "EEC", dim=(n_envs,).
         """
+        n_states = state.shape[0]
         ## NovelD
         if self.rnd is not None:
+            ids = slice(None) if env_ids is None else env_ids
             # Get RND reward as novelty
             nov = self.rnd.get_reward(state)
 
             # Compute reward
-            if self.last_nov is not None:
-                int_reward = max(nov - self.scale_fac * self.last_nov, 0.0)
-            else:
-                int_reward = 0.0
+            last_nov = self.last_nov[ids]
+            int_reward = np.where(
+                np.isnan(last_nov), 
+                0.0, 
+                np.maximum(nov - self.scale_fac * last_nov, 0.0))
 
-            self.last_nov = nov
+            self.last_nov[ids] = nov
         else:
-            int_reward = 1.0
+            int_reward = np.ones(n_states)
 
         ## E3B
         if self.e3b is not None:
-            elliptic_scale = self.e3b.get_reward(state)
-            elliptic_scale = math.sqrt(2 * elliptic_scale)
+            elliptic_scale = self.e3b.get_reward(state, env_ids)
+            elliptic_scale = np.sqrt(2 * elliptic_scale)
         else:
-            elliptic_scale = 1.0
+            elliptic_scale = np.ones(n_states)
 
         crits = {
             "LLEC": int_reward,
@@ -14,39 +14,48 @@ class E2S_RND(RND):
         super(E2S_RND, self).__init__(
             input_dim, enc_dim, hidden_dim, lr, device)
         self.ridge = ridge
-        # Inverse covariance matrix for Elliptical bonus
-        self.inv_cov = torch.eye(input_dim).to(device) * (1.0 / self.ridge)
-        self.outer_product_buffer = torch.empty(
-            input_dim, input_dim).to(device)
+        # Inverse covariance matrix for Elliptical bonus, in each parallel
+        # environment
+        self.inv_cov = torch.eye(input_dim).to(device).unsqueeze(0) \
+            * (1.0 / self.ridge)
     
-    def init_new_episode(self):
-        self.inv_cov = torch.eye(self.input_dim).to(self.device)
-        self.inv_cov *= (1.0 / self.ridge)
+    def init_new_episode(self, n_envs=1, env_ids=None):
+        init_inv_cov = torch.eye(self.input_dim).to(self.device) \
+            * (1.0 / self.ridge)
+        if env_ids is None:
+            self.inv_cov = init_inv_cov.repeat(n_envs, 1, 1)
+        else:
+            self.inv_cov[env_ids] = init_inv_cov
 
     def set_eval(self, device):
         super().set_eval(device)
         self.inv_cov = self.inv_cov.to(device)
-        self.outer_product_buffer = self.outer_product_buffer.to(device)
         
-    def get_reward(self, state):
+    @torch.no_grad()
+    def get_reward(self, state, env_ids=None):
         """
         Get intrinsic reward for the given state.
         Inputs:
-            state (torch.Tensor): State from which to generate the reward,
-                dim=(1, state_dim).
+            state (torch.Tensor): States from which to generate the rewards,
+                one for each parallel environment, dim=(n_envs, state_dim).
+            env_ids (list): Indexes of the environments of the states, all if
+                None.
         Outputs:
-            int_reward (float): Intrinsic reward for the input state.
+            int_reward (numpy.ndarray): Intrinsic rewards for the input 
+                states, dim=(n_envs,).
         """
         # Get RND reward
         int_reward = super().get_reward(state)
 
+        if env_ids is None:
+            env_ids = slice(None)
+        inv_cov = self.inv_cov[env_ids]
         # Compute the elliptic scale
-        u = torch.mv(self.inv_cov, state.squeeze())
-        elliptic_scale = torch.dot(state.squeeze(), u).item()
-        # Update covariance matrix
-        torch.outer(u, u, out=self.outer_product_buffer)
-        torch.add(
-            self.inv_cov, self.outer_product_buffer, 
-            alpha=-(1. / (1. + elliptic_scale)), out=self.inv_cov)
+        u = torch.bmm(inv_cov, state.unsqueeze(-1)).squeeze(-1)
+        elliptic_scale = (state * u).sum(-1)
+        # Update covariance matrices
+        inv_cov -= u.unsqueeze(-1) * u.unsqueeze(-2) \
+            / (1. + elliptic_scale).view(-1, 1, 1)
+        self.inv_cov[env_ids] = inv_cov
 
-        return int_reward * elliptic_scale
\ No newline at end of file
+        return int_reward * elliptic_scale.cpu().numpy()
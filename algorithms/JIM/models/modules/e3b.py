@@ -18,10 +18,10 @@ class E3B(IntrinsicReward):
         # Inverse dynamics model
         self.inv_dyn = MLPNetwork(
             2 * enc_dim, act_dim, hidden_dim, norm_in=False)
-        # Inverse covariance matrix
+        # Inverse covariance matrix of each parallel environment
         self.ridge = ridge
-        self.inv_cov = torch.eye(enc_dim).to(device) * (1.0 / self.ridge)
-        self.outer_product_buffer = torch.empty(enc_dim, enc_dim).to(device)
+        self.inv_cov = torch.eye(enc_dim).to(device).unsqueeze(0) \
+            * (1.0 / self.ridge)
         
         # Optimizers
         self.encoder_optim = torch.optim.Adam(
@@ -31,9 +31,13 @@ class E3B(IntrinsicReward):
             self.inv_dyn.parameters(), 
             lr=lr)
     
-    def init_new_episode(self):
-        self.inv_cov = torch.eye(self.enc_dim).to(self.device)
-        self.inv_cov *= (1.0 / self.ridge)
+    def init_new_episode(self, n_envs=1, env_ids=None):
+        init_inv_cov = torch.eye(self.enc_dim).to(self.device) \
+            * (1.0 / self.ridge)
+        if env_ids is None:
+            self.inv_cov = init_inv_cov.repeat(n_envs, 1, 1)
+        else:
+            self.inv_cov[env_ids] = init_inv_cov
 
     def set_train(self, device):
         self.encoder.train()
@@ -41,32 +45,39 @@ class E3B(IntrinsicReward):
         self.inv_dyn.train()
         self.inv_dyn = self.inv_dyn.to(device)
         self.inv_cov = self.inv_cov.to(device)
-        self.outer_product_buffer = self.outer_product_buffer.to(device)
         self.device = device
 
     def set_eval(self, device):
         self.encoder.eval()
         self.encoder = self.encoder.to(device)
         self.inv_cov = self.inv_cov.to(device)
-        self.outer_product_buffer = self.outer_product_buffer.to(device)
         self.device = device
         
-    def get_reward(self, state):
+    @torch.no_grad()
+    def get_reward(self, state, env_ids=None):
         """
         Inputs:
-            state (torch.Tensor): dim=(1, state_dim)
+            state (torch.Tensor): States, one for each parallel environment,
+                dim=(n_envs, state_dim).
+            env_ids (list): Indexes of the environments of the states, all if
+                None.
+        Outputs:
+            int_reward (numpy.ndarray): Elliptical bonus of each state, 
+                dim=(n_envs,).
         """
+        if env_ids is None:
+            env_ids = slice(None)
         # Encode state
-        enc_state = self.encoder(state).squeeze().detach()
+        enc_state = self.encoder(state)
+        inv_cov = self.inv_cov[env_ids]
         # Compute the intrinsic reward
-        u = torch.mv(self.inv_cov, enc_state)
-        int_reward = torch.dot(enc_state, u).item()
-        # Update covariance matrix
-        torch.outer(u, u, out=self.outer_product_buffer)
-        torch.add(
-            self.inv_cov, self.outer_product_buffer, 
-            alpha=-(1. / (1. + int_reward)), out=self.inv_cov)
-        return int_reward
+        u = torch.bmm(inv_cov, enc_state.unsqueeze(-1)).squeeze(-1)
+        int_reward = (enc_state * u).sum(-1)
+        # Update covariance matrices
+        inv_cov -= u.unsqueeze(-1) * u.unsqueeze(-2) \
+            / (1. + int_reward).view(-1, 1, 1)
+        self.inv_cov[env_ids] = inv_cov
+        return int_reward.cpu().numpy()
     
     def train(self, state_batch, act_batch):
         """
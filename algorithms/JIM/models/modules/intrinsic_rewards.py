@@ -1,12 +1,20 @@
+import numpy as np
+
 from abc import ABC, abstractmethod
 
 class IntrinsicReward(ABC):
     """ Abstract class for an Intrinsic Reward Model. """
     
     @abstractmethod
-    def init_new_episode(self):
+    def init_new_episode(self, n_envs=1, env_ids=None):
         """
-        Initialise model at start of new episode.
+        Initialise model at start of new episodes. Episodic data is kept for
+        each parallel environment.
+        Inputs:
+            n_envs (int): Number of parallel environments, used when all 
+                episodes are initialised.
+            env_ids (list): Indexes of the environments starting a new 
+                episode, all if None.
         """
         raise NotImplementedError
     
@@ -29,12 +37,14 @@ class IntrinsicReward(ABC):
         raise NotImplementedError
     
     @abstractmethod
-    def get_reward(self, state):
+    def get_reward(self, state, env_ids=None):
         """
-        Returns the reward computed from given state.
+        Returns the rewards computed from given states.
         Inputs:
-            state (torch.Tensor): State used for computing reward, 
-                dim=(1, state_dim).
+            state (torch.Tensor): States used for computing rewards, one for
+                each parallel environment, dim=(n_envs, state_dim).
+            env_ids (list): Indexes of the environments of the states, all if
+                None.
         """
         raise NotImplementedError
     
@@ -67,7 +77,7 @@ class NoIntrinsicReward(IntrinsicReward):
     def __init__(self, *args, **kwargs):
         pass
     
-    def init_new_episode(self):
+    def init_new_episode(self, n_envs=1, env_ids=None):
         pass
 
     def set_train(self, device):
@@ -76,8 +86,8 @@ class NoIntrinsicReward(IntrinsicReward):
     def set_eval(self, device):
         pass
         
-    def get_reward(self, state):
-        return 0.0
+    def get_reward(self, state, env_ids=None):
+        return np.zeros(state.shape[0])
     
     def train(self, *args):
         return 0.0
@@ -1,4 +1,5 @@
 import torch
+import numpy as np
 
 from torch import nn
 from torch.optim import Adam
@@ -26,46 +27,58 @@ class NovelD(RND):
         super(NovelD, self).__init__(
             input_dim, enc_dim, hidden_dim, lr, device)
         self.scale_fac = scale_fac
-        # Last state novelty
-        self.last_nov = None
+        # Last state novelty in each parallel environment, NaN at the start 
+        # of episodes
+        self.last_nov = np.full(1, np.nan)
         # Save count of states encountered during each episode
-        self.episode_states_count = {}
+        self.episode_states_count = [{}]
 
-    def init_new_episode(self):
-        self.last_nov = None
-        self.episode_states_count = {}
+    def init_new_episode(self, n_envs=1, env_ids=None):
+        if env_ids is None:
+            self.last_nov = np.full(n_envs, np.nan)
+            self.episode_states_count = [{} for _ in range(n_envs)]
+        else:
+            self.last_nov[env_ids] = np.nan
+            for e_i in env_ids:
+                self.episode_states_count[e_i] = {}
 
     def is_empty(self):
-        return True if len(self.episode_states_count) == 0 else False
+        return all(len(c) == 0 for c in self.episode_states_count)
 
-    def get_reward(self, state):
+    def get_reward(self, state, env_ids=None):
         """
         Get intrinsic reward for this new state.
         Inputs:
-            state (torch.Tensor): State from which to generate 
-                the reward, dim=(1, state_dim).
+            state (torch.Tensor): States from which to generate the rewards,
+                one for each parallel environment, dim=(n_envs, state_dim).
+            env_ids (list): Indexes of the environments of the states, all if
+                None.
         Outputs:
-            intrinsic_reward (float): Intrinsic reward for the input state.
+            intrinsic_reward (numpy.ndarray): Intrinsic rewards for the input
+                states, dim=(n_envs,).
         """
-        state_key = tuple(state[0])
-        if state_key in self.episode_states_count:
-            self.episode_states_count[state_key] += 1
-        else:
-            self.episode_states_count[state_key] = 1
-
-        # Return 0 if state has already been seen during the current episode
-        if self.episode_states_count[state_key] > 1:
-            return 0.0
+        if env_ids is None:
+            env_ids = np.arange(len(self.episode_states_count))
+        # Count states, novel states are the ones seen for the first time
+        # during the current episode
+        first_visit = np.zeros(len(env_ids), dtype=bool)
+        for s_i, (e_i, state_key) in enumerate(
+                zip(env_ids, map(tuple, state.tolist()))):
+            count = self.episode_states_count[e_i].get(state_key, 0) + 1
+            self.episode_states_count[e_i][state_key] = count
+            first_visit[s_i] = count == 1
 
         # Get RND reward as novelty
         nov = super().get_reward(state)
 
-        # Compute reward
-        if self.last_nov is not None:
-            intrinsic_reward = max(nov - self.scale_fac * self.last_nov, 0.0)
-        else:
-            intrinsic_reward = 0.0
+        # Compute reward, 0 if state has already been seen during the 
+        # current episode
+        last_nov = self.last_nov[env_ids]
+        intrinsic_reward = np.where(
+            first_visit & ~np.isnan(last_nov),
+            np.maximum(nov - self.scale_fac * last_nov, 0.0),
+            0.0)
 
-        self.last_nov = nov
+        self.last_nov[env_ids] = np.where(first_visit, nov, last_nov)
 
-        return intrinsic_reward
\ No newline at end of file
+        return intrinsic_reward
@@ -313,31 +313,39 @@ class QMIX:
         """
         Returns each agent's action given their observation.
         Inputs:
-            obs_list (list(numpy.ndarray)): List of agent observations.
+            obs_list (list(numpy.ndarray)): List of agent observations, 
+                dim=([n_envs], obs_dim) each, with n_envs parallel 
+                environments.
             explore (bool): Whether to explore or not.
-            last_actions (list(torch.Tensor)): List of last actions.
+            last_actions (list(torch.Tensor)): List of last actions,
+                dim=(n_envs, act_dim) each.
             qnets_hidden_states (torch.Tensor)): List of agents' Q-network 
-                hidden states.
+                hidden states, dim=(1, n_envs, hidden_dim) each.
         Outputs:
-            actions (list(torch.Tensor)): Each agent's chosen action.
+            actions (list(torch.Tensor)): Each agent's chosen action,
+                dim=(n_envs, act_dim) each.
             new_qnets_hidden_states (list(torch.Tensor)): New hidden states.
         """
+        obs = torch.Tensor(np.array(obs_list)).to(self.device)
+        if obs.dim() == 2:
+            obs = obs.unsqueeze(1)
+        n_envs = obs.shape[1]
         if self.shared_params:
-            obs = torch.Tensor(np.array(obs_list)).to(self.device)
-            last_actions = torch.cat(last_actions)
-            qnets_hidden_states = torch.cat(qnets_hidden_states)
+            # Agents and environments in one batch
             actions_batch, _, new_qnets_hidden_states = self.agents[0].get_actions(
-                obs, last_actions, qnets_hidden_states, explore)
-            actions = [actions_batch[a_i] for a_i in range(self.nb_agents)]
-            self.last_actions = actions_batch
-            self.qnets_hidden_states = new_qnets_hidden_states
+                obs.reshape(self.nb_agents * n_envs, -1), 
+                torch.cat(last_actions), 
+                torch.cat(qnets_hidden_states, dim=1), 
+                explore)
+            actions = list(actions_batch.split(n_envs))
+            new_qnets_hidden_states = list(
+                new_qnets_hidden_states.split(n_envs, dim=1))
         else:
             actions = []
             new_qnets_hidden_states = []
             for a_i in range(self.nb_agents):
-                obs = torch.Tensor(obs_list[a_i]).unsqueeze(0).to(self.device)
                 action, _, new_qnet_hidden_state = self.agents[a_i].get_actions(
-                    obs, 
+                    obs[a_i], 
                     last_actions[a_i], 
                     qnets_hidden_states[a_i],
                     explore
@@ -432,16 +440,18 @@ class QMIX:
 
         return loss.item(), new_priorities
 
-    def get_init_model_inputs(self):
+    def get_init_model_inputs(self, n_envs=1):
         """ 
         Returns zero-filled tensord for last actions and Q-network hidden 
         states.
+        Inputs:
+            n_envs (int): Number of parallel environments.
         """
         last_actions = [
-            torch.zeros(1, self.act_dim, device=self.device)
+            torch.zeros(n_envs, self.act_dim, device=self.device)
         ] * self.nb_agents
         qnets_hidden_states = [
-            self.agents[0].get_init_hidden(1, self.device)
+            self.agents[0].get_init_hidden(n_envs, self.device)
         ] * self.nb_agents
         return last_actions, qnets_hidden_states
 
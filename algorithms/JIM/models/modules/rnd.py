@@ -28,7 +28,7 @@ class RND(IntrinsicReward):
         # Optimizers
         self.optim = torch.optim.Adam(self.predictor.parameters(), lr=lr)
     
-    def init_new_episode(self):
+    def init_new_episode(self, n_envs=1, env_ids=None):
         pass
 
     def set_train(self, device):
@@ -45,24 +45,27 @@ class RND(IntrinsicReward):
         self.predictor = self.predictor.to(device)
         self.device = device
         
-    def get_reward(self, state):
+    @torch.no_grad()
+    def get_reward(self, state, env_ids=None):
         """
         Get intrinsic reward for the given state.
         Inputs:
-            state (torch.Tensor): State from which to generate the reward,
-                dim=(1, state_dim).
+            state (torch.Tensor): States from which to generate the rewards,
+                one for each parallel environment, dim=(n_envs, state_dim).
+            env_ids (list): Indexes of the environments of the states, all if
+                None.
         Outputs:
-            int_reward (float): Intrinsic reward for the input state.
+            int_reward (numpy.ndarray): Intrinsic rewards for the input 
+                states, dim=(n_envs,).
         """
         # Compute embeddings
         target = self.target(state)
         pred = self.predictor(state)
 
         # Compute novelty
-        int_reward = torch.norm(
-            pred.detach() - target.detach(), dim=1, p=2).item()
+        int_reward = torch.norm(pred - target, dim=1, p=2)
         
-        return int_reward
+        return int_reward.cpu().numpy()
     
     def train(self, state_batch, act_batch):
         """
@@ -46,28 +46,51 @@ class QMIX_IR(QMIX):
                     obs_dim, **intrinsic_reward_params)
                 for a_i in range(self.nb_agents)]
 
-    def get_intrinsic_rewards(self, next_obs_list):
+    def _get_ir_rewards(self, int_rew, state, env_ids):
+        """
+        Get rewards of an intrinsic reward model, with the criteria 
+        composing them for models that return some.
+        """
+        out = int_rew.get_reward(state, env_ids)
+        if type(out) is tuple:
+            return out
+        else:
+            return out, {}
+
+    def get_intrinsic_rewards(self, next_obs, env_ids=None):
         """
         Get intrinsic reward of the multi-agent system.
         Inputs:
-            next_obs_list (list): List of agents' observations at next 
-                step.
+            next_obs (numpy.ndarray): Agents' observations at next step in 
+                each parallel environment, dim=(n_envs, nb_agents, obs_dim).
+            env_ids (list): Indexes of the environments of the 
+                observations, all if None.
         Outputs:
-            int_rewards (list): List of agents' intrinsic rewards.
+            int_rewards (numpy.ndarray): Agents' intrinsic rewards, 
+                dim=(n_envs, nb_agents).
+            criteria (dict): Criteria composing the intrinsic rewards, 
+                dim=(n_envs, nb_agents) each, empty if the model has none.
         """
+        next_obs = torch.Tensor(np.asarray(next_obs)).to(self.device)
         if self.ir_mode == "central":
             # Concatenate observations
-            cat_obs = torch.Tensor(
-                np.concatenate(next_obs_list)).unsqueeze(0).to(self.device)
+            cat_obs = next_obs.reshape(next_obs.shape[0], -1)
             # Get reward
-            int_reward, criteria = self.int_rew.get_reward(cat_obs)
-            int_rewards = [int_reward] * self.nb_agents
+            int_reward, criteria = self._get_ir_rewards(
+                self.int_rew, cat_obs, env_ids)
+            int_rewards = np.repeat(int_reward[:, None], self.nb_agents, 1)
+            criteria = {
+                k: np.repeat(c[:, None], self.nb_agents, 1) 
+                for k, c in criteria.items()}
         elif self.ir_mode == "local":
-            int_rewards = []
-            for a_i in range(self.nb_agents):
-                obs = torch.Tensor(
-                    next_obs_list[a_i]).unsqueeze(0).to(self.device)
-                int_rewards.append(self.int_rew[a_i].get_reward(obs))
+            outs = [
+                self._get_ir_rewards(
+                    self.int_rew[a_i], next_obs[:, a_i], env_ids)
+                for a_i in range(self.nb_agents)]
+            int_rewards = np.stack([out[0] for out in outs], axis=1)
+            criteria = {
+                k: np.stack([out[1][k] for out in outs], axis=1)
+                for k in outs[0][1]}
         return int_rewards, criteria
     
     def train(self, batch):
@@ -99,21 +122,27 @@ class QMIX_IR(QMIX):
 
         return qtot_loss, int_rew_loss, new_priorities
 
-    def reset_int_reward(self, obs_list):
+    def reset_int_reward(self, obs, env_ids=None):
+        """
+        Start new episodes in the intrinsic reward models.
+        Inputs:
+            obs (numpy.ndarray): Agents' first observations of the episodes,
+                dim=(n_envs, nb_agents, obs_dim).
+            env_ids (list): Indexes of the environments starting a new 
+                episode, all if None.
+        """
+        obs = torch.Tensor(np.asarray(obs)).to(self.device)
         if self.ir_mode == "central":
             # Reset intrinsic reward model
-            self.int_rew.init_new_episode()
+            self.int_rew.init_new_episode(obs.shape[0], env_ids)
             # Initialise intrinsic reward model with first observation
-            cat_obs = torch.Tensor(
-                np.concatenate(obs_list)).unsqueeze(0).to(self.device)
-            self.int_rew.get_reward(cat_obs.view(1, -1))
+            self.int_rew.get_reward(obs.reshape(obs.shape[0], -1), env_ids)
         elif self.ir_mode == "local":
             for a_i in range(self.nb_agents):
                 # Reset intrinsic reward model
-                self.int_rew[a_i].init_new_episode()
+                self.int_rew[a_i].init_new_episode(obs.shape[0], env_ids)
                 # Initialise intrinsic reward model with first observation
-                obs = torch.Tensor(obs_list[a_i]).unsqueeze(0).to(self.device)
-                self.int_rew[a_i].get_reward(obs)
+                self.int_rew[a_i].get_reward(obs[:, a_i], env_ids)
     
     def prep_training(self, device='cpu'):
         super().prep_training(device)
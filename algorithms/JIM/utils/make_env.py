@@ -1,4 +1,7 @@
 import imp
+import numpy as np
+
+from .env_wrappers import SubprocVecEnv, DummyVecEnv
 
 def make_env(cfg, sce_conf={}, discrete_action=False):
     '''
@@ -17,7 +20,16 @@ def make_env(cfg, sce_conf={}, discrete_action=False):
         .action_space       :   Returns the action space for each agent
         .n                  :   Returns the number of Agents
     '''
-    if cfg.env_path.endswith("magym_PredPrey.py"):
+    if "rel_overgen.py" in cfg.env_path:
+        env = imp.load_source('', cfg.env_path).RelOvergenEnv(
+            cfg.state_dim,
+            cfg.ro_n_agents,
+            cfg.optimal_reward,
+            cfg.optimal_diffusion_coeff,
+            cfg.suboptimal_reward,
+            cfg.suboptimal_diffusion_coeff,
+            cfg.save_visited_states)
+    elif cfg.env_path.endswith("magym_PredPrey.py"):
         env = imp.load_source('', cfg.env_path).PredatorPrey(
             n_agents=cfg.magym_n_agents, 
             grid_shape=(cfg.magym_env_size, cfg.magym_env_size), 
@@ -38,6 +50,36 @@ def make_env(cfg, sce_conf={}, discrete_action=False):
             discrete_action=discrete_action)
     return env
 
+def make_parallel_env(cfg, sce_conf={}, discrete_action=False, env=None):
+    """
+    Creates cfg.n_parallel_envs environments stepped together, in 
+    subprocesses if there are more than one.
+    Inputs:
+        cfg (argparse.Namespace): Config, see make_env.
+        sce_conf (dict): Scenario config.
+        discrete_action (bool): Whether the environments use discrete actions.
+        env (object): Already created environment, used as is when only one
+            environment is needed.
+    Outputs:
+        envs (SubprocVecEnv or DummyVecEnv): Vectorized environments.
+    """
+    def get_env_fn(rank):
+        def init_env():
+            # Different random streams in each subprocess
+            np.random.seed(cfg.seed + rank * 1000)
+            env = make_env(cfg, sce_conf, discrete_action=discrete_action)
+            if hasattr(env, "seed"):
+                env.seed(cfg.seed + rank * 1000)
+            return env
+        return init_env
+    if cfg.n_parallel_envs == 1:
+        if env is not None:
+            return DummyVecEnv([lambda: env])
+        return DummyVecEnv([get_env_fn(0)])
+    else:
+        return SubprocVecEnv(
+            [get_env_fn(i) for i in range(cfg.n_parallel_envs)])
+
 def make_env_parser(scenario_path, sce_conf={}, discrete_action=False):
     from multiagent.environment import MultiAgentEnv
 
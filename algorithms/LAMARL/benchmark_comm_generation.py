@@ -0,0 +1,179 @@
+import time
+import argparse
+import numpy as np
+import torch
+
+from src.utils.config import get_config
+from src.utils.utils import set_seeds, set_cuda_device
+from src.lmc.modules.lang_learner import LanguageLearner
+from src.lmc.modules.comm_policy_decoderPPO import CommPPO_MLP
+from src.lmc.utils import torch2numpy
+
+
+VOCAB = ["Located", "Prey", "Gem", "Agent", "North", "South", "East",
+         "West", "Center", "Yellow", "Green", "Purple", "Observed"]
+
+
+def prev_gen_messages(text_ac, context_batch):
+    """
+    Previous implementation: tokens, masks and sentences built on the host
+    at each step.
+    """
+    word_encoder = text_ac.word_encoder
+    batch_size = context_batch.shape[1]
+    hidden = context_batch
+    last_tokens = torch.tensor(
+        np.array([[word_encoder.SOS_ENC]])).float().repeat(
+            1, batch_size, 1).to(text_ac.device)
+    batch_tokens = []
+    batch_log_probs = []
+    batch_token_log_probs = []
+    batch_value_preds = []
+    batch_masks = [np.ones(batch_size)]
+    last_topi = torch.zeros(batch_size)
+    sentences = [[] for b_i in range(batch_size)]
+    for t_i in range(text_ac.max_sent_len):
+        _, hidden = text_ac.gru(last_tokens, hidden)
+        log_probs = text_ac.actor(hidden)
+        value_preds = text_ac.critic(hidden)
+        _, topi = log_probs.topk(1)
+        topi = topi.squeeze()
+        tokens = word_encoder.token_encodings[topi.cpu()]
+        token_log_probs = log_probs.gather(-1, topi.reshape(1, -1, 1))
+        masks = (
+            np.where(last_topi.cpu() == word_encoder.EOS_ID, 0.0, 1.0) * \
+            np.where(batch_masks[-1] == 0.0, 0.0, 1.0))
+        last_topi = topi
+        if sum(masks) == 0:
+            break
+        for b_i in range(batch_size):
+            if masks[b_i] and topi[b_i] != word_encoder.EOS_ID:
+                sentences[b_i].append(word_encoder.index2token(topi[b_i]))
+        batch_tokens.append(tokens)
+        batch_log_probs.append(torch2numpy(log_probs))
+        batch_token_log_probs.append(torch2numpy(token_log_probs))
+        batch_value_preds.append(torch2numpy(value_preds))
+        batch_masks.append(masks)
+        last_tokens = torch.Tensor(tokens).unsqueeze(0).to(text_ac.device)
+    _, hidden = text_ac.gru(last_tokens, hidden)
+    value_preds = text_ac.critic(hidden)
+    batch_value_preds.append(torch2numpy(value_preds))
+    tokens = np.stack(batch_tokens, dtype=np.float32)
+    log_probs = np.concatenate(batch_log_probs)
+    token_log_probs = np.concatenate(batch_token_log_probs)
+    value_preds = np.concatenate(batch_value_preds)
+    masks = np.stack(batch_masks)
+    return tokens, token_log_probs, value_preds, masks, sentences, log_probs
+
+@torch.no_grad()
+def prev_get_messages(comm, obs, lang_contexts):
+    """ Previous implementation of CommPPO_MLP.get_messages. """
+    obs = torch.Tensor(obs).view(comm.n_envs * comm.n_agents, -1)
+    obs_context = comm.lang_learner.encode_observations(obs)
+    lang_contexts = torch.from_numpy(lang_contexts.repeat(
+        comm.n_agents, 0).reshape(comm.n_envs * comm.n_agents, -1)).to(
+            comm.device)
+    input_context = torch.cat((obs_context, lang_contexts), dim=-1)
+    comm_context = obs_context.unsqueeze(0)
+    tokens, token_log_probs, value_preds, masks, messages, log_probs = \
+        prev_gen_messages(comm.comm_policy, comm_context)
+    ref_log_probs = comm._get_pretrain_probs(comm_context, tokens)
+    kl = (np.exp(log_probs) * (log_probs - torch2numpy(ref_log_probs))).sum(-1)
+    comm.buffer.store_gen(
+        torch2numpy(input_context), tokens, token_log_probs, value_preds,
+        masks)
+    return messages, -kl
+
+def time_fn(fn, comm, inputs, device):
+    fn(comm, *inputs[0])
+    if device != "cpu":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for obs, lang_contexts in inputs:
+        fn(comm, obs, lang_contexts)
+    if device != "cpu":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / len(inputs) * 1000
+
+
+def run(args):
+    cfg = get_config().parse_args([])
+    cfg.cuda_device = args.cuda_device
+    cfg.comm_max_sent_len = args.max_sent_len
+    cfg.comm_n_epochs = 1
+    cfg.comm_n_mini_batch = cfg.comm_num_mini_batch
+    device = set_cuda_device(cfg) if args.cuda_device is not None else "cpu"
+
+    print(f"CommPPO_MLP.get_messages, sentences of up to {args.max_sent_len} "
+          f"tokens, on {device}, in ms per rollout step")
+    print(f"{'envs x agents':>14} {'previous':>9} {'two_pass':>9} "
+          f"{'fused':>9} {'speedup':>8} {'mean_len':>9} {'same':>5} "
+          f"{'max_kl_diff':>12}")
+    for n_envs, n_agents in args.sizes:
+        cfg.n_parallel_envs = n_envs
+        set_seeds(args.seed)
+        lang_learner = LanguageLearner(
+            args.obs_dim, cfg.context_dim, cfg.lang_hidden_dim, VOCAB,
+            device)
+        # Shift EOS log-probabilities to get sentences of various lengths
+        with torch.no_grad():
+            lang_learner.decoder.out[0].bias[1] += args.eos_bias
+        comm = CommPPO_MLP(cfg, n_agents, lang_learner, device)
+        lang_learner.prep_rollout(device)
+        comm.prep_rollout(device)
+
+        rng = np.random.default_rng(args.seed)
+        inputs = [
+            (rng.standard_normal(
+                (n_envs, n_agents, args.obs_dim), dtype=np.float32),
+             rng.standard_normal(
+                (n_envs, cfg.context_dim), dtype=np.float32))
+            for _ in range(args.n_steps)]
+
+        # Same messages and stored generations, KL rewards of the fused 
+        # generation compared to the two-pass KL
+        prev_messages, prev_kl = prev_get_messages(comm, *inputs[0])
+        prev_masks = comm.buffer.masks
+        comm.klpretrain_mode = "two_pass"
+        messages, lengths, kl = comm.get_messages(*inputs[0])
+        same = lang_learner.word_encoder.decode_id_batch(
+            messages, lengths) == prev_messages \
+            and np.allclose(kl, prev_kl) \
+            and np.array_equal(comm.buffer.masks, prev_masks)
+        comm.klpretrain_mode = "fused"
+        fused_messages, fused_lengths, fused_kl = comm.get_messages(
+            *inputs[0])
+        same = same and np.array_equal(fused_messages, messages) \
+            and np.array_equal(fused_lengths, lengths)
+        max_kl_diff = np.abs(fused_kl - prev_kl).max()
+        mean_len = lengths.mean()
+
+        prev_time = time_fn(prev_get_messages, comm, inputs, device)
+        comm.klpretrain_mode = "two_pass"
+        two_pass_time = time_fn(CommPPO_MLP.get_messages, comm, inputs, device)
+        comm.klpretrain_mode = "fused"
+        fused_time = time_fn(CommPPO_MLP.get_messages, comm, inputs, device)
+        print(f"{f'{n_envs} x {n_agents}':>14} {prev_time:>9.2f} "
+              f"{two_pass_time:>9.2f} {fused_time:>9.2f} "
+              f"{prev_time / fused_time:>7.1f}x {mean_len:>9.2f} "
+              f"{str(same):>5} {max_kl_diff:>12.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of message generation in CommPPO_MLP.")
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--sizes", type=int, nargs=2, action="append",
+                        metavar=("N_ENVS", "N_AGENTS"),
+                        help="Numbers of parallel environments and agents, "
+                             "can be given several times")
+    parser.add_argument("--obs_dim", default=20, type=int)
+    parser.add_argument("--max_sent_len", default=12, type=int)
+    parser.add_argument("--eos_bias", default=0.4, type=float)
+    parser.add_argument("--n_steps", default=50, type=int)
+    parser.add_argument("--cuda_device", default=None, type=str)
+    args = parser.parse_args()
+    if args.sizes is None:
+        args.sizes = [(8, 4), (32, 4), (64, 8), (256, 8)]
+
+    run(args)
@@ -0,0 +1,152 @@
+import time
+import copy
+import argparse
+import numpy as np
+import torch
+
+from torch import nn
+from torch.nn import functional as F
+
+from src.utils.config import get_config
+from src.utils.utils import set_seeds, set_cuda_device
+from src.lmc.modules.shared_mem import SharedMemory
+
+
+def prev_train(shared_mem):
+    """
+    Previous implementation: packed sequences unpacked and re-padded, loss
+    counting the padded steps of the shorter episodes.
+    """
+    message_encodings, states, ep_lens = shared_mem.buffer.sample()
+
+    sorted_ids = np.argsort(ep_lens)[::-1]
+    sorted_mess_enc = [
+        torch.Tensor(message_encodings[s_i, :ep_lens[s_i]])
+        for s_i in sorted_ids]
+    padded = nn.utils.rnn.pad_sequence(sorted_mess_enc)
+    packed = nn.utils.rnn.pack_padded_sequence(
+        padded, ep_lens[sorted_ids]).to(shared_mem.device)
+    hidden = torch.zeros(
+        (shared_mem.n_rec_layers,
+         len(sorted_mess_enc),
+         shared_mem.hidden_dim)).to(shared_mem.device)
+
+    x, _ = shared_mem.gru(packed, hidden)
+    x = nn.utils.rnn.unpack_sequence(x)
+    x = nn.utils.rnn.pad_sequence(x)
+    pred_states = shared_mem.out(shared_mem.norm(x))
+
+    sorted_states = torch.Tensor(
+        states[sorted_ids]).transpose(0, 1).to(shared_mem.device)
+    if pred_states.shape[0] < sorted_states.shape[0]:
+        sorted_states = sorted_states[:pred_states.shape[0]]
+    error = F.mse_loss(pred_states, sorted_states, reduction="sum")
+    loss = error / ep_lens.sum()
+
+    shared_mem.optim.zero_grad()
+    loss.backward()
+    shared_mem.optim.step()
+    return loss.item()
+
+def fill_buffer(shared_mem, cfg, state_dim, min_ep_len, rng):
+    """ Fills the buffer with random episodes of random lengths. """
+    buffer = shared_mem.buffer
+    ep_lens = rng.integers(min_ep_len, cfg.episode_length + 1,
+                           size=cfg.n_parallel_envs)
+    steps = np.zeros(cfg.n_parallel_envs, dtype=int)
+    while buffer.n_finished < buffer.max_size - cfg.n_parallel_envs:
+        buffer.store(
+            rng.standard_normal((cfg.n_parallel_envs, cfg.context_dim)),
+            rng.standard_normal((cfg.n_parallel_envs, state_dim)))
+        steps += 1
+        dones = steps == ep_lens
+        buffer.end_episode(dones)
+        steps[dones] = 0
+        ep_lens[dones] = rng.integers(
+            min_ep_len, cfg.episode_length + 1, size=dones.sum())
+
+
+def run(args):
+    cfg = get_config().parse_args([])
+    cfg.episode_length = args.episode_length
+    cfg.context_dim = args.context_dim
+    cfg.n_parallel_envs = 8
+    cfg.shared_mem_max_buffer_size = args.buffer_size
+    cfg.cuda_device = args.cuda_device
+    device = set_cuda_device(cfg) if args.cuda_device is not None else "cpu"
+
+    modes = [("packed", 1), ("masked", 1), ("masked", args.n_buckets)]
+    print(f"SharedMemory training, episodes of {args.min_ep_len} to "
+          f"{args.episode_length} steps, on {device}, in updates/s")
+    print(f"{'batch':>6} {'previous':>9} {'packed':>9} {'masked':>9} "
+          f"{f'{args.n_buckets} buckets':>10} {'max_loss_diff':>14}")
+    for batch_size in args.batch_sizes:
+        cfg.shared_mem_batch_size = batch_size
+        set_seeds(args.seed)
+        shared_mem = SharedMemory(cfg, 4, args.state_dim, device)
+        shared_mem.prep_training()
+        fill_buffer(shared_mem, cfg, args.state_dim, args.min_ep_len,
+                    np.random.default_rng(args.seed))
+        init_state = copy.deepcopy(
+            (shared_mem.gru.state_dict(), shared_mem.out.state_dict(),
+             shared_mem.norm.state_dict(), shared_mem.optim.state_dict()))
+
+        def reset_params():
+            shared_mem.gru.load_state_dict(init_state[0])
+            shared_mem.out.load_state_dict(init_state[1])
+            shared_mem.norm.load_state_dict(init_state[2])
+            shared_mem.optim.load_state_dict(init_state[3])
+
+        # Loss parity on the same batches with the same parameters
+        max_diff = 0.0
+        with torch.no_grad():
+            for _ in range(args.n_parity_batches):
+                batch = shared_mem.buffer.sample()
+                ref = shared_mem._get_packed_error(*batch).item()
+                for mode, n_buckets in modes[1:]:
+                    shared_mem.n_buckets = n_buckets
+                    error = shared_mem._get_masked_error(*batch).item()
+                    max_diff = max(max_diff, abs(error - ref) / abs(ref))
+
+        # Training speed
+        speeds = []
+        train_fns = [prev_train] + [SharedMemory.train] * len(modes)
+        for train_fn, (mode, n_buckets) in zip(
+                train_fns, [(None, None)] + modes):
+            reset_params()
+            shared_mem.train_mode = mode
+            shared_mem.n_buckets = n_buckets
+            np.random.seed(args.seed)
+            train_fn(shared_mem)
+            if device != "cpu":
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            for _ in range(args.n_updates):
+                train_fn(shared_mem)
+            if device != "cpu":
+                torch.cuda.synchronize()
+            speeds.append(args.n_updates / (time.perf_counter() - start))
+
+        print(f"{batch_size:>6} "
+              + " ".join(f"{s:>9.1f}" for s in speeds[:3])
+              + f" {speeds[3]:>10.1f} {max_diff:>14.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the training modes of the shared memory.")
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--batch_sizes", type=int, nargs="+",
+                        default=[8, 16, 64, 256])
+    parser.add_argument("--episode_length", default=100, type=int)
+    parser.add_argument("--min_ep_len", default=10, type=int)
+    parser.add_argument("--context_dim", default=16, type=int)
+    parser.add_argument("--state_dim", default=50, type=int)
+    parser.add_argument("--buffer_size", default=1000, type=int)
+    parser.add_argument("--n_buckets", default=4, type=int)
+    parser.add_argument("--n_updates", default=50, type=int)
+    parser.add_argument("--n_parity_batches", default=10, type=int)
+    parser.add_argument("--cuda_device", default=None, type=str)
+    args = parser.parse_args()
+
+    run(args)
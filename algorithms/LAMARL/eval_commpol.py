@@ -63,7 +63,10 @@ def run():
             envs.render("human")
         
         print(f"\nStep #{ep_s_i}")
-        print("Messages", agent_messages)
+        message_ids, message_lens = agent_messages
+        print("Messages", model.lang_learner.word_encoder.decode_id_batch(
+            message_ids.reshape(message_lens.size, -1), 
+            message_lens.reshape(-1)))
         print("Perfect Messages", parsed_obs)
         if cfg.render_wait_input:
             input()
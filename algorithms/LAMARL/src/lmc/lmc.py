@@ -134,8 +134,10 @@ class LMC:
             dim=(n_parallel_envs, n_agents, 1, hidden_dim).
         :return rnn_states_critic (np.ndarray): Rnn states of the policy 
             critics, dim=(n_parallel_envs, n_agents, 1, hidden_dim).
-        :return broadcasts (list(list(str))): List of broadcasted messages for
-            each parallel environment.
+        :return broadcasts (tuple(np.ndarray)): Broadcasted messages for each
+            parallel environment made of token ids and ending with EOS, 
+            dim=(n_parallel_envs, max_broadcast_len), and their lengths, 
+            dim=(n_parallel_envs,).
         :return lang_contexts (np.ndarray): Language contexts after this step, 
             dim=(n_parallel_envs, context_dim).
         """
@@ -148,12 +150,21 @@ class LMC:
             lang_contexts = np.zeros((self.n_parallel_envs, 0))
             broadcasts = []
 
-        # Log communication
+        # Log communication, messages are only decoded for the logs
         if self.comm_logger is not None:
+            word_encoder = self.lang_learner.word_encoder
+            message_ids, message_lens = messages
+            log_messages = word_encoder.decode_id_batch(
+                message_ids.reshape(message_lens.size, -1), 
+                message_lens.reshape(-1))
+            log_messages = [
+                log_messages[e_i * self.n_agents:(e_i + 1) * self.n_agents]
+                for e_i in range(self.n_parallel_envs)]
             self.comm_logger.store_messages(
-                obs, messages, 
+                obs, log_messages, 
                 perfect_messages, 
-                broadcasts, 
+                word_encoder.decode_id_batch(
+                    broadcasts[0], broadcasts[1] - 1), 
                 kl_penalties.sum(0))
 
         # Save messages and kl_penalties for communication evaluation
@@ -149,10 +149,14 @@ class LMC:
 
         :return actions (np.ndarray): Actions for each agent, 
             dim=(n_parallel_envs, n_agents, 1).
-        :return broadcasts (list(list(str))): List of broadcasted messages for
-            each parallel environment.
-        :return agent_messages: (list(list(str))): Messages generated by each 
-            agent.
+        :return broadcasts (tuple(np.ndarray)): Broadcasted messages for each
+            parallel environment made of token ids and ending with EOS, 
+            dim=(n_parallel_envs, max_broadcast_len), and their lengths, 
+            dim=(n_parallel_envs,).
+        :return agent_messages: (tuple(np.ndarray)): Messages generated by 
+            each agent made of token ids, 
+            dim=(n_parallel_envs, n_agents, max_sent_len), and their lengths,
+            dim=(n_parallel_envs, n_agents).
         """
         # Get messages
         if self.comm_pol_algo != "no_comm":
@@ -165,13 +169,27 @@ class LMC:
             agent_messages = []
             broadcasts = []
 
-        # Log communication
+        # Log communication, messages are only decoded for the logs
         if self.comm_logger is not None:
+            log_messages = agent_messages
+            log_broadcasts = broadcasts
+            if self.comm_pol_algo != "no_comm":
+                word_encoder = self.lang_learner.word_encoder
+                message_ids, message_lens = agent_messages
+                log_messages = word_encoder.decode_id_batch(
+                    message_ids.reshape(message_lens.size, -1), 
+                    message_lens.reshape(-1))
+                log_messages = [
+                    log_messages[e_i * self.n_agents:(e_i + 1) * self.n_agents]
+                    for e_i in range(self.n_parallel_envs)]
+                # Broadcasts logged without their EOS token
+                log_broadcasts = word_encoder.decode_id_batch(
+                    broadcasts[0], broadcasts[1] - 1)
             self.comm_logger.store_messages(
                 obs, 
-                agent_messages, 
+                log_messages, 
                 perfect_messages, 
-                broadcasts)
+                log_broadcasts)
 
         # Store policy inputs in policy buffer
         obs, shared_obs = self._make_obs(obs)
@@ -185,14 +203,23 @@ class LMC:
 
     def _get_shared_mem_reward(self, agent_messages, states):
         """
+        :param agent_messages: (tuple(np.ndarray)) Messages of each agent made
+            of token ids, dim=(n_parallel_envs, n_agents, max_sent_len), and 
+            their lengths, dim=(n_parallel_envs, n_agents).
+        :param states: (np.ndarray) Global environment states, 
+            dim=(n_parallel_envs, state_dim).
+
         :return shared_mem_reward: (np.ndarray) dim=(n_parallel_envs, n_agents)
         """
-        # Encode agent messages
-        agent_messages = [
-            agent_messages[e_i][a_i] 
-                for e_i in range(self.n_parallel_envs) 
-                    for a_i in range(self.n_agents)]
-        message_encodings = self.lang_learner.encode_sentences(agent_messages)
+        # Encode agent messages, each one ending with EOS
+        messages, message_lens = agent_messages
+        message_lens = message_lens.reshape(-1)
+        sentences, sentence_lens = \
+            self.lang_learner.word_encoder.build_broadcasts(
+                messages.reshape(len(message_lens), 1, -1), 
+                message_lens[:, np.newaxis])
+        message_encodings = self.lang_learner.encode_padded_sentences(
+            sentences, sentence_lens)
 
         # Compute shared memory error
         local_errors, common_errors = self.shared_mem.get_prediction_error(
@@ -205,8 +232,7 @@ class LMC:
             
             if self.noreward_empty_mess:
                 # Zero rewards for empty messages
-                shared_mem_reward *= np.array(
-                    [len(m) > 0 for m in agent_messages])
+                shared_mem_reward *= message_lens > 0
 
         elif self.shared_mem_reward_type == "shaping":
             if self.last_common_errors is None:
@@ -217,8 +243,7 @@ class LMC:
 
                 if self.noreward_empty_mess:
                     # Zero rewards for empty messages
-                    shared_mem_reward *= np.array(
-                        [len(m) > 0 for m in agent_messages])
+                    shared_mem_reward *= message_lens > 0
                     
             self.last_common_errors = common_errors.repeat(
                 self.n_agents, axis=0)
@@ -229,7 +254,9 @@ class LMC:
     @torch.no_grad()
     def eval_comm(self, step_rewards, messages, states, dones):
         """
-        :param messages: (list(list(list(str))))
+        :param messages: (tuple(np.ndarray)) Messages of each agent made of 
+            token ids, dim=(n_parallel_envs, n_agents, max_sent_len), and 
+            their lengths, dim=(n_parallel_envs, n_agents).
         :param states: (np.ndarray) Global environment states, 
             dim=(n_parallel_envs, state_dim).
         """
@@ -259,9 +286,7 @@ class LMC:
         #                             * self.obs_dist_coef
 
         # Penalty for message length
-        message_len = np.array(
-            [len(m) for env_m in messages for m in env_m]).reshape(
-                message_rewards.shape)
+        message_len = messages[1].reshape(message_rewards.shape)
         rewards["message_len"] = message_len.mean() * -self.token_penalty
 
         tot_rewards = message_rewards * self.env_reward_coef \
@@ -69,8 +69,11 @@ class CommPol_Context:
         :param lang_context: (np.ndarray) Language contexts from last step, 
             dim=(n_envs, n_agents, context_dim)
             
-        :return messages (list(list(str))): messages generated for each agent,
-            for each parallel environment
+        :return messages (np.ndarray): Messages generated for each agent in 
+            each parallel environment, made of token ids padded with 0,
+            dim=(n_envs, n_agents, max_sent_len).
+        :return lengths (np.ndarray): Length of each message, 
+            dim=(n_envs, n_agents).
         """
         # Encode inputs
         # obs_context = []
@@ -104,11 +107,12 @@ class CommPol_Context:
         self.obs_dist = np.linalg.norm(
             torch2numpy(obs_context) - self.comm_context, 2, axis=-1)
 
-        messages = self.lang_learner.generate_sentences(torch.Tensor(
-            self.comm_context).view(self.n_envs * self.n_agents, -1).to(
-                self.device))
+        messages, lengths = self.lang_learner.generate_padded_sentences(
+            torch.Tensor(self.comm_context).view(
+                self.n_envs * self.n_agents, -1).to(self.device))
         
-        return messages
+        return messages.reshape(self.n_envs, self.n_agents, -1), \
+               lengths.reshape(self.n_envs, self.n_agents)
 
     # def _rand_filter_messages(self, messages):
     #     """
@@ -130,29 +134,39 @@ class CommPol_Context:
     
     @torch.no_grad()
     def comm_step(self, obs, lang_contexts, perfect_messages=None):
+        """
+        Perform a communication step: generates messages and encodes the 
+        broadcast of each environment.
+        :param obs: (np.ndarray) agents' observations for all parallel 
+            environments, dim=(n_envs, n_agents, obs_dim)
+        :param lang_contexts: (np.ndarray) Language contexts from last step, 
+            dim=(n_envs, context_dim)
+
+        :return broadcasts (tuple(np.ndarray)): Broadcasted messages made of 
+            token ids and ending with EOS, dim=(n_envs, max_broadcast_len), 
+            and their lengths, dim=(n_envs,).
+        :return messages (tuple(np.ndarray)): Messages of each agent made of
+            token ids, dim=(n_envs, n_agents, max_sent_len), and their 
+            lengths, dim=(n_envs, n_agents).
+        :return new_lang_contexts (np.ndarray): Language contexts for next 
+            step, dim=(n_envs, context_dim).
+        """
         # Get messages
         messages = self.get_messages(obs, lang_contexts)
         
-        # Arrange messages by env
-        broadcasts = []
-        messages_by_env = []
-        for e_i in range(self.n_envs):
-            env_broadcast = []
-            for a_i in range(self.n_agents):
-                env_broadcast.extend(messages[e_i * self.n_agents + a_i])
-            broadcasts.append(env_broadcast)
-            messages_by_env.append(messages[
-                e_i * self.n_agents:e_i * self.n_agents + self.n_agents])
-
-        new_lang_contexts = self.lang_learner.encode_sentences(
-            broadcasts).cpu().numpy()
+        # Concatenate messages of each env
+        broadcasts = self.lang_learner.word_encoder.build_broadcasts(
+            *messages)
+
+        new_lang_contexts = self.lang_learner.encode_padded_sentences(
+            *broadcasts).cpu().numpy()
 
         # # TEST with perfect messages
         # broadcasts = self._rand_filter_messages(perfect_messages)
         # new_lang_contexts = self.lang_learner.encode_sentences(broadcasts).detach().cpu().numpy()
         
         # Return messages and lang_context
-        return broadcasts, messages_by_env, new_lang_contexts
+        return broadcasts, messages, new_lang_contexts
     
     def store_rewards(self, message_rewards, dones):
         """
@@ -122,81 +122,96 @@ class TextActorCritic(nn.Module):
         # Policy and value heads
         self.actor = copy.deepcopy(pretrained_decoder.out)
         self.critic = init(nn.Linear(context_dim, 1), gain=0.01)
+        # One-hot encodings of tokens, kept on the device of the model
+        self.register_buffer(
+            "token_encodings", 
+            torch.Tensor(self.word_encoder.token_encodings), 
+            persistent=False)
             
-    def gen_messages(self, context_batch):
+    def gen_messages(self, context_batch, ref_decoder=None):
         """
+        Generate sentences greedily, for max_sent_len steps. All outputs stay
+        on the device of the model, without synchronisation with the host 
+        during generation. Steps after the end of a sentence have a mask of 
+        0. Messages are the generated tokens with a mask of 1 that are not 
+        EOS, get_messages turns them into padded ids, 
+        dim=(batch_size, max_sent_len), and lengths, as taken by 
+        word_encoder.decode_id_batch.
         :param context_batch (torch.Tensor): Batch of context vectors,
                 dim=(1, batch_size, context_dim).
+        :param ref_decoder (GRUDecoder): Reference decoder stepped along 
+            with the policy on the generated tokens, to compute the KL 
+            divergence to its token distribution, default None.
+
+        :return token_ids (torch.Tensor): Generated token ids, 
+            dim=(max_sent_len, batch_size).
+        :return token_log_probs (torch.Tensor): Log-probabilities of 
+            generated tokens, dim=(max_sent_len, batch_size, 1).
+        :return value_preds (torch.Tensor): Value predictions, including the
+            value after the last token, dim=(max_sent_len + 1, batch_size, 1).
+        :return masks (torch.Tensor): Masks of generation steps, 1 until the
+            EOS token has been generated (included), with an initial row of 
+            ones, dim=(max_sent_len + 1, batch_size).
+        :return log_probs (torch.Tensor): Log-probabilities of all tokens, 
+            dim=(max_sent_len, batch_size, token_dim).
+        :return kl (torch.Tensor): KL divergence to the reference decoder, 
+            None if no ref_decoder is given, dim=(max_sent_len, batch_size).
         """
         batch_size = context_batch.shape[1]
         # Set initial hidden states and token
         hidden = context_batch
-        last_tokens = torch.tensor(
-            np.array([[self.word_encoder.SOS_ENC]])).float().repeat(
-                1, batch_size, 1).to(self.device)
-        
-        batch_tokens = []
-        batch_log_probs = []
-        batch_token_log_probs = []
-        batch_value_preds = []
-        batch_masks = [np.ones(batch_size)]
-        last_topi = torch.zeros(batch_size)
-        # batch_len_sentences = np.zeros(batch_size)
-        sentences = [[] for b_i in range(batch_size)]
+        last_tokens = self.token_encodings[
+            self.word_encoder.SOS_ID].repeat(1, batch_size, 1)
+        
+        token_ids = torch.zeros(
+            (self.max_sent_len, batch_size), dtype=torch.long, 
+            device=self.device)
+        log_probs = torch.zeros(
+            (self.max_sent_len, batch_size, self.token_encodings.shape[0]), 
+            device=self.device)
+        value_preds = torch.zeros(
+            (self.max_sent_len + 1, batch_size, 1), device=self.device)
+        kl = None
+        if ref_decoder is not None:
+            ref_hidden = context_batch
+            kl = torch.zeros(
+                (self.max_sent_len, batch_size), device=self.device)
         for t_i in range(self.max_sent_len):
             # Encode with RNN
             _, hidden = self.gru(last_tokens, hidden)
             
             # Get token predictions from actor
-            log_probs = self.actor(hidden)
+            log_probs[t_i] = self.actor(hidden)[0]
             
             # Get values from critic
-            value_preds = self.critic(hidden)
+            value_preds[t_i] = self.critic(hidden)[0]
+
+            # KL divergence to the reference decoder given the same tokens
+            if ref_decoder is not None:
+                ref_log_probs, ref_hidden = ref_decoder.forward_step(
+                    last_tokens, ref_hidden)
+                kl[t_i] = (log_probs[t_i].exp() 
+                    * (log_probs[t_i] - ref_log_probs[0])).sum(-1)
             
             # Sample next token
-            _, topi = log_probs.topk(1)
-            topi = topi.squeeze()
-            tokens = self.word_encoder.token_encodings[topi.cpu()]
+            _, topi = log_probs[t_i].topk(1)
+            token_ids[t_i] = topi[:, 0]
             
-            # Make token_log_prob
-            token_log_probs = log_probs.gather(-1, topi.reshape(1, -1, 1))
-            
-            # Make mask: 1 if last token is not EOS and last mask is not 0
-            masks = (
-                np.where(last_topi.cpu() == self.word_encoder.EOS_ID, 0.0, 1.0) * \
-                np.where(batch_masks[-1] == 0.0, 0.0, 1.0))
-            last_topi = topi
-            
-            # Stop early if all sentences are finished
-            if sum(masks) == 0:
-                break
-            
-            # Add decoded tokens to sentences
-            for b_i in range(batch_size):
-                if masks[b_i] and topi[b_i] != self.word_encoder.EOS_ID:
-                    sentences[b_i].append(
-                        self.word_encoder.index2token(topi[b_i]))
-            
-            batch_tokens.append(tokens)
-            batch_log_probs.append(torch2numpy(log_probs))
-            batch_token_log_probs.append(torch2numpy(token_log_probs))
-            batch_value_preds.append(torch2numpy(value_preds))
-            batch_masks.append(masks)
-            
-            last_tokens = torch.Tensor(tokens).unsqueeze(0).to(self.device)
+            last_tokens = self.token_encodings[token_ids[t_i]].unsqueeze(0)
             
         # Compute last value
         _, hidden = self.gru(last_tokens, hidden)
-        value_preds = self.critic(hidden)
-        batch_value_preds.append(torch2numpy(value_preds))
-        
-        tokens = np.stack(batch_tokens, dtype=np.float32)
-        log_probs = np.concatenate(batch_log_probs)
-        token_log_probs = np.concatenate(batch_token_log_probs)
-        value_preds = np.concatenate(batch_value_preds)
-        masks = np.stack(batch_masks)
+        value_preds[-1] = self.critic(hidden)[0]
+
+        token_log_probs = log_probs.gather(-1, token_ids.unsqueeze(-1))
+
+        # Make masks: 1 if no EOS was generated at previous steps
+        is_eos = (token_ids == self.word_encoder.EOS_ID).float()
+        masks = torch.cat((
+            torch.ones((2, batch_size), device=self.device), 
+            (is_eos.cumsum(0)[:-1] == 0).float()))
         
-        return tokens, token_log_probs, value_preds, masks, sentences, log_probs
+        return token_ids, token_log_probs, value_preds, masks, log_probs, kl
     
     def evaluate_tokens(self, context_batch, token_batch):
         """
@@ -248,6 +263,7 @@ class CommPPO_MLP:
         self.entropy_coef = args.comm_entropy_coef
         self.vloss_coef = args.comm_vloss_coef
         self.max_grad_norm = args.comm_max_grad_norm
+        self.klpretrain_mode = args.comm_klpretrain_mode
         self.n_mini_batch = args.comm_n_mini_batch
         self.device = device
         self.warming_up = False
@@ -255,7 +271,7 @@ class CommPPO_MLP:
         self.lang_learner = lang_learner
         
         self.context_encoder = MLPNetwork(
-            2 * args.context_dim, args.context_dim, norm_in=False)
+            2 * args.context_dim, args.context_dim, norm_in=None)
         
         self.comm_policy = TextActorCritic(
             lang_learner.word_encoder, 
@@ -340,10 +356,13 @@ class CommPPO_MLP:
         :param obs (np.ndarray): agents' observations for all parallel 
             environments, dim=(n_envs, n_agents, obs_dim)
             
-        :return comm (list(list(str))): messages generated for each agent,
-            for each parallel environment
-        :return lang_context (np.ndarray): language context vectors to send
-            to policy, dim=(n_envs, n_agents, context_dim)
+        :return messages (np.ndarray): token ids of the messages generated 
+            for each agent, padded with 0, 
+            dim=(n_envs * n_agents, max_sent_len)
+        :return lengths (np.ndarray): length of each message, 
+            dim=(n_envs * n_agents,)
+        :return klpretrain_rewards (np.ndarray): KL-pretrain rewards of each
+            generated token, dim=(seq_len, n_envs * n_agents)
         """
         # Encode inputs
         obs = torch.Tensor(obs).view(self.n_envs * self.n_agents, -1)
@@ -359,15 +378,37 @@ class CommPPO_MLP:
         # Encode contexts
         comm_context = obs_context.unsqueeze(0) # NOCOMMENC self.context_encoder(input_context).unsqueeze(0)
         
-        # Generate messages
-        tokens, token_log_probs, value_preds, masks, messages, log_probs = \
-            self.comm_policy.gen_messages(comm_context)
+        # Generate messages, with the KL-pretrain rewards if fused
+        ref_decoder = self.lang_learner.decoder \
+            if self.klpretrain_mode == "fused" else None
+        token_ids, token_log_probs, value_preds, masks, log_probs, kl = \
+            self.comm_policy.gen_messages(comm_context, ref_decoder)
+
+        # Transfer to host, keeping only the steps where at least one 
+        # sentence is not finished
+        masks = masks.cpu().numpy().astype(np.float64)
+        n_steps = int(masks[1:].sum(0).max())
+        masks = masks[:n_steps + 1]
+        token_ids = token_ids[:n_steps].cpu().numpy()
+        token_log_probs = torch2numpy(token_log_probs[:n_steps])
+        value_preds = torch2numpy(value_preds[:n_steps + 1])
+        tokens = self.lang_learner.word_encoder.token_encodings[
+            token_ids].astype(np.float32)
+        # Messages are the generated tokens before EOS
+        keep = (masks[1:] > 0) \
+            & (token_ids != self.lang_learner.word_encoder.EOS_ID)
+        messages = np.where(keep, token_ids, 0).T
+        lengths = keep.sum(0)
         
         # Compute KL-pretrain rewards
-        # Get reference token_log_probs from pretrained decoder
-        ref_log_probs = self._get_pretrain_probs(comm_context, tokens)
-        # Compute KL divergence
-        kl = (np.exp(log_probs) * (log_probs - torch2numpy(ref_log_probs))).sum(-1)
+        if kl is None:
+            # Get reference token_log_probs from pretrained decoder
+            ref_log_probs = self._get_pretrain_probs(comm_context, tokens)
+            log_probs = torch2numpy(log_probs[:n_steps])
+            # Compute KL divergence
+            kl = (np.exp(log_probs) * (log_probs - torch2numpy(ref_log_probs))).sum(-1)
+        else:
+            kl = torch2numpy(kl[:n_steps])
         
         # Store experiences in buffer
         self.buffer.store_gen(
@@ -377,7 +418,7 @@ class CommPPO_MLP:
             value_preds, 
             masks)
         
-        return messages, -kl
+        return messages, lengths, -kl
 
     # def _rand_filter_messages(self, messages):
     #     """
@@ -400,28 +441,24 @@ class CommPPO_MLP:
     @torch.no_grad()
     def comm_step(self, obs, lang_contexts, perfect_messages=None):
         # Get messages
-        messages, klpretrain_rewards = self.get_messages(obs, lang_contexts)
+        messages, lengths, klpretrain_rewards = self.get_messages(
+            obs, lang_contexts)
         
         # Arrange messages by env
-        broadcasts = []
-        messages_by_env = []
-        for e_i in range(self.n_envs):
-            env_broadcast = []
-            for a_i in range(self.n_agents):
-                env_broadcast.extend(messages[e_i * self.n_agents + a_i])
-            broadcasts.append(env_broadcast)
-            messages_by_env.append(messages[
-                e_i * self.n_agents:e_i * self.n_agents + self.n_agents])
-
-        new_lang_contexts = self.lang_learner.encode_sentences(
-            broadcasts).cpu().numpy()
+        messages = messages.reshape(self.n_envs, self.n_agents, -1)
+        lengths = lengths.reshape(self.n_envs, self.n_agents)
+        broadcasts = self.lang_learner.word_encoder.build_broadcasts(
+            messages, lengths)
+
+        new_lang_contexts = self.lang_learner.encode_padded_sentences(
+            *broadcasts).cpu().numpy()
 
         # # TEST with perfect messages
         # broadcasts = self._rand_filter_messages(perfect_messages)
         # new_lang_contexts = self.lang_learner.encode_sentences(broadcasts).detach().cpu().numpy()
         
         # Return messages and lang_context
-        return broadcasts, messages_by_env, new_lang_contexts, \
+        return broadcasts, (messages, lengths), new_lang_contexts, \
                klpretrain_rewards
     
     def store_rewards(self, message_rewards, token_rewards):
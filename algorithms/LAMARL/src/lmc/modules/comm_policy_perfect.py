@@ -1,4 +1,5 @@
 import random
+import numpy as np
 
 
 class PerfectComm:
@@ -7,23 +8,19 @@ class PerfectComm:
         self.lang_learner = lang_learner
         self.prob_send_message = prob_send_message
 
-    def _rand_filter_messages(self, messages):
+    def _rand_filter_messages(self, lengths):
         """
         Randomly filter out perfect messages.
-        :param messages (list(list(list(str)))): Perfect messages, ordered by
-            environment, by agent.
+        :param lengths (np.ndarray): Length of perfect messages, 
+            dim=(n_envs, n_agents).
 
-        :return filtered_broadcast (list(list(str))): Filtered message to 
-            broadcast, one for each environment.
+        :return filtered_lengths (np.ndarray): Lengths of messages, 0 for 
+            filtered out messages, dim=(n_envs, n_agents).
         """
-        filtered_broadcast = []
-        for env_messages in messages:
-            env_broadcast = []
-            for message in env_messages:
-                if random.random() < self.prob_send_message:
-                    env_broadcast.extend(message)
-            filtered_broadcast.append(env_broadcast)
-        return filtered_broadcast
+        sent = np.array([
+            random.random() < self.prob_send_message 
+            for _ in range(lengths.size)]).reshape(lengths.shape)
+        return lengths * sent
 
     def comm_step(self, obs, lang_contexts, perfect_messages):
         """
@@ -36,18 +33,32 @@ class PerfectComm:
         :param perfect messages (list(list(list(str)))): Perfect messages,
             ordered by environment, by agent.
 
-        :return broadcasts (list(list(str))): Broadcasted messages for each
-            environment.
+        :return broadcasts (tuple(np.ndarray)): Broadcasted messages made of 
+            token ids and ending with EOS, dim=(n_envs, max_broadcast_len), 
+            and their lengths, dim=(n_envs,).
+        :return messages (tuple(np.ndarray)): Perfect messages made of token 
+            ids, dim=(n_envs, n_agents, max_sent_len), and their lengths, 
+            dim=(n_envs, n_agents).
         :return next_contents (np.ndarray): Language contexts for next step,
             dim=(n_envs, context_dim).
         """
+        n_envs = len(perfect_messages)
+        n_agents = len(perfect_messages[0])
+        word_encoder = self.lang_learner.word_encoder
+        messages, lengths = word_encoder.get_padded_ids(
+            [m for env_messages in perfect_messages for m in env_messages])
+        messages = messages.reshape(n_envs, n_agents, -1)
+        lengths = lengths.reshape(n_envs, n_agents)
+
         # Determines the content of the broadcasted message
-        broadcasts = self._rand_filter_messages(perfect_messages)
+        broadcasts = word_encoder.build_broadcasts(
+            messages, self._rand_filter_messages(lengths))
         
         # Compute next context
-        next_contexts = self.lang_learner.encode_sentences(broadcasts)
+        next_contexts = self.lang_learner.encode_padded_sentences(*broadcasts)
 
-        return broadcasts, perfect_messages, next_contexts.detach().cpu().numpy()
+        return broadcasts, (messages, lengths), \
+               next_contexts.detach().cpu().numpy()
 
     def store_rewards(self, message_rewards, token_rewards):
         """
@@ -83,6 +83,23 @@ class LanguageLearner:
         context_batch = self.lang_encoder(sentence_batch).squeeze(0)
         return context_batch
     
+    def encode_padded_sentences(self, sentence_batch, lengths):
+        """ 
+        Encode a batch of padded sentences. 
+        :param sentence_batch (np.ndarray): Batch of sentences made of token
+            ids, ending with the EOS token and padded, dim=(batch_size, 
+            max_sent_len).
+        :param lengths (np.ndarray): Length of each sentence, 
+            dim=(batch_size,).
+
+        :return context_batch (torch.Tensor): Batch of context vectors, 
+            dim=(batch_size, context_dim).
+        """
+        context_batch = self.lang_encoder.forward_padded(
+            torch.from_numpy(sentence_batch), 
+            torch.from_numpy(lengths)).squeeze(0)
+        return context_batch
+    
     def encode_observations(self, obs_batch):
         context_batch = self.obs_encoder(obs_batch)
         return context_batch
@@ -98,6 +115,19 @@ class LanguageLearner:
         _, sentences = self.decoder(context_batch)
         return sentences
 
+    def generate_padded_sentences(self, context_batch):
+        """ 
+        Generate sentences from a batch of context vectors, as token ids. 
+        :param context_batch (torch.Tensor): Batch of context vectors,
+            dim=(batch_size, context_dim).
+        
+        :return token_ids (np.ndarray): Generated sentences made of token 
+            ids, padded with 0, dim=(batch_size, max_sent_len).
+        :return lengths (np.ndarray): Length of each sentence, 
+            dim=(batch_size,).
+        """
+        return self.decoder.generate_ids(context_batch)
+
     def compute_losses(self, obs_batch, sent_batch):
         # Encode observations
         obs_tensor = torch.from_numpy(np.array(obs_batch, dtype=np.float32))
@@ -22,6 +22,8 @@ class OneHotEncoder:
             :param vocab (list): List of tokens that can appear in the language
         """
         self.tokens = ["<SOS>", "<EOS>"] + vocab
+        # Lookup table from tokens to their index
+        self.token_ids = {t: i for i, t in enumerate(self.tokens)}
         self.enc_dim = len(self.tokens)
         self.token_encodings = np.eye(self.enc_dim)
 
@@ -68,7 +70,7 @@ class OneHotEncoder:
             :param onehots (list): List of one-hot encodings
         """
         onehots = [
-            self.token_encodings[self.tokens.index(t)] 
+            self.token_encodings[self.token_ids[t]] 
             for t in sentence
         ]
         return onehots
@@ -107,6 +109,69 @@ class OneHotEncoder:
                 [self.enc2token(enc) for enc in enc_sentence])
         return decoded_batch
 
+    def get_padded_ids(self, sentence_batch):
+        """
+        Transforms a batch of sentences into padded token ids.
+        Inputs:
+            :param sentence_batch (list): List of sentences (lists of tokens)
+        Outputs:
+            :param token_ids (numpy.ndarray): Token ids of the sentences, 
+                padded with 0, dim=(batch_size, max_sent_len).
+            :param lengths (numpy.ndarray): Length of each sentence, 
+                dim=(batch_size,).
+        """
+        lengths = np.array([len(s) for s in sentence_batch], dtype=np.int64)
+        token_ids = np.zeros(
+            (len(sentence_batch), lengths.max(initial=0)), dtype=np.int64)
+        token_ids[np.arange(token_ids.shape[1]) < lengths[:, np.newaxis]] = [
+            self.token_ids[t] for s in sentence_batch for t in s]
+        return token_ids, lengths
+
+    def build_broadcasts(self, messages, lengths):
+        """
+        Concatenates the messages of all agents of each environment into one
+        broadcast ending with the EOS token.
+        Inputs:
+            :param messages (numpy.ndarray): Messages made of token ids, 
+                dim=(n_envs, n_agents, max_sent_len).
+            :param lengths (numpy.ndarray): Length of each message, 
+                dim=(n_envs, n_agents).
+        Outputs:
+            :param broadcasts (numpy.ndarray): Broadcasts padded with 0, 
+                dim=(n_envs, max_broadcast_len).
+            :param broadcast_lengths (numpy.ndarray): Length of each 
+                broadcast, with its EOS token, dim=(n_envs,).
+        """
+        n_envs = messages.shape[0]
+        # Tokens of each message, in broadcast order
+        token_mask = (np.arange(messages.shape[-1]) < lengths[..., np.newaxis])
+        token_mask = token_mask.reshape(n_envs, -1)
+        broadcast_lengths = token_mask.sum(-1) + 1
+        broadcasts = np.zeros(
+            (n_envs, broadcast_lengths.max()), dtype=np.int64)
+        # Kept tokens fill the start of each broadcast, in the same order
+        broadcasts[np.arange(broadcast_lengths.max()) 
+                   < broadcast_lengths[:, np.newaxis] - 1] = \
+            messages.reshape(n_envs, -1)[token_mask]
+        broadcasts[np.arange(n_envs), broadcast_lengths - 1] = self.EOS_ID
+        return broadcasts, broadcast_lengths
+
+    def decode_id_batch(self, token_ids, lengths):
+        """
+        Decode batch of sentences given as padded token ids.
+        Inputs:
+            :param token_ids (numpy.ndarray): Token ids of the sentences, 
+                dim=(batch_size, max_sent_len).
+            :param lengths (numpy.ndarray): Number of tokens to decode in 
+                each sentence, dim=(batch_size,).
+        Outputs:
+            :param decoded_batch (list): List of sentences.
+        """
+        keep = np.arange(token_ids.shape[1]) < lengths[:, np.newaxis]
+        words = np.array(self.tokens, dtype=object)[token_ids[keep]].tolist()
+        ends = np.cumsum(lengths).tolist()
+        return [words[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
 class GRUEncoder(nn.Module):
     """
     Class for a language encoder using a Gated Recurrent Unit network
@@ -209,6 +274,44 @@ class GRUEncoder(nn.Module):
 
         return self.norm(self.out(unsorted_hstates))
 
+    def forward_padded(self, token_ids, lengths):
+        """
+        Transforms padded sentences into embeddings, with all sentences of 
+        the batch embedded and passed in the GRU at once.
+        Inputs:
+            :param token_ids (torch.Tensor): Batch of sentences made of token 
+                ids, ending with the EOS token and padded, dim=(batch_size, 
+                max_sent_len).
+            :param lengths (torch.Tensor): Length of each sentence, 
+                dim=(batch_size,).
+        Outputs:
+            :param hidden_states (torch.Tensor): Final hidden states
+                corresponding to each given sentence, dim=(1, batch_size, 
+                context_dim)
+        """
+        token_ids = token_ids.long().to(self.device)
+
+        # Embed
+        if self.do_embed:
+            model_input = self.embed_layer(token_ids)
+        else:
+            model_input = nn.functional.one_hot(
+                token_ids, self.word_encoder.enc_dim).float()
+
+        # Pack padded sentences (to not care about padded tokens), the GRU 
+        # returns final hidden states in the order of the batch
+        packed = nn.utils.rnn.pack_padded_sequence(
+            model_input, lengths.cpu(), batch_first=True, enforce_sorted=False)
+
+        # Initial hidden state
+        hidden = torch.zeros(1, token_ids.shape[0], self.hidden_dim, 
+                        device=self.device)
+        
+        # Pass sentences into GRU model
+        _, hidden_states = self.gru(packed, hidden)
+
+        return self.norm(self.out(hidden_states))
+
     def get_params(self):
         return {'gru': self.gru.state_dict(),
                 'out': self.out.state_dict()}
@@ -328,6 +431,61 @@ class GRUDecoder(nn.Module):
 
         return decoder_outputs, sentences
 
+    @torch.no_grad()
+    def generate_ids(self, context_batch):
+        """
+        Generates sentences from context vectors with greedy sampling. Tokens
+        are written on device and finished sentences are removed from the GRU
+        batch, so only the unfinished ones are computed at each step. 
+        Sentences are sent to the host once at the end.
+        Inputs:
+            :param context_batch (torch.Tensor): Batch of context vectors,
+                dim=(batch_size, context_dim).
+        Outputs:
+            :param token_ids (numpy.ndarray): Token ids of the generated 
+                sentences, without EOS token and padded with 0, 
+                dim=(batch_size, max_sent_len).
+            :param lengths (numpy.ndarray): Length of each sentence, 
+                dim=(batch_size,).
+        """
+        batch_size = context_batch.size(0)
+        token_encodings = torch.eye(
+            self.word_encoder.enc_dim, device=self.device)
+        sentences = torch.zeros(
+            (batch_size, self.max_length), dtype=torch.long, 
+            device=self.device)
+
+        hidden = context_batch.unsqueeze(0)
+        last_tokens = token_encodings[self.word_encoder.SOS_ID].repeat(
+            1, batch_size, 1)
+
+        # Index in the batch of sentences not finished yet
+        active_ids = torch.arange(batch_size, device=self.device)
+        for t_i in range(self.max_length):
+            # RNN pass on unfinished sentences
+            outputs, hidden = self.forward_step(last_tokens, hidden)
+            _, topi = outputs.topk(1)
+            next_tokens = topi[0, :, 0]
+            sentences[active_ids, t_i] = next_tokens
+
+            # Remove finished sentences from the batch
+            running = next_tokens != self.word_encoder.EOS_ID
+            if not running.all():
+                active_ids = active_ids[running]
+                if len(active_ids) == 0:
+                    break
+                hidden = hidden[:, running]
+                next_tokens = next_tokens[running]
+
+            last_tokens = token_encodings[next_tokens].unsqueeze(0)
+
+        # Cut sentences before their EOS token
+        token_ids = sentences.cpu().numpy()
+        lengths = (np.cumsum(
+            token_ids == self.word_encoder.EOS_ID, axis=1) == 0).sum(1)
+        token_ids[np.arange(self.max_length) >= lengths[:, np.newaxis]] = 0
+        return token_ids, lengths
+
     def compute_pp(self, enc_sent):
         """
         :param enc_sent: (list(torch.Tensor))
@@ -1,6 +1,5 @@
 import numpy as np
 import torch
-import torch.nn.functional as F
 
 from torch import nn
 
@@ -10,55 +9,78 @@ from src.lmc.utils import torch2numpy
 
 
 class SharedMemoryBuffer():
+    """
+    Episode store of the shared memory. Each episode occupies one slot of 
+    the buffers. Slots of running episodes are in current_ids, slots of 
+    finished episodes are kept in a FIFO ring (finished_ids) and unused slots
+    in a free stack (free_ids). When no slot is free, the oldest finished 
+    episode is evicted.
+    """
 
     def __init__(self, args, state_dim):
         self.n_parallel_envs = args.n_parallel_envs
         self.max_size = args.shared_mem_max_buffer_size
         self.max_ep_length = args.episode_length
         self.batch_size = args.shared_mem_batch_size
+        assert self.max_size > self.n_parallel_envs, \
+            "shared_mem_max_buffer_size must be greater than n_parallel_envs"
 
         self.message_enc_buffer = np.zeros(
-            (self.max_size, self.max_ep_length, args.context_dim))
+            (self.max_size, self.max_ep_length, args.context_dim), 
+            dtype=np.float32)
         self.state_buffer = np.zeros(
-            (self.max_size, self.max_ep_length, state_dim))
+            (self.max_size, self.max_ep_length, state_dim), dtype=np.float32)
         self.ep_lens = np.zeros(self.max_size, dtype=np.int32)
-        self.finished_eps = np.zeros(self.max_size, dtype=np.int32)
 
+        # Slots of running episodes
         self.current_ids = np.arange(self.n_parallel_envs, dtype=np.int32)
-
-        self.current_size = self.n_parallel_envs
+        # Stack of free slots
+        self.free_ids = np.arange(
+            self.max_size - 1, self.n_parallel_envs - 1, -1, dtype=np.int32)
+        self.n_free = len(self.free_ids)
+        # Ring of finished slots, from oldest to newest
+        self.finished_ids = np.zeros(self.max_size, dtype=np.int32)
+        self.finished_start = 0
+        self.n_finished = 0
 
     def _reset_buffer_entries(self, ids):
-        self.message_enc_buffer[ids]
+        self.message_enc_buffer[ids] = 0.0
+        self.state_buffer[ids] = 0.0
+        self.ep_lens[ids] = 0
 
     def end_episode(self, dones):
-        # Find ids of finished episodes
-        finished_ep_ids = self.current_ids[dones]
-        self.finished_eps[finished_ep_ids] += 1
-
-        # Roll if needed
-        n_changes = len(finished_ep_ids)
-        if n_changes + self.current_size > self.max_size:
-            n_shift = n_changes + self.current_size - self.max_size
-            # Roll buffers and init rolled entries to zeros
-            self.message_enc_buffer = np.roll(
-                self.message_enc_buffer, -n_shift, axis=0)
-            self.message_enc_buffer[-n_shift:] *= 0
-            self.state_buffer = np.roll(self.state_buffer, -n_shift, axis=0)
-            self.state_buffer[-n_shift:] *= 0
-            self.ep_lens = np.roll(self.ep_lens, -n_shift, axis=0)
-            self.ep_lens[-n_shift:] *= 0
-            self.finished_eps = np.roll(self.finished_eps, -n_shift, axis=0)
-            self.finished_eps[-n_shift:] *= 0
-            # Update ids accordingly
-            self.current_ids -= n_shift
-
-        # Set new ids
-        for i in range(self.n_parallel_envs):
-            if dones[i]:
-                self.current_ids[i] = self.current_ids.max() + 1
-        
-        self.current_size = min(self.current_size + n_changes, self.max_size)
+        """
+        Move episodes of done environments to the finished episodes and give
+        these environments new slots.
+        :param dones: (np.ndarray) Whether each environment is done, 
+            dim=(n_parallel_envs,).
+        """
+        done_envs = np.flatnonzero(dones)
+        n_changes = len(done_envs)
+        if n_changes == 0:
+            return
+
+        # Add finished episodes at the end of the ring
+        ring_pos = (self.finished_start + self.n_finished 
+                    + np.arange(n_changes)) % self.max_size
+        self.finished_ids[ring_pos] = self.current_ids[done_envs]
+        self.n_finished += n_changes
+
+        # Take new slots in free ones, then evict oldest finished episodes
+        n_from_free = min(n_changes, self.n_free)
+        new_ids = self.free_ids[self.n_free - n_from_free:self.n_free]
+        self.n_free -= n_from_free
+        n_evict = n_changes - n_from_free
+        if n_evict > 0:
+            ring_pos = (self.finished_start + np.arange(n_evict)) \
+                % self.max_size
+            new_ids = np.concatenate((new_ids, self.finished_ids[ring_pos]))
+            self.finished_start = (self.finished_start + n_evict) \
+                % self.max_size
+            self.n_finished -= n_evict
+
+        self._reset_buffer_entries(new_ids)
+        self.current_ids[done_envs] = new_ids
 
     def store(self, message_encodings, states):
         """
@@ -87,11 +109,11 @@ class SharedMemoryBuffer():
         :return ep_lens: (np.ndarray) Actual length of each sampled episode,
             dim=(batch_size,).
         """
-        n_finished = self.finished_eps.sum()
-        batch_size = min(self.batch_size, n_finished)
+        batch_size = min(self.batch_size, self.n_finished)
 
-        sample_ids = np.random.choice(
-            n_finished, batch_size, replace=False)
+        ring_pos = (self.finished_start + np.random.choice(
+            self.n_finished, batch_size, replace=False)) % self.max_size
+        sample_ids = self.finished_ids[ring_pos]
             
         return self.message_enc_buffer[sample_ids], \
                self.state_buffer[sample_ids], \
@@ -106,6 +128,8 @@ class SharedMemory():
         self.n_rec_layers = args.shared_mem_n_rec_layers
         self.n_parallel_envs = args.n_parallel_envs
         self.state_dim = state_dim
+        self.train_mode = args.shared_mem_train_mode
+        self.n_buckets = args.shared_mem_n_buckets
         self.device = device
 
         # # Language Encoder
@@ -202,8 +226,7 @@ class SharedMemory():
             message_encodings.to(self.device), hidden_states.to(self.device))
 
         if type(x) is torch.nn.utils.rnn.PackedSequence:
-            x = torch.nn.utils.rnn.unpack_sequence(x)
-            x = nn.utils.rnn.pad_sequence(x)
+            x, _ = nn.utils.rnn.pad_packed_sequence(x)
 
         x = self.norm(x)
 
@@ -247,13 +270,19 @@ class SharedMemory():
         
         return local_errors, common_errors
 
-    def train(self):
+    def _get_packed_error(self, message_encodings, states, ep_lens):
         """
-        Train the model.
-        :return loss: (float) Training loss.
+        Sum of squared prediction errors, with episodes given to the GRU as
+        a packed sequence.
+        :param message_encodings: (np.ndarray) Encoded messages, 
+            dim=(batch_size, max_ep_len, context_dim).
+        :param states: (np.ndarray) Actual states, dim=(batch_size, 
+            max_ep_len, state_dim).
+        :param ep_lens: (np.ndarray) Length of each episode, 
+            dim=(batch_size,).
+
+        :return error: (torch.Tensor) Summed squared error.
         """
-        message_encodings, states, ep_lens = self.buffer.sample()
-        
         # Sort by episode length decreasing
         sorted_ids = np.argsort(ep_lens)[::-1]
         sorted_mess_enc = [
@@ -278,7 +307,65 @@ class SharedMemory():
             states[sorted_ids]).transpose(0, 1).to(self.device)
         if pred_states.shape[0] < sorted_states.shape[0]:
             sorted_states = sorted_states[:pred_states.shape[0]]
-        error = F.mse_loss(pred_states, sorted_states, reduction="sum")
+        mask = torch.from_numpy(
+            np.arange(pred_states.shape[0])[:, np.newaxis] 
+                < ep_lens[sorted_ids]).to(self.device)
+        return (((pred_states - sorted_states) ** 2).sum(-1) * mask).sum()
+
+    def _get_masked_error(self, message_encodings, states, ep_lens):
+        """
+        Sum of squared prediction errors, with episodes given to the GRU as
+        padded fixed-length batches and padded steps masked out of the error.
+        Episodes are split in n_buckets buckets of similar lengths, each 
+        padded only to the length of its longest episode.
+        :param message_encodings: (np.ndarray) Encoded messages, 
+            dim=(batch_size, max_ep_len, context_dim).
+        :param states: (np.ndarray) Actual states, dim=(batch_size, 
+            max_ep_len, state_dim).
+        :param ep_lens: (np.ndarray) Length of each episode, 
+            dim=(batch_size,).
+
+        :return error: (torch.Tensor) Summed squared error.
+        """
+        error = 0.0
+        sorted_ids = np.argsort(ep_lens)
+        for bucket_ids in np.array_split(
+                sorted_ids, min(self.n_buckets, len(sorted_ids))):
+            bucket_lens = ep_lens[bucket_ids]
+            max_len = bucket_lens.max()
+            mess_enc = torch.from_numpy(
+                message_encodings[bucket_ids, :max_len].swapaxes(0, 1))
+            bucket_states = torch.from_numpy(
+                states[bucket_ids, :max_len].swapaxes(0, 1)).to(self.device)
+            mask = torch.from_numpy(
+                np.arange(max_len)[:, np.newaxis] < bucket_lens).to(
+                    self.device)
+
+            hidden = torch.zeros(
+                (self.n_rec_layers, len(bucket_ids), self.hidden_dim)).to(
+                    self.device)
+
+            # Predict states, steps after the end of an episode do not change
+            # the predictions of the previous steps
+            pred_states, _ = self._predict_states(mess_enc, hidden)
+
+            error = error + ((
+                (pred_states - bucket_states) ** 2).sum(-1) * mask).sum()
+        return error
+
+    def train(self):
+        """
+        Train the model.
+        :return loss: (float) Training loss.
+        """
+        message_encodings, states, ep_lens = self.buffer.sample()
+
+        if self.train_mode == "masked":
+            error = self._get_masked_error(
+                message_encodings, states, ep_lens)
+        else:
+            error = self._get_packed_error(
+                message_encodings, states, ep_lens)
         loss = error / ep_lens.sum()
 
         # Backward prop
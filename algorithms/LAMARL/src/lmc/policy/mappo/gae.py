@@ -0,0 +1,90 @@
+import torch
+import numpy as np
+
+
+def _empty_like(x):
+    if torch.is_tensor(x):
+        return torch.empty_like(x)
+    else:
+        return np.empty_like(x)
+
+
+def compute_gae(
+        rewards, values, masks, gamma, gae_lambda, bad_masks=None,
+        returns=None):
+    """
+    Compute returns with Generalized Advantage Estimation, for all
+    environments and agents at once. Works on NumPy arrays and on torch
+    tensors (on any device). Time is the first dimension of all inputs, the
+    other dimensions are treated as independent (e.g. envs, agents).
+    :param rewards: (np.ndarray or torch.Tensor) rewards, dim=(T, ...).
+    :param values: (np.ndarray or torch.Tensor) denormalized value
+        predictions, including the one after the last step, dim=(T + 1, ...).
+    :param masks: (np.ndarray or torch.Tensor) 0 if episode ended before
+        step, dim=(T + 1, ...).
+    :param gamma: (float) discount factor.
+    :param gae_lambda: (float) GAE parameter.
+    :param bad_masks: (np.ndarray or torch.Tensor) 0 if episode was
+        truncated before step, dim=(T + 1, ...), optional.
+    :param returns: (np.ndarray or torch.Tensor) array where returns are
+        written, dim=(T + 1, ...) or (T, ...), optional.
+
+    :return returns: (np.ndarray or torch.Tensor) returns, the last step of
+        the given returns array is left untouched.
+    """
+    n_steps = rewards.shape[0]
+    # TD errors and GAE decay of all steps
+    deltas = rewards + gamma * values[1:] * masks[1:] - values[:-1]
+    decays = gamma * gae_lambda * masks[1:]
+    if bad_masks is not None:
+        # Masks are binary, so masking delta and decay is the same as
+        # masking the accumulated advantage
+        deltas = deltas * bad_masks[1:]
+        decays = decays * bad_masks[1:]
+
+    advantages = _empty_like(deltas)
+    gae = 0
+    for step in reversed(range(n_steps)):
+        gae = deltas[step] + decays[step] * gae
+        advantages[step] = gae
+
+    if returns is None:
+        returns = _empty_like(deltas)
+    returns[:n_steps] = advantages + values[:-1]
+    return returns
+
+
+def compute_discounted_returns(
+        rewards, next_value, masks, gamma, bad_masks=None, values=None,
+        returns=None):
+    """
+    Compute discounted sums of rewards, bootstrapped with the value of the
+    step after the last one, for all environments and agents at once. Works
+    on NumPy arrays and on torch tensors.
+    :param rewards: (np.ndarray or torch.Tensor) rewards, dim=(T, ...).
+    :param next_value: (np.ndarray or torch.Tensor) value prediction for the
+        step after the last step, dim=(...).
+    :param masks: (np.ndarray or torch.Tensor) 0 if episode ended before
+        step, dim=(T + 1, ...).
+    :param gamma: (float) discount factor.
+    :param bad_masks: (np.ndarray or torch.Tensor) 0 if episode was
+        truncated before step, dim=(T + 1, ...), optional. Requires values.
+    :param values: (np.ndarray or torch.Tensor) value predictions replacing
+        the return of truncated steps, dim=(T + 1, ...) or (T, ...).
+    :param returns: (np.ndarray or torch.Tensor) array where returns are
+        written, dim=(T + 1, ...), optional.
+
+    :return returns: (np.ndarray or torch.Tensor) returns, with next_value
+        as last step.
+    """
+    n_steps = rewards.shape[0]
+    if returns is None:
+        returns = _empty_like(masks)
+    returns[-1] = next_value
+    for step in reversed(range(n_steps)):
+        ret = returns[step + 1] * gamma * masks[step + 1] + rewards[step]
+        if bad_masks is not None:
+            ret = ret * bad_masks[step + 1] \
+                + (1 - bad_masks[step + 1]) * values[step]
+        returns[step] = ret
+    return returns
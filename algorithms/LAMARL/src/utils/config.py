@@ -175,6 +175,9 @@ def get_config():
     # Communication evaluation
     parser.add_argument("--comm_token_penalty", type=float, default=0.1)
     parser.add_argument("--comm_klpretrain_coef", type=float, default=0.01)
+    parser.add_argument("--comm_klpretrain_mode", type=str, 
+                        choices=["fused", "two_pass"], default="two_pass", 
+                        help="How the KL to the pretrained decoder is computed: while generating, or with a second pass on the generated tokens.")
     parser.add_argument("--comm_env_reward_coef", type=float, default=1.0)
     # Communication evaluation (context)
     parser.add_argument("--comm_obs_dist_coef", type=float, default=0.1)
@@ -194,6 +197,11 @@ def get_config():
                         help="Max number of episodes (=*ep_length steps) stored in the buffer.")
     parser.add_argument("--shared_mem_batch_size", type=int, default=16, 
                         help="Number of episodes (=*ep_length steps) sampled for a single training update.")
+    parser.add_argument("--shared_mem_train_mode", type=str, 
+                        choices=["packed", "masked"], default="masked", 
+                        help="How episodes of different lengths are batched for training: packed sequences, or padded sequences with a length mask on the loss.")
+    parser.add_argument("--shared_mem_n_buckets", type=int, default=1, 
+                        help="In masked mode, number of buckets of episodes of similar lengths, each padded to its longest episode.")
 
     # MA_GYM parameters
     parser.add_argument("--magym_n_agents", type=int, default=4)
@@ -60,7 +60,8 @@ def run():
     last_save_step = 0
     last_eval_step = 0
     obs = envs.reset()
-    parsed_obs = parser.get_perfect_messages(obs)
+    parsed_obs = parser.get_perfect_message_ids(
+        obs, model.lang_learner.word_encoder)
     model.init_episode(obs, parsed_obs)
     n_steps_per_update = cfg.n_parallel_envs * cfg.rollout_length
     for s_i in trange(0, cfg.n_steps, n_steps_per_update, ncols=0):
@@ -84,7 +85,8 @@ def run():
                 s_i + ep_s_i * cfg.n_parallel_envs, comm_rewards)
 
             # Insert data into policy buffer
-            parsed_obs = parser.get_perfect_messages(obs)
+            parsed_obs = parser.get_perfect_message_ids(
+                obs, model.lang_learner.word_encoder)
             model.store_exp(obs, parsed_obs, rewards, dones)
 
         # Training
@@ -80,16 +80,33 @@ class LanguageLearner:
         context_batch = self.lang_encoder(sentence_batch).squeeze(0)
         return context_batch
 
+    def encode_padded_sentences(self, sentence_batch, lengths):
+        """ 
+        Encode a batch of padded sentences. 
+        :param sentence_batch (np.ndarray): Batch of encoded sentences, 
+            padded, dim=(batch_size, max_sent_len).
+        :param lengths (np.ndarray): Length of each sentence, 
+            dim=(batch_size,).
+
+        :return context_batch (torch.Tensor): Batch of context vectors, 
+            dim=(batch_size, context_dim).
+        """
+        context_batch = self.lang_encoder.forward_padded(
+            torch.from_numpy(sentence_batch), 
+            torch.from_numpy(lengths)).squeeze(0)
+        return context_batch
+
     def generate_sentences(self, context_batch):
         """ 
         Generate sentences from a batch of context vectors. 
         :param context_batch (np.ndarray): Batch of context vectors,
             dim=(batch_size, context_dim).
         
-        :return gen_sent_batch (list(list(str))): Batch of generated sentences.
+        :return gen_sent_batch (np.ndarray): Batch of generated sentences,
+            dim=(1, batch_size, sent_len).
         """
         context_batch = torch.from_numpy(context_batch).to(self.device)
-        _, sentences = self.decoder(context_batch)
+        sentences = self.decoder.generate(context_batch)
         return sentences
 
     def get_save_dict(self):
@@ -22,6 +22,8 @@ class OneHotEncoder:
             :param vocab (list): List of tokens that can appear in the language
         """
         self.tokens = ["<SOS>", "<EOS>"] + vocab
+        # Lookup table from tokens to their index
+        self.token_ids = {t: i for i, t in enumerate(self.tokens)}
         self.enc_dim = len(self.tokens)
         self.token_encodings = np.eye(self.enc_dim)
         self.max_message_len = max_message_len + 1
@@ -69,14 +71,14 @@ class OneHotEncoder:
             :param onehots (list): List of one-hot encodings
         """
         onehots = [
-            self.token_encodings[self.tokens.index(t)] 
+            self.token_encodings[self.token_ids[t]] 
             for t in sentence
         ]
         return onehots
 
     def get_ids(self, sentence):
         ids = [
-            self.tokens.index(t) 
+            self.token_ids[t] 
             for t in sentence]
         return ids
 
@@ -128,6 +130,82 @@ class OneHotEncoder:
         
         return all_encoded, all_broadcasts
 
+    def encode_id_messages(self, id_messages):
+        """
+        Pads messages of a rollout step already made of token ids, and builds
+        the broadcasts, like encode_rollout_step with pad=True.
+        Inputs:
+            :param id_messages (list): For each rollout environment, list of
+                n_agents messages, each a sequence of token ids.
+        Outputs:
+            :param all_encoded (np.ndarray): Padded messages ending with
+                EOS_ID, dim=(n_rollout_envs, n_agents, max_message_len).
+            :param all_broadcasts (list): Encoded broadcasts (concatenated
+                messages), not padded.
+        """
+        n_envs = len(id_messages)
+        n_agents = len(id_messages[0])
+        messages = [m for env_messages in id_messages for m in env_messages]
+        lengths = np.array([len(m) for m in messages])
+        # Write tokens and EOS of all messages at once, rest is padding
+        all_encoded = np.zeros(
+            (len(messages), self.max_message_len), dtype=int)
+        token_mask = np.arange(self.max_message_len) < lengths[:, None]
+        all_encoded[token_mask] = [t_id for m in messages for t_id in m]
+        all_encoded[np.arange(len(messages)), lengths] = self.EOS_ID
+        all_encoded = all_encoded.reshape(
+            n_envs, n_agents, self.max_message_len)
+
+        broadcasts, br_lengths = self.build_broadcasts(all_encoded)
+        all_broadcasts = []
+        for env_broadcast, br_len in zip(broadcasts, br_lengths):
+            all_broadcasts.append([env_broadcast[:br_len].tolist()] * n_agents)
+        return all_encoded, all_broadcasts
+
+    def pad_ids(self, ids_batch):
+        """
+        Pads a batch of sentences made of token ids with 0.
+        Inputs:
+            :param ids_batch (list): List of sentences, each a sequence of 
+                token ids.
+        Outputs:
+            :param padded (np.ndarray): Padded sentences, dim=(batch_size, 
+                max_sent_len).
+            :param lengths (np.ndarray): Length of each sentence, 
+                dim=(batch_size,).
+        """
+        lengths = np.array([len(s) for s in ids_batch], dtype=np.int64)
+        padded = np.zeros((len(ids_batch), lengths.max()), dtype=np.int64)
+        token_mask = np.arange(lengths.max()) < lengths[:, None]
+        padded[token_mask] = [t_id for s in ids_batch for t_id in s]
+        return padded, lengths
+
+    def build_broadcasts(self, messages):
+        """
+        Concatenates the messages of all agents of each environment into one
+        broadcast ending with EOS_ID. Each message is cut at its first EOS_ID 
+        (or kept whole if it has none).
+        Inputs:
+            :param messages (np.ndarray): Messages made of token ids, 
+                dim=(n_envs, n_agents, message_len).
+        Outputs:
+            :param broadcasts (np.ndarray): Broadcasts padded with 0, 
+                dim=(n_envs, max_broadcast_len).
+            :param lengths (np.ndarray): Length of each broadcast, with its 
+                EOS_ID, dim=(n_envs,).
+        """
+        n_envs = messages.shape[0]
+        # Tokens before the first EOS of each message, in broadcast order
+        token_mask = (np.cumsum(messages == self.EOS_ID, axis=-1) == 0)
+        token_mask = token_mask.reshape(n_envs, -1)
+        lengths = token_mask.sum(-1) + 1
+        broadcasts = np.zeros((n_envs, lengths.max()), dtype=np.int64)
+        # Kept tokens fill the start of each broadcast, in the same order
+        broadcasts[np.arange(lengths.max()) < lengths[:, None] - 1] = \
+            messages.reshape(n_envs, -1)[token_mask]
+        broadcasts[np.arange(n_envs), lengths - 1] = self.EOS_ID
+        return broadcasts, lengths
+
     def ids_to_onehots(self, ids_batch):
         if type(ids_batch) is list:
             onehots = [
@@ -208,51 +286,50 @@ class GRUEncoder(nn.Module):
         Inputs:
             :param enc_sent_batch (list(list(int))): Batch of encoded sentences.
         Outputs:
-            :param unsorted_hstates (torch.Tensor): Final hidden states
+            :param hidden_states (torch.Tensor): Final hidden states
                 corresponding to each given sentence, dim=(1, batch_size, 
                 context_dim)
         """
-        # Get order of sententes sorted by length decreasing
-        ids = sorted(
-            range(len(enc_sent_batch)), 
-            key=lambda x: len(enc_sent_batch[x]), 
-            reverse=True)
+        token_ids, lengths = self.word_encoder.pad_ids(enc_sent_batch)
+        return self.forward_padded(
+            torch.from_numpy(token_ids), torch.from_numpy(lengths))
+
+    def forward_padded(self, token_ids, lengths):
+        """
+        Transforms padded sentences into embeddings, with all sentences of 
+        the batch embedded and passed in the GRU at once.
+        Inputs:
+            :param token_ids (torch.Tensor): Batch of sentences made of token 
+                ids, padded, dim=(batch_size, max_sent_len).
+            :param lengths (torch.Tensor): Length of each sentence, 
+                dim=(batch_size,).
+        Outputs:
+            :param hidden_states (torch.Tensor): Final hidden states
+                corresponding to each given sentence, dim=(1, batch_size, 
+                context_dim)
+        """
+        token_ids = token_ids.long().to(self.device)
 
-        # Sort the sentences by length
-        sorted_list = [enc_sent_batch[i] for i in ids]
-        
         # Embed
         if self.do_embed:
-            # enc_ids_batch = [s.argmax(-1) for s in sorted_list]
-            model_input = [
-                self.embed_layer(torch.from_numpy(
-                    np.array(s)).to(self.device)) 
-                for s in sorted_list]
+            model_input = self.embed_layer(token_ids)
         else:
-            model_input = [
-                torch.Tensor(self.word_encoder.ids_to_onehots(s))
-                for s in sorted_list]
+            model_input = nn.functional.one_hot(
+                token_ids, self.word_encoder.enc_dim).float()
 
-        # Pad sentences
-        padded = nn.utils.rnn.pad_sequence(model_input, batch_first=True)
-
-        # Pack padded sentences (to not care about padded tokens)
-        lens = [len(s) for s in sorted_list]
+        # Pack padded sentences (to not care about padded tokens), the GRU 
+        # returns final hidden states in the order of the batch
         packed = nn.utils.rnn.pack_padded_sequence(
-            padded, lens, batch_first=True).to(self.device)
+            model_input, lengths.cpu(), batch_first=True, enforce_sorted=False)
 
         # Initial hidden state
-        hidden = torch.zeros(1, len(enc_sent_batch), self.hidden_dim, 
+        hidden = torch.zeros(1, token_ids.shape[0], self.hidden_dim, 
                         device=self.device)
         
         # Pass sentences into GRU model
         _, hidden_states = self.gru(packed, hidden)
 
-        # Re-order hidden states
-        unsorted_hstates = torch.zeros_like(hidden_states).to(self.device)
-        unsorted_hstates[0,ids,:] = hidden_states[0,:,:]
-
-        return self.norm(self.out(unsorted_hstates))
+        return self.norm(self.out(hidden_states))
 
     def get_params(self):
         return {'gru': self.gru.state_dict(),
@@ -384,6 +461,54 @@ class GRUDecoder(nn.Module):
 
         return decoder_outputs, sentences
 
+    @torch.no_grad()
+    def generate(self, context_batch):
+        """
+        Generates sentences from context vectors with greedy sampling. Tokens
+        are written on device in a preallocated buffer and finished sentences
+        are removed from the GRU batch, so only the unfinished ones are 
+        computed at each step. Sentences are sent to the host once at the end.
+        Inputs:
+            :param context_batch (torch.Tensor): Batch of context vectors,
+                dim=(batch_size, context_dim).
+        Outputs:
+            :param sentences (np.ndarray): Sentences generated, padded with 0 
+                after their EOS token, dim=(1, batch_size, sent_len).
+        """
+        batch_size = context_batch.size(0)
+        sentences = torch.zeros(
+            (batch_size, self.max_len), dtype=torch.long, device=self.device)
+
+        hidden = context_batch.unsqueeze(0)
+        # Init last token to the SOS token, embedded
+        last_tokens = self.embed_layer(
+            torch.zeros((1, batch_size), dtype=torch.long, device=self.device))
+
+        # Index in the batch of sentences not finished yet
+        active_ids = torch.arange(batch_size, device=self.device)
+        sent_len = 0
+        for t_i in range(self.max_len):
+            # RNN pass on unfinished sentences
+            outputs, hidden = self.forward_step(last_tokens, hidden)
+            _, topi = outputs.topk(1)
+            next_tokens = topi.squeeze(-1)
+            sentences[active_ids, t_i] = next_tokens[0]
+            sent_len = t_i + 1
+
+            # Remove finished sentences from the batch
+            running = next_tokens[0] != self.word_encoder.EOS_ID
+            if not running.all():
+                active_ids = active_ids[running]
+                if len(active_ids) == 0:
+                    break
+                hidden = hidden[:, running]
+                next_tokens = next_tokens[:, running]
+
+            # Set next decoder input
+            last_tokens = self.embed_layer(next_tokens)
+
+        return sentences[:, :sent_len].unsqueeze(0).cpu().numpy()
+
     # def forward(self, context_batch, target_encs=None):
     #     """
     #     Transforms context vectors to sentences
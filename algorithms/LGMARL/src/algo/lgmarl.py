@@ -180,14 +180,20 @@ class LanguageGroundedMARL:
         :param obs: (np.ndarray) Observations for each agent, 
             dim=(n_envs, n_agents, obs_dim).
         :param perf_messages: (list(list(list(str)))) Sentences parsed from 
-            observations, dim=(n_envs, n_agents, len(sentence)).
+            observations, dim=(n_envs, n_agents, len(sentence)), or tuple of 
+            already encoded messages and broadcasts (as returned by 
+            Parser.get_perfect_message_ids).
         """
         # Get inputs for the model
         policy_input, critic_input = self._make_acc_inputs(obs)
 
         # Encode sentences and build broadcast
-        enc_perf_mess, enc_perf_br \
-            = self.lang_learner.word_encoder.encode_rollout_step(perf_messages)
+        if type(perf_messages) is tuple:
+            enc_perf_mess, enc_perf_br = perf_messages
+        else:
+            enc_perf_mess, enc_perf_br = \
+                self.lang_learner.word_encoder.encode_rollout_step(
+                    perf_messages)
 
         # perf_broadcast = []
         # for env_pm in perf_messages:
@@ -272,8 +278,9 @@ class LanguageGroundedMARL:
 
         :return actions (np.ndarray): Actions for each agent, 
             dim=(n_envs, n_agents, 1).
-        :return broadcasts (list(list(str))): List of broadcasted messages for
-            each parallel environment.
+        :return broadcasts (np.ndarray or list(list(int))): Broadcasted 
+            messages for each parallel environment, padded with 0 for 
+            comm_type=language.
         :return agent_messages: (list(list(str))): Messages generated by each 
             agent.
         """
@@ -295,26 +302,27 @@ class LanguageGroundedMARL:
             self.gen_comm = np.random.random(
                 (self.n_envs, self.n_agents, 1)) > self.comm_eps.value
 
+            # Replace messages by perfect messages if not gen_comm, messages
+            # are padded with EOS to the same length
+            mess_len = max(
+                messages_by_env.shape[-1], perfect_messages.shape[-1])
+            word_encoder = self.lang_learner.word_encoder
+            gen_messages = np.pad(
+                messages_by_env, 
+                ((0, 0), (0, 0), (0, mess_len - messages_by_env.shape[-1])),
+                constant_values=word_encoder.EOS_ID)
+            perf_messages = np.pad(
+                perfect_messages, 
+                ((0, 0), (0, 0), (0, mess_len - perfect_messages.shape[-1])),
+                constant_values=word_encoder.EOS_ID)
+            messages = np.where(self.gen_comm, gen_messages, perf_messages)
+
             # Build broadcasts
-            broadcasts = []
-            for e_i in range(self.n_envs):
-                env_br = []
-                for a_i in range(self.n_agents):
-                    # Replace message by perfect message if not gen_comm
-                    if self.gen_comm[e_i, a_i, 0]:
-                        agent_m = messages_by_env[e_i, a_i]
-                    else:
-                        agent_m = perfect_messages[e_i, a_i]
-
-                    # De-pad message and add to broadcast
-                    end_i = (np.concatenate((agent_m, [1])) == 1).argmax()
-                    env_br.extend(agent_m[:end_i])
-                env_br.append(1)
-                broadcasts.append(env_br)
+            broadcasts, br_lengths = word_encoder.build_broadcasts(messages)
 
             # Get lang contexts
-            self.lang_contexts = self.lang_learner.encode_sentences(
-                broadcasts).cpu().numpy()
+            self.lang_contexts = self.lang_learner.encode_padded_sentences(
+                broadcasts, br_lengths).cpu().numpy()
 
         elif self.comm_type == "perfect_comm":
             messages_by_env = perfect_messages
@@ -2,6 +2,7 @@ import torch
 import numpy as np
 
 from src.log.comm_logs import CommunicationLogger
+from .gae import compute_gae
 
 
 def _flatten(T, N, x):
@@ -15,37 +16,101 @@ def _cast(x):
 
 class MessageSampler():
 
-    def __init__(self):
-        self.observed_messages = {}
+    # FNV-1a 64-bit hash constants
+    HASH_OFFSET = np.uint64(14695981039346656037)
+    HASH_PRIME = np.uint64(1099511628211)
+
+    def __init__(self, max_messages=100000, count_decay=1.0):
+        """
+        Counts occurrences of messages, to sample rare messages more often 
+        during language training. Messages (padded rows of token ids) are 
+        identified by a 64-bit hash of their token ids, and counts are kept 
+        in NumPy arrays sorted by hash, so whole batches of messages are 
+        counted and looked up at once.
+        :param max_messages: (int) maximum number of distinct messages 
+            counted, the least frequent ones are evicted beyond that.
+        :param count_decay: (float) factor applied to all counts each time 
+            messages are added, 1.0 for no decay.
+        """
+        self.max_messages = max_messages
+        self.count_decay = count_decay
+        self.mess_keys = np.zeros(0, dtype=np.uint64)
+        self.mess_counts = np.zeros(0, dtype=np.float64)
         self.n_messages = 0
 
+    def hash_messages(self, messages):
+        """
+        Hash messages with FNV-1a over their token ids.
+        :param messages: (np.ndarray) token ids, dim=(..., max_message_len).
+
+        :return keys: (np.ndarray) message hashes, dim=(...).
+        """
+        tokens = messages.astype(np.uint64)
+        keys = np.full(messages.shape[:-1], self.HASH_OFFSET, dtype=np.uint64)
+        for t_i in range(messages.shape[-1]):
+            keys ^= tokens[..., t_i]
+            keys *= self.HASH_PRIME
+        return keys
+
+    def _find(self, keys):
+        """
+        Find the position of keys in the count table.
+        :param keys: (np.ndarray) message hashes.
+
+        :return pos: (np.ndarray) position of each key in the table.
+        :return found: (np.ndarray) whether each key is in the table.
+        """
+        pos = np.searchsorted(self.mess_keys, keys)
+        if len(self.mess_keys) == 0:
+            return pos, np.zeros(keys.shape, dtype=bool)
+        pos = np.minimum(pos, len(self.mess_keys) - 1)
+        return pos, self.mess_keys[pos] == keys
+
     def add_messages(self, messages):
         messages = messages.reshape(-1, messages.shape[-1])
-        for mess in messages:
-            # key = mess.tobytes()
-            key = str(mess)
-            if key in self.observed_messages:
-                self.observed_messages[key] += 1
-            else:
-                self.observed_messages[key] = 1
-            self.n_messages += 1
+        keys, counts = np.unique(
+            self.hash_messages(messages), return_counts=True)
+        if self.count_decay != 1.0:
+            self.mess_counts *= self.count_decay
+            self.n_messages *= self.count_decay
+        self.n_messages += len(messages)
+
+        pos, found = self._find(keys)
+        self.mess_counts[pos[found]] += counts[found]
+        if not found.all():
+            # Insert new messages, keeping the table sorted
+            self.mess_keys = np.concatenate((self.mess_keys, keys[~found]))
+            self.mess_counts = np.concatenate(
+                (self.mess_counts, counts[~found]))
+            order = np.argsort(self.mess_keys)
+            self.mess_keys = self.mess_keys[order]
+            self.mess_counts = self.mess_counts[order]
+            # Evict least frequent messages
+            if len(self.mess_keys) > self.max_messages:
+                keep = np.sort(np.argpartition(
+                    -self.mess_counts, self.max_messages)[:self.max_messages])
+                self.mess_keys = self.mess_keys[keep]
+                self.mess_counts = self.mess_counts[keep]
 
     def get_message_probs(self, message_batch):
-        batch_size = message_batch.shape[0]
+        """
+        Get the probabilities of sampling each message of a batch, higher 
+        for rarer messages.
+        :param message_batch: (np.ndarray) messages, dim=(batch_size, 
+            [n_agents], max_message_len).
 
+        :return probs: (np.ndarray) sampling probabilities, summing to one 
+            over the batch dimension, dim=(batch_size, [n_agents]).
+        """
         # Get number of occurence of each message
-        n_occs = np.zeros(batch_size)
-        for m_i, mess in enumerate(message_batch):
-            # key = mess.tobytes()
-            key = str(mess)
-            if key in self.observed_messages:
-                n_occs[m_i] = self.observed_messages[key]
-            else:
-                n_occs[m_i] = 1 / self.n_messages
+        pos, found = self._find(self.hash_messages(message_batch))
+        n_occs = np.full(found.shape, 1 / self.n_messages)
+        n_occs[found] = self.mess_counts[pos[found]]
         
         # Compute probalities
         probs = 1 / n_occs
-        probs = np.exp(probs) / np.exp(probs).sum()
+        probs = np.exp(probs - probs.max(axis=0))
+        probs = probs / probs.sum(axis=0)
 
         return probs
 
@@ -73,7 +138,8 @@ class ACC_ReplayBuffer:
         self.share_params = args.share_params
 
         self.lang_imp_sample = args.lang_imp_sample
-        self.message_sampler = MessageSampler()
+        self.message_sampler = MessageSampler(
+            args.lang_imp_sample_max_messages, args.lang_imp_sample_decay)
 
         self.policy_input = np.zeros(
             (self.rollout_length + 1, 
@@ -259,36 +325,26 @@ class ACC_ReplayBuffer:
         self.act_value_preds[-1] = next_act_value
         self.comm_value_preds[-1] = next_comm_value
 
-        act_gae = 0
-        comm_gae = 0
-        for step in reversed(range(self.act_rewards.shape[0])):
-            delta = self.act_rewards[step] + self.gamma \
-                * act_value_normalizer.denormalize(
-                    self.act_value_preds[step + 1]) * self.masks[step + 1] \
-                    - act_value_normalizer.denormalize(self.act_value_preds[step])
-            act_gae = delta + self.gamma * self.gae_lambda * self.masks[step + 1] \
-                * act_gae
-            self.act_returns[step] = act_gae + act_value_normalizer.denormalize(
-                self.act_value_preds[step])
-
-            delta = self.comm_rewards[step] + self.gamma \
-                * comm_value_normalizer.denormalize(
-                    self.comm_value_preds[step + 1]) * self.masks[step + 1] \
-                    - comm_value_normalizer.denormalize(self.comm_value_preds[step])
-            comm_gae = delta + self.gamma * self.gae_lambda * self.masks[step + 1] \
-                * comm_gae
-            self.comm_returns[step] = comm_gae + comm_value_normalizer.denormalize(
-                self.comm_value_preds[step])   
+        # Value predictions are denormalized once for the whole rollout
+        compute_gae(
+            self.act_rewards, 
+            act_value_normalizer.denormalize(self.act_value_preds), 
+            self.masks, 
+            self.gamma, 
+            self.gae_lambda, 
+            returns=self.act_returns)
+        compute_gae(
+            self.comm_rewards, 
+            comm_value_normalizer.denormalize(self.comm_value_preds), 
+            self.masks, 
+            self.gamma, 
+            self.gae_lambda, 
+            returns=self.comm_returns)
 
     def _get_mess_sampl_probs(self, messages):
-        if len(messages.shape) == 3:
-            probs = np.zeros(messages.shape[:-1])
-            for a_i in range(self.n_agents):
-                probs[:, a_i] = self.message_sampler.get_message_probs(messages[:, a_i])
-            probs = probs.reshape(messages.shape[0], self.n_agents)
-        else:
-            probs = self.message_sampler.get_message_probs(messages)
-        return probs
+        # Probabilities over the batch, separately for each agent if 
+        # messages are not flattened over agents
+        return self.message_sampler.get_message_probs(messages)
 
     def recurrent_policy_generator(self, act_advt, comm_advt):
         """
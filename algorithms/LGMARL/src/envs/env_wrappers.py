@@ -3,7 +3,8 @@ Modified from OpenAI Baselines code to work with multi-agent envs
 """
 import numpy as np
 import torch
-from multiprocessing import Process, Pipe
+from multiprocessing import Process, Pipe, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 from abc import ABC, abstractmethod
 
 def tile_images(img_nhwc):
@@ -159,33 +160,61 @@ class ShareVecEnv(ABC):
 
 def worker(remote, parent_remote, env_fn_wrapper):
     parent_remote.close()
-    env = env_fn_wrapper.x()
+    # Each worker steps a slice of the envs
+    envs = [env_fn() for env_fn in env_fn_wrapper.x]
+    env = envs[0]
+    # Views on this worker's rows of the shared memory arrays, if used
+    shm_arrays = None
     while True:
         cmd, data = remote.recv()
         if cmd == 'step':
-            ob, reward, done, info = env.step(data)
-            if 'bool' in done.__class__.__name__:
-                if done:
-                    ob = env.reset()
+            results = []
+            for env, action in zip(envs, data):
+                ob, reward, done, info = env.step(action)
+                if 'bool' in done.__class__.__name__:
+                    if done:
+                        ob = env.reset()
+                else:
+                    if np.all(done):
+                        ob = env.reset()
+                results.append((ob, reward, done, info))
+            obs, rews, dones, infos = zip(*results)
+
+            if shm_arrays is None:
+                remote.send(
+                    (np.stack(obs), np.stack(rews), np.stack(dones), infos))
             else:
-                if np.all(done):
-                    ob = env.reset()
-
-            remote.send((ob, reward, done, info))
+                shm_arrays[0][:] = obs
+                shm_arrays[1][:] = rews
+                shm_arrays[2][:] = dones
+                remote.send(infos)
         elif cmd == 'reset':
-            ob = env.reset()
-            remote.send((ob))
+            obs = [env.reset() for env in envs]
+            if shm_arrays is None:
+                remote.send(np.stack(obs))
+            else:
+                shm_arrays[0][:] = obs
+                remote.send(None)
+        elif cmd == 'attach_shm':
+            specs, env_slice = data
+            shms = [SharedMemory(name=name) for name, _, _ in specs]
+            shm_arrays = [
+                np.ndarray(shape, dtype=dtype, buffer=shm.buf)[env_slice]
+                for shm, (_, shape, dtype) in zip(shms, specs)]
+            remote.send(None)
         elif cmd == 'render':
             if data == "rgb_array":
-                fr = env.render(mode=data)
-                remote.send(fr)
+                fr = [env.render(mode=data) for env in envs]
+                remote.send(np.stack(fr))
             elif data == "human":
-                env.render(mode=data)
+                for env in envs:
+                    env.render(mode=data)
         elif cmd == 'reset_task':
-            ob = env.reset_task()
-            remote.send(ob)
+            ob = [env.reset_task() for env in envs]
+            remote.send(np.stack(ob))
         elif cmd == 'close':
-            env.close()
+            for env in envs:
+                env.close()
             remote.close()
             break
         elif cmd == 'get_spaces':
@@ -195,16 +224,32 @@ def worker(remote, parent_remote, env_fn_wrapper):
 
 
 class SubprocVecEnv(ShareVecEnv):
-    def __init__(self, env_fns, spaces=None):
+    def __init__(self, env_fns, spaces=None, shared_memory=False, 
+                 envs_per_worker=1):
         """
         envs: list of gym environments to run in subprocesses
+        shared_memory: if True, workers write observations, rewards and dones
+            in shared memory arrays and only infos are sent through the pipes.
+            step_wait and reset then return views on these arrays, which are
+            overwritten by the next call: copy them to keep them around.
+        envs_per_worker: number of envs stepped sequentially by each worker
+            process, the last worker may get less.
         """
         self.waiting = False
         self.closed = False
         nenvs = len(env_fns)
-        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(nenvs)])
-        self.ps = [Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
-                   for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
+        # Slices of envs handled by each worker
+        self.env_slices = [
+            slice(i, min(i + envs_per_worker, nenvs)) 
+            for i in range(0, nenvs, envs_per_worker)]
+        nworkers = len(self.env_slices)
+        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(nworkers)])
+        self.ps = [Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fns[env_slice])))
+                   for (work_remote, remote, env_slice) in zip(self.work_remotes, self.remotes, self.env_slices)]
+        if shared_memory:
+            # Workers must share our resource tracker, otherwise each of them
+            # unlinks the shared memory when exiting
+            resource_tracker.ensure_running()
         for p in self.ps:
             p.daemon = True  # if the main process crashes, we should not cause things to hang
             p.start()
@@ -216,27 +261,60 @@ class SubprocVecEnv(ShareVecEnv):
         ShareVecEnv.__init__(self, 
             len(env_fns), n_agents, observation_space, shared_observation_space, action_space)
 
+        self.shms = []
+        if shared_memory:
+            self._init_shared_memory()
+
+    def _init_shared_memory(self):
+        obs_dim = self.observation_space[0].shape[0]
+        assert all(
+            space.shape[0] == obs_dim for space in self.observation_space), \
+            "Shared memory transport requires equal observation dims."
+        specs = []
+        arrays = []
+        for shape, dtype in [
+                ((self.num_envs, self.n_agents, obs_dim), np.float32),
+                ((self.num_envs, self.n_agents), np.float32),
+                ((self.num_envs, self.n_agents), np.bool_)]:
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            shm = SharedMemory(create=True, size=nbytes)
+            self.shms.append(shm)
+            specs.append((shm.name, shape, dtype))
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+        self.obs_buf, self.rews_buf, self.dones_buf = arrays
+        for env_slice, remote in zip(self.env_slices, self.remotes):
+            remote.send(('attach_shm', (specs, env_slice)))
+        for remote in self.remotes:
+            remote.recv()
+
     def step_async(self, actions):
-        for remote, action in zip(self.remotes, actions):
-            remote.send(('step', action))
+        for remote, env_slice in zip(self.remotes, self.env_slices):
+            remote.send(('step', actions[env_slice]))
         self.waiting = True
 
     def step_wait(self):
         results = [remote.recv() for remote in self.remotes]
         self.waiting = False
+        if len(self.shms) > 0:
+            infos = sum(results, ())
+            return self.obs_buf, self.rews_buf, self.dones_buf, infos
         obs, rews, dones, infos = zip(*results)
-        return np.stack(obs), np.stack(rews), np.stack(dones), infos
+        return np.concatenate(obs), np.concatenate(rews), \
+            np.concatenate(dones), sum(infos, ())
 
     def reset(self):
         for remote in self.remotes:
             remote.send(('reset', None))
         obs = [remote.recv() for remote in self.remotes]
-        return np.stack(obs)
+        if len(self.shms) > 0:
+            return self.obs_buf
+        return np.concatenate(obs)
+
 
     def reset_task(self):
         for remote in self.remotes:
             remote.send(('reset_task', None))
-        return np.stack([remote.recv() for remote in self.remotes])
+        return np.concatenate([remote.recv() for remote in self.remotes])
 
     def close(self):
         if self.closed:
@@ -248,6 +326,11 @@ class SubprocVecEnv(ShareVecEnv):
             remote.send(('close', None))
         for p in self.ps:
             p.join()
+        # Release our views before freeing the shared memory
+        self.obs_buf = self.rews_buf = self.dones_buf = None
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
         self.closed = True
 
     def render(self, mode="rgb_array"):
@@ -255,7 +338,7 @@ class SubprocVecEnv(ShareVecEnv):
             remote.send(('render', mode))
         if mode == "rgb_array":   
             frame = [remote.recv() for remote in self.remotes]
-            return np.stack(frame)
+            return np.concatenate(frame)
 
 
 # single env
@@ -301,3 +384,4 @@ class DummyVecEnv(ShareVecEnv):
                 env.render(mode=mode)
         else:
             raise NotImplementedError
+
@@ -1,10 +1,10 @@
 import copy
-import itertools
 import logging
 from typing import List, Tuple, Union
 
 import gym
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from PIL import ImageColor
 from gym import spaces
 from gym.utils import seeding
@@ -261,18 +261,23 @@ class Lumberjacks(gym.Env):
     def get_agent_obs(self) -> List[List[float]]:
         """Returns list of observations for each agent."""
         obs = np.zeros((self.n_agents, self._obs_len))
-        for i, (agent_id, agent) in enumerate(self._agent_generator()):
-            rel_pos = self._to_relative_coordinates(agent.pos)
-            obs[i, 0] = agent_id / self.n_agents  # Agent ID
-            obs[i, 1] = rel_pos[0] / (self._grid_shape[0] - 1)  # Coordinate
-            obs[i, 2] = rel_pos[1] / (self._grid_shape[1] - 1)  # Coordinate
-            obs[i, 3] = self._step_count / self._max_steps  # Steps
-
-            for j, (_, agent_strength, tree_strength) in zip(
-                    itertools.count(start=4, step=2),
-                    self._agent_view_generator(agent.pos, self._agent_view)):
-                obs[i, j] = agent_strength / self.n_agents
-                obs[i, j + 1] = tree_strength / self.n_agents
+        pos = np.array([agent.pos for agent in self._agents])
+        rel_pos = pos - np.array(self._agent_view)
+        obs[:, 0] = np.arange(self.n_agents) / self.n_agents  # Agent ID
+        obs[:, 1] = rel_pos[:, 0] / (self._grid_shape[0] - 1)  # Coordinate
+        obs[:, 2] = rel_pos[:, 1] / (self._grid_shape[1] - 1)  # Coordinate
+        obs[:, 3] = self._step_count / self._max_steps  # Steps
+
+        # Number of agents and tree strength in the view of each agent, read 
+        # from the windows of the padded maps starting at pos - agent_view
+        window_shape = tuple(2 * v + 1 for v in self._agent_view)
+        agent_views = sliding_window_view(
+            np.sum(self._agent_map, axis=2), window_shape)[
+                rel_pos[:, 0], rel_pos[:, 1]]
+        tree_views = sliding_window_view(self._tree_map, window_shape)[
+            rel_pos[:, 0], rel_pos[:, 1]]
+        obs[:, 4::2] = agent_views.reshape(self.n_agents, -1) / self.n_agents
+        obs[:, 5::2] = tree_views.reshape(self.n_agents, -1) / self.n_agents
 
         # Convert it from numpy array
         obs = obs.tolist()
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import numpy as np
 
 
@@ -11,7 +13,8 @@ class Parser():
 
     # vocab = ["Gem", "Yellow", "Green", "Purple", "Center", "North", "South", "East", "West"]
 
-    def __init__(self, env_size, obs_range, max_gems_in_message=2):
+    def __init__(self, env_size, obs_range, max_gems_in_message=2, 
+                 message_cache_size=100000):
         self.env_size = env_size
         self.obs_range = obs_range
 
@@ -26,8 +29,19 @@ class Parser():
             self.vocab.append("Close")
             self.max_message_len += max_gems_in_message
 
-    def _gen_perfect_message(self, agent_obs):
-        m = []
+        # LRU cache of the observed gems, with token ids of the sentence 
+        # describing each gem, keyed on observations
+        self._token_ids = None
+        self._get_cached_gem_ids = lru_cache(
+            maxsize=message_cache_size)(self._get_gem_ids)
+
+    def _get_gems(self, agent_obs):
+        """
+        Get observed gems.
+        :param agent_obs (np.ndarray): Observation of one agent.
+        :return gem_values (np.ndarray): Value of each observed gem.
+        :return gem_sents (list(list(str))): Sentence describing each gem.
+        """
         pos = agent_obs[:2]
         gem_map = np.array(
             agent_obs[2:]).reshape((self.obs_range, self.obs_range))
@@ -38,17 +52,8 @@ class Parser():
         gem_values = gem_map[np.nonzero(gem_map)]
         abs_gem_pos = pos + rel_gem_pos
 
-        # Permute and sort by decreasing gem value (permutation allows that 
-        # gems aren't always communicated from North-West to South-East)
-        perm_ids = np.random.permutation(len(gem_values))
-        sorted_ids = perm_ids[np.argsort(gem_values[perm_ids])][::-1]
-
-        # Take only the first few and permute again to not have better gems 
-        # always first in message
-        ids = np.random.permutation(
-            sorted_ids[:min(len(sorted_ids), self.max_gems_in_message)])
-        
-        for g_i in ids:
+        gem_sents = []
+        for g_i in range(len(gem_values)):
             color = GEM_COLORS[gem_values[g_i]]
             g = [color, "Gem"]
 
@@ -68,10 +73,41 @@ class Parser():
             if len(g) == 2:
                 g.append("Center")
 
-            m.extend(g)
+            gem_sents.append(g)
+
+        return gem_values, gem_sents
+
+    def _select_gems(self, gem_values):
+        """
+        Randomly select the gems to put in the message.
+        :param gem_values (np.ndarray): Value of each observed gem.
+        :return ids (np.ndarray): Indexes of the selected gems.
+        """
+        # Permute and sort by decreasing gem value (permutation allows that 
+        # gems aren't always communicated from North-West to South-East)
+        perm_ids = np.random.permutation(len(gem_values))
+        sorted_ids = perm_ids[np.argsort(gem_values[perm_ids])][::-1]
+
+        # Take only the first few and permute again to not have better gems 
+        # always first in message
+        ids = np.random.permutation(
+            sorted_ids[:min(len(sorted_ids), self.max_gems_in_message)])
+        return ids
+
+    def _gen_perfect_message(self, agent_obs):
+        m = []
+        gem_values, gem_sents = self._get_gems(agent_obs)
+        for g_i in self._select_gems(gem_values):
+            m.extend(gem_sents[g_i])
         
         return m
 
+    def _get_gem_ids(self, obs_bytes, obs_dtype):
+        agent_obs = np.frombuffer(obs_bytes, dtype=obs_dtype)
+        gem_values, gem_sents = self._get_gems(agent_obs)
+        gem_ids = [tuple(self._token_ids[t] for t in g) for g in gem_sents]
+        return gem_values, gem_ids
+
     def get_perfect_messages(self, obs):
         """
         Recurrent method for generating perfect messages corresponding to
@@ -84,4 +120,32 @@ class Parser():
             for a_i in range(obs.shape[1]):
                 env_out.append(self._gen_perfect_message(obs[e_i, a_i]))
             out.append(env_out)
-        return out
\ No newline at end of file
+        return out
+
+    def get_perfect_message_ids(self, obs_batch, word_encoder):
+        """
+        Generate perfect messages corresponding to given observations, 
+        directly as padded token ids. Gems of observations seen recently are 
+        taken from a cache, the selection of gems in messages stays random.
+        :param obs_batch (np.ndarray): Batch of observations, 
+            dim=(n_envs, n_agents, obs_dim).
+        :param word_encoder (OneHotEncoder): Encoder of the language.
+        :return all_encoded, all_broadcasts: Encoded messages and broadcasts,
+            as returned by OneHotEncoder.encode_rollout_step.
+        """
+        if word_encoder.token_ids is not self._token_ids:
+            self._token_ids = word_encoder.token_ids
+            self._get_cached_gem_ids.cache_clear()
+        obs_batch = np.ascontiguousarray(obs_batch)
+        id_messages = []
+        for env_obs in obs_batch:
+            env_messages = []
+            for agent_obs in env_obs:
+                gem_values, gem_ids = self._get_cached_gem_ids(
+                    agent_obs.tobytes(), obs_batch.dtype)
+                env_messages.append([
+                    t_id 
+                    for g_i in self._select_gems(gem_values) 
+                    for t_id in gem_ids[g_i]])
+            id_messages.append(env_messages)
+        return word_encoder.encode_id_messages(id_messages)
@@ -3,6 +3,7 @@ import logging
 
 import gym
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from PIL import ImageColor
 from gym import spaces
 from gym.utils import seeding
@@ -66,8 +67,24 @@ class Env(gym.Env):
             [grid_shape[0] // 2 , 1],
             [grid_shape[0] // 2 - 1, grid_shape[1] - 2]])
 
-        self._base_grid = self.__create_grid()  # with no agents
-        self._full_obs = self.__create_grid()
+        self._gem_color_ids = np.array(
+            [self.gem_colors[g_i] for g_i in range(self.n_gems)])
+
+        # Grids of cell types and of the index of the agent or gem in each 
+        # cell, padded on each side so that the view window and the 
+        # neighbours of any cell can be read without bounds checks
+        self._grid_pad = max(self._agent_view_mask[0] // 2, 2)
+        self._base_grid = self.__create_grid(pad=0)  # with no agents
+        self._padded_obs = self.__create_grid(pad=self._grid_pad)
+        self._padded_ids = np.zeros_like(self._padded_obs, dtype=np.int64)
+        # 1 in cells occupied by an agent
+        self._padded_agents = np.zeros_like(self._padded_obs)
+        # Cells inside the grid and view window of each of them
+        self._full_obs = self.__unpad(self._padded_obs)
+        self._full_ids = self.__unpad(self._padded_ids)
+        self._full_agents = self.__unpad(self._padded_agents)
+        self._view_windows = self.__get_view_windows(self._padded_obs)
+        self._id_windows = self.__get_view_windows(self._padded_ids)
 
         self._agent_dones = [False for _ in range(self.n_agents)]
         self.viewer = None
@@ -76,6 +93,8 @@ class Env(gym.Env):
         mask_size = np.prod(self._agent_view_mask)
         self._obs_high = np.ones(2 + mask_size, dtype=np.float32)
         self._obs_low = np.zeros(2 + mask_size, dtype=np.float32)
+        self._agent_obs_len = 2 + mask_size
+        self._pos_scale = np.array(self._grid_shape) - 1
         self.observation_space = MultiAgentObservationSpace(
             [spaces.Box(self._obs_low, self._obs_high) for _ in range(self.n_agents)])
 
@@ -101,12 +120,29 @@ class Env(gym.Env):
     def __draw_base_img(self):
         self._base_img = draw_grid(self._grid_shape[0], self._grid_shape[1], cell_size=CELL_SIZE, fill='white')
 
-    def __create_grid(self):
-        _grid = [[PRE_IDS['empty'] for _ in range(self._grid_shape[1])] for row in range(self._grid_shape[0])]
+    def __create_grid(self, pad):
+        _grid = np.full(
+            (self._grid_shape[0] + 2 * pad, self._grid_shape[1] + 2 * pad), 
+            PRE_IDS['empty'], dtype=np.int8)
         return _grid
 
+    def __unpad(self, padded_grid):
+        p = self._grid_pad
+        return padded_grid[p:p + self._grid_shape[0], p:p + self._grid_shape[1]]
+
+    def __get_view_windows(self, padded_grid):
+        # View window centered on each cell of the grid, 
+        # dim=(grid_rows, grid_cols, mask_rows, mask_cols)
+        obs_range = self._agent_view_mask[0] // 2
+        start = self._grid_pad - obs_range
+        windows = sliding_window_view(
+            padded_grid, (2 * obs_range + 1, 2 * obs_range + 1))
+        return windows[start:start + self._grid_shape[0], 
+                       start:start + self._grid_shape[1]]
+
     def __init_full_obs(self):
-        self._full_obs = self.__create_grid()
+        self._padded_obs.fill(PRE_IDS['empty'])
+        self._padded_agents.fill(0)
 
         for agent_i in range(self.n_agents):
             self.agent_pos[agent_i] = self._agent_init_pos[agent_i]
@@ -120,22 +156,15 @@ class Env(gym.Env):
         self.__draw_base_img()
 
     def get_agent_obs(self):
-        _obs = []
-        for agent_i in range(self.n_agents):
-            pos = self.agent_pos[agent_i]
-            _agent_i_obs = [pos[0] / (self._grid_shape[0] - 1), pos[1] / (self._grid_shape[1] - 1)]  # coordinates
+        pos = np.array([self.agent_pos[agent_i] for agent_i in range(self.n_agents)])
+        _obs = np.empty((self.n_agents, self._agent_obs_len))
+        _obs[:, :2] = pos / self._pos_scale  # coordinates
 
-            # check if gem is in the view area
-            _gem_pos = np.zeros(self._agent_view_mask)  # gem location in neighbour
-            obs_range = self._agent_view_mask[0] // 2
-            for row in range(max(0, pos[0] - obs_range), min(pos[0] + obs_range + 1, self._grid_shape[0])):
-                for col in range(max(0, pos[1] - obs_range), min(pos[1] + obs_range + 1, self._grid_shape[1])):
-                    if PRE_IDS['gem'] in self._full_obs[row][col]:
-                        _gem_pos[row - (pos[0] - obs_range), col - (pos[1] - obs_range)] = int(self._full_obs[row][col][-1]) # get relative position for the gem loc.
-
-            _agent_i_obs += _gem_pos.flatten().tolist()  # adding gem pos in observable area
-            _obs.append(_agent_i_obs)
-        return _obs
+        # gem colors in the view area of each agent
+        is_gem = self._view_windows[pos[:, 0], pos[:, 1]] == PRE_IDS['gem']
+        gem_colors = self._gem_color_ids[self._id_windows[pos[:, 0], pos[:, 1]]]
+        _obs[:, 2:] = (is_gem * gem_colors).reshape(self.n_agents, -1)
+        return _obs.tolist()
 
     def reset(self):
         self._total_episode_reward = [0 for _ in range(self.n_agents)]
@@ -151,13 +180,13 @@ class Env(gym.Env):
 
     def __wall_exists(self, pos):
         row, col = pos
-        return PRE_IDS['wall'] in self._base_grid[row, col]
+        return self._base_grid[row, col] == PRE_IDS['wall']
 
     def is_valid(self, pos):
         return (0 <= pos[0] < self._grid_shape[0]) and (0 <= pos[1] < self._grid_shape[1])
 
     def _is_cell_vacant(self, pos):
-        return self.is_valid(pos) and (self._full_obs[pos[0]][pos[1]] == PRE_IDS['empty'])
+        return self.is_valid(pos) and (self._full_obs[pos[0], pos[1]] == PRE_IDS['empty'])
 
     def __update_agent_pos(self, agent_i, move):
 
@@ -178,7 +207,8 @@ class Env(gym.Env):
 
         if next_pos is not None and self._is_cell_vacant(next_pos):
             self.agent_pos[agent_i] = next_pos
-            self._full_obs[curr_pos[0]][curr_pos[1]] = PRE_IDS['empty']
+            self._full_obs[curr_pos[0], curr_pos[1]] = PRE_IDS['empty']
+            self._full_agents[curr_pos[0], curr_pos[1]] = 0
             self.__update_agent_view(agent_i)
 
     def __next_pos(self, curr_pos, move):
@@ -195,32 +225,31 @@ class Env(gym.Env):
         return next_pos
 
     def __update_agent_view(self, agent_i):
-        self._full_obs[self.agent_pos[agent_i][0]][self.agent_pos[agent_i][1]] = PRE_IDS['agent'] + str(agent_i + 1)
+        self._full_obs[self.agent_pos[agent_i][0], self.agent_pos[agent_i][1]] = PRE_IDS['agent']
+        self._full_ids[self.agent_pos[agent_i][0], self.agent_pos[agent_i][1]] = agent_i
+        self._full_agents[self.agent_pos[agent_i][0], self.agent_pos[agent_i][1]] = 1
 
     def __update_gem_view(self, gem_i):
-        self._full_obs[self.gem_pos[gem_i][0]][self.gem_pos[gem_i][1]] = PRE_IDS['gem'] + str(self.gem_colors[gem_i])#str(gem_i + 1)
+        self._full_obs[self.gem_pos[gem_i][0], self.gem_pos[gem_i][1]] = PRE_IDS['gem']
+        self._full_ids[self.gem_pos[gem_i][0], self.gem_pos[gem_i][1]] = gem_i
 
     def _neighbour_agents(self, pos):
-        # check if agent is in neighbour
-        _count = 0
-        neighbours_xy = []
-        if self.is_valid([pos[0] + 1, pos[1]]) and PRE_IDS['agent'] in self._full_obs[pos[0] + 1][pos[1]]:
-            _count += 1
-            neighbours_xy.append([pos[0] + 1, pos[1]])
-        if self.is_valid([pos[0] - 1, pos[1]]) and PRE_IDS['agent'] in self._full_obs[pos[0] - 1][pos[1]]:
-            _count += 1
-            neighbours_xy.append([pos[0] - 1, pos[1]])
-        if self.is_valid([pos[0], pos[1] + 1]) and PRE_IDS['agent'] in self._full_obs[pos[0]][pos[1] + 1]:
-            _count += 1
-            neighbours_xy.append([pos[0], pos[1] + 1])
-        if self.is_valid([pos[0], pos[1] - 1]) and PRE_IDS['agent'] in self._full_obs[pos[0]][pos[1] - 1]:
-            neighbours_xy.append([pos[0], pos[1] - 1])
-            _count += 1
-
-        agent_id = []
-        for x, y in neighbours_xy:
-            agent_id.append(int(self._full_obs[x][y].split(PRE_IDS['agent'])[1]) - 1)
-        return _count, agent_id
+        # check if agent is in neighbour (down, up, right, left), cells 
+        # outside the grid are empty padding
+        rows = pos[0] + self._grid_pad + NEIGHBOUR_OFFSETS[:, 0]
+        cols = pos[1] + self._grid_pad + NEIGHBOUR_OFFSETS[:, 1]
+        is_agent = self._padded_obs[rows, cols] == PRE_IDS['agent']
+        agent_id = self._padded_ids[rows, cols][is_agent].tolist()
+        return len(agent_id), agent_id
+
+    def __neighbour_agent_count(self, pos):
+        # number of agents in neighbour, read without bounds checks thanks to
+        # the padding
+        row = pos[0] + self._grid_pad
+        col = pos[1] + self._grid_pad
+        agents = self._padded_agents
+        return agents[row + 1, col] + agents[row - 1, col] \
+            + agents[row, col + 1] + agents[row, col - 1]
 
     def step(self, agents_action):
         self._step_count += 1
@@ -232,13 +261,13 @@ class Env(gym.Env):
 
         for gem_i in range(self.n_gems):
             if self._gem_alive[gem_i]:
-                predator_neighbour_count, n_i = self._neighbour_agents(self.gem_pos[gem_i])
+                predator_neighbour_count = self.__neighbour_agent_count(self.gem_pos[gem_i])
 
                 if predator_neighbour_count > 0:
                     if predator_neighbour_count >= self.gem_colors[gem_i]:
                         _reward = GEM_REWARDS[self.gem_colors[gem_i]]
                         self._gem_alive[gem_i] = False
-                        self._full_obs[self.gem_pos[gem_i][0]][self.gem_pos[gem_i][1]] = PRE_IDS['empty']
+                        self._full_obs[self.gem_pos[gem_i][0], self.gem_pos[gem_i][1]] = PRE_IDS['empty']
                     else:
                         _reward = self._penalty
 
@@ -331,8 +360,11 @@ ACTION_MEANING = {
 }
 
 PRE_IDS = {
-    'agent': 'A',
-    'gem': 'G',
-    'wall': 'W',
-    'empty': '0'
+    'empty': 0,
+    'wall': 1,
+    'agent': 2,
+    'gem': 3,
 }
+
+# Neighbour cells: down, up, right, left
+NEIGHBOUR_OFFSETS = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import numpy as np
 
 
@@ -5,7 +7,7 @@ class Parser():
 
     # vocab = ["Prey", "Located", "Observed", "Center", "North", "South", "East", "West"]
 
-    def __init__(self, env_size, obs_range):
+    def __init__(self, env_size, obs_range, message_cache_size=100000):
         self.env_size = env_size
         self.obs_range = obs_range
 
@@ -18,6 +20,11 @@ class Parser():
             self.vocab.append("Close")
             self.max_message_len += 2
 
+        # LRU cache of perfect messages as token ids, keyed on observations
+        self._token_ids = None
+        self._get_cached_message_ids = lru_cache(
+            maxsize=message_cache_size)(self._get_message_ids)
+
     def parse_global_state(self, state):
         """
         Parse the global state of the environment to produce a complete textual
@@ -148,6 +155,32 @@ class Parser():
             out.append(env_out)
         return out
 
+    def _get_message_ids(self, obs_bytes, obs_dtype):
+        agent_obs = np.frombuffer(obs_bytes, dtype=obs_dtype)
+        return tuple(
+            self._token_ids[t] for t in self._gen_perfect_message(agent_obs))
+
+    def get_perfect_message_ids(self, obs_batch, word_encoder):
+        """
+        Generate perfect messages corresponding to given observations, 
+        directly as padded token ids. Messages of observations seen recently 
+        are taken from a cache.
+        :param obs_batch (np.ndarray): Batch of observations, 
+            dim=(n_envs, n_agents, obs_dim).
+        :param word_encoder (OneHotEncoder): Encoder of the language.
+        :return all_encoded, all_broadcasts: Encoded messages and broadcasts,
+            as returned by OneHotEncoder.encode_rollout_step.
+        """
+        if word_encoder.token_ids is not self._token_ids:
+            self._token_ids = word_encoder.token_ids
+            self._get_cached_message_ids.cache_clear()
+        obs_batch = np.ascontiguousarray(obs_batch)
+        id_messages = [
+            [self._get_cached_message_ids(agent_obs.tobytes(), obs_batch.dtype)
+             for agent_obs in env_obs]
+            for env_obs in obs_batch]
+        return word_encoder.encode_id_messages(id_messages)
+
     def check_obs(self, obs, sentence):
         if len(obs) > self.obs_dim:
             obs = obs[:self.obs_dim]
@@ -83,4 +83,6 @@ def make_env(cfg, n_threads, seed=None):
         return DummyVecEnv([get_env_fn(0)]), parser
     else:
         return SubprocVecEnv([
-            get_env_fn(i) for i in range(n_threads)]), parser
\ No newline at end of file
+            get_env_fn(i) for i in range(n_threads)], 
+            shared_memory=cfg.env_shared_memory,
+            envs_per_worker=cfg.envs_per_worker), parser
\ No newline at end of file
@@ -23,6 +23,10 @@ def get_config():
                         help="specify the names of environment and the task")
     parser.add_argument("--episode_length", type=int,
                         default=100, help="Max length for any episode")
+    parser.add_argument("--env_shared_memory", action="store_true", default=False,
+                        help="Return env steps through shared memory instead of pipes.")
+    parser.add_argument("--envs_per_worker", type=int, default=1,
+                        help="Number of envs stepped by each env worker process.")
 
     # replay buffer parameters
     parser.add_argument("--rollout_length", type=int,
@@ -96,6 +100,11 @@ def get_config():
                         help="Number of steps sampled in batch for CLIP training.")
     parser.add_argument("--lang_temp", type=float, default=1.0)
     parser.add_argument("--lang_imp_sample", default=False, action="store_true")
+    parser.add_argument("--lang_imp_sample_max_messages", type=int, 
+                        default=100000,
+                        help="Maximum number of distinct messages counted for importance sampling.")
+    parser.add_argument("--lang_imp_sample_decay", type=float, default=1.0,
+                        help="Decay of message counts at each step, 1.0 for no decay.")
 
     # Loss weights
     parser.add_argument("--dyna_weight_loss", default=False, action="store_true")
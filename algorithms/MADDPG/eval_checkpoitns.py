@@ -1,16 +1,59 @@
 import argparse
 import json
 import os
+import torch
 import pandas as pd
 
+from multiprocessing import Pool
+
 from maddpg import MADDPG
 from utils.make_env import make_env
-from algorithms.MADDPG.utils.rollouts import perform_eval_scenar
+from utils.rollouts import perform_eval_scenar_batched
+
+
+# Environments and model of the evaluation process, created once by init_eval
+eval_context = {}
+
+def init_eval(args, sce_conf, init_pos_scenars):
+    """
+    Creates the environments, one per initial position, and the model used
+    to evaluate checkpoints in the current process.
+    """
+    torch.set_num_threads(1)
+    eval_context["envs"] = [
+        make_env(args.env_path, discrete_action=args.discrete_action, 
+                 sce_conf=sce_conf)
+        for _ in range(len(init_pos_scenars))]
+    model_path = os.path.join(args.model_dir, "run1", "model.pt")
+    eval_context["model"] = MADDPG.init_from_save(model_path)
+    eval_context["init_pos_scenars"] = init_pos_scenars
+    eval_context["episode_length"] = args.episode_length
+
+def eval_checkpoint(cp):
+    """
+    Evaluates a checkpoint on all initial positions.
+    Inputs:
+        cp (str): Path of the checkpoint.
+    Outputs:
+        mean_return (float): Mean return of the episodes.
+        success_rate (float): Rate of successful episodes.
+        mean_ep_length (float): Mean length of the episodes.
+    """
+    maddpg = eval_context["model"]
+    # Load parameters in model
+    maddpg.load_cp(cp)
+    maddpg.prep_rollouts(device='cpu')
+    # Execute all episodes
+    return perform_eval_scenar_batched(
+        eval_context["envs"], 
+        maddpg, 
+        eval_context["init_pos_scenars"], 
+        eval_context["episode_length"])
 
 
 def run(args):
     output_file_path = os.path.join(args.model_dir, "eval_perfs.csv")
-    eval_perfs_df = pd.DataFrame(columns=["Training Eps", "Mean Return", "Success rate", "Mean Ep Length", "Name"])
+    eval_perfs_list = []
 
     # Load scenario config
     sce_conf_path = os.path.join(args.model_dir, "run1", "sce_config.json")
@@ -25,15 +68,6 @@ def run(args):
     with open(args.init_pos_file, 'r') as f:
         init_pos_scenars = json.load(f)
 
-    # Create environment
-    env = make_env(args.env_path, discrete_action=args.discrete_action, 
-                    sce_conf=sce_conf)
-
-    # Create model
-    model_path = os.path.join(args.model_dir, "run1", "model.pt")
-    maddpg = MADDPG.init_from_save(model_path)
-    maddpg.prep_rollouts(device='cpu')
-
     # Get list of run directories
     run_dirs = os.listdir(args.model_dir)
     # Clean
@@ -41,7 +75,8 @@ def run(args):
         if len(r) > 5:
             run_dirs.remove(r)
     
-    # Evaluate each run
+    # Get checkpoints of each run
+    eval_cps = []
     for run in run_dirs:
         run_dir = os.path.join(args.model_dir, run)
         print("\nEvaluating run", run_dir)
@@ -56,26 +91,34 @@ def run(args):
                 os.path.join(run_dir, "incremental", cp_list[i]))
         checkpoints_paths.append(os.path.join(run_dir, "model.pt"))
         
-        # Evaluate each checkpoint
         for cp_i, cp in enumerate(checkpoints_paths):
-            # Load parameters in model
-            maddpg.load_cp(cp)
-            maddpg.prep_rollouts(device='cpu')
-
-            # Execute all episodes
-            mean_return, success_rate, mean_ep_length = perform_eval_scenar(
-                env, maddpg, init_pos_scenars, args.episode_length)
-
-            # Save evaluation performance
-            eval_perfs = {
-                "Training Eps": cp_i * 10000,
-                "Mean Return": mean_return, 
-                "Success rate": success_rate,
-                "Mean Ep Length": mean_ep_length, 
-                "Name": args.model_dir.split('/')[-1]
-            }
-            eval_perfs_df = eval_perfs_df.append(eval_perfs, ignore_index=True)
+            eval_cps.append((cp_i, cp))
+
+    # Evaluate all checkpoints, distributed over the worker processes
+    cps = [cp for _, cp in eval_cps]
+    if args.n_workers > 1:
+        with Pool(args.n_workers, initializer=init_eval, 
+                  initargs=(args, sce_conf, init_pos_scenars)) as pool:
+            results = pool.map(eval_checkpoint, cps)
+    else:
+        init_eval(args, sce_conf, init_pos_scenars)
+        results = [eval_checkpoint(cp) for cp in cps]
+
+    # Save evaluation performance
+    for (cp_i, _), (mean_return, success_rate, mean_ep_length) in zip(
+            eval_cps, results):
+        eval_perfs = {
+            "Training Eps": cp_i * 10000,
+            "Mean Return": mean_return, 
+            "Success rate": success_rate,
+            "Mean Ep Length": mean_ep_length, 
+            "Name": args.model_dir.split('/')[-1]
+        }
+        eval_perfs_list.append(eval_perfs)
     # Save perfs in csv
+    eval_perfs_df = pd.DataFrame(eval_perfs_list, columns=[
+        "Training Eps", "Mean Return", "Success rate", "Mean Ep Length", 
+        "Name"])
     print("Saving evaluation performance to", output_file_path)
     eval_perfs_df.to_csv(output_file_path, index=False)
         
@@ -97,6 +140,9 @@ if __name__ == '__main__':
     # Environment
     parser.add_argument("--episode_length", default=100, type=int)
     parser.add_argument("--discrete_action", action='store_false') 
+    # Evaluation processes
+    parser.add_argument("--n_workers", default=1, type=int,
+                        help="Number of processes evaluating checkpoints")
     
     args = parser.parse_args()
 
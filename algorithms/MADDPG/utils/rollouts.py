@@ -23,6 +23,56 @@ def perform_eval_scenar(env, model, init_pos_list, max_episode_length):
     mean_ep_length = tot_ep_length / len(init_pos_list)
     return mean_return, success_rate, mean_ep_length
 
+@torch.no_grad()
+def perform_eval_scenar_batched(envs, model, init_pos_list, max_episode_length):
+    """
+    Evaluates the model on all initial positions at once, with one
+    environment per initial position stepped in lockstep. Each step is one
+    forward pass of each agent on the batch of running environments. Gives
+    the same results as perform_eval_scenar.
+    Inputs:
+        envs (list): Environments, at least one per initial position.
+        model (MADDPG): Model to evaluate.
+        init_pos_list (list): Initial positions of the evaluation episodes.
+        max_episode_length (int): Maximum length of an episode.
+    Outputs:
+        mean_return (float): Mean return of the episodes.
+        success_rate (float): Rate of successful episodes.
+        mean_ep_length (float): Mean length of the episodes.
+    """
+    n_episodes = len(init_pos_list)
+    ep_returns = np.zeros(n_episodes)
+    ep_lengths = np.full(n_episodes, max_episode_length)
+    ep_success = np.zeros(n_episodes, dtype=bool)
+    # Reset environments with initial positions
+    obs = [envs[ep_i].reset(init_pos=init_pos_list[ep_i])
+           for ep_i in range(n_episodes)]
+    running = list(range(n_episodes))
+    for step_i in range(max_episode_length):
+        # Observations of running environments, batched for each agent
+        torch_obs = [
+            torch.Tensor(np.array([obs[ep_i][a] for ep_i in running]))
+            for a in range(model.nagents)]
+        actions = [ac.numpy() for ac in model.step(torch_obs)]
+
+        still_running = []
+        for b_i, ep_i in enumerate(running):
+            next_obs, rewards, dones, infos = envs[ep_i].step(
+                [ac[b_i] for ac in actions])
+            ep_returns[ep_i] += rewards[0]
+            if dones[0]:
+                ep_lengths[ep_i] = step_i + 1
+                ep_success[ep_i] = True
+            else:
+                obs[ep_i] = next_obs
+                still_running.append(ep_i)
+        running = still_running
+        if len(running) == 0:
+            break
+    return \
+        float(ep_returns.mean()), float(ep_success.mean()), \
+        float(ep_lengths.mean())
+
 def eval_episode(env, model, max_episode_length, init_pos=None, render=False, 
                  step_time=0, verbose=False):
     ep_return = 0.0
@@ -7,6 +7,11 @@ class ReplayBuffer(object):
     def __init__(self, max_steps, nb_agents, obs_dims, ac_dims):
         """
         Replay buffer class.
+        Transitions are stored in one contiguous float32 array per field, of
+        shape (max_steps, nb_agents, dim), written circularly. Agents with
+        smaller dimensions than others use the first dimensions only. Reward
+        sums are maintained as transitions are written so the normalisation
+        statistics don't need a pass over the whole buffer at each sample.
         Inputs:
             max_steps (int): Maximum number of timepoints to store in buffer
             nb_agents (int): Number of agents in environment
@@ -16,83 +21,135 @@ class ReplayBuffer(object):
         """
         self.max_steps = max_steps
         self.nb_agents = nb_agents
+        self.obs_dims = list(obs_dims)
+        self.ac_dims = list(ac_dims)
+        self.obs_buff = np.zeros(
+            (max_steps, nb_agents, max(obs_dims)), dtype=np.float32)
+        self.act_buff = np.zeros(
+            (max_steps, nb_agents, max(ac_dims)), dtype=np.float32)
+        self.rew_buff = np.zeros((max_steps, nb_agents), dtype=np.float32)
+        self.next_obs_buff = np.zeros_like(self.obs_buff)
+        self.done_buff = np.zeros((max_steps, nb_agents), dtype=np.float32)
 
-        self.obs_buffs = []
-        self.act_buffs = []
-        self.rew_buffs = []
-        self.next_obs_buffs = []
-        self.done_buffs = []
-        for odim, adim in zip(obs_dims, ac_dims):
-            self.obs_buffs.append(np.zeros((max_steps, odim)))
-            self.act_buffs.append(np.zeros((max_steps, adim)))
-            self.rew_buffs.append(np.zeros(max_steps))
-            self.next_obs_buffs.append(np.zeros((max_steps, odim)))
-            self.done_buffs.append(np.zeros(max_steps))
+        # Running sums of stored rewards, in float64 to limit drift
+        self.rew_sum = np.zeros(nb_agents)
+        self.rew_sq_sum = np.zeros(nb_agents)
 
-        self.filled_i = 0  # index of first empty location in buffer (last index when full)
+        self.filled_i = 0  # number of filled locations in buffer
         self.curr_i = 0  # current index to write to (ovewrite oldest data)
 
     def __len__(self):
         return self.filled_i
 
+    def _stack_agents(self, data, dims, agent_axis=1):
+        """
+        Gather per-agent data in a (nentries, nb_agents, max(dims)) array.
+        Inputs:
+            data (numpy.ndarray or list): Data batched by environment then
+                agent (agent_axis=1), or by agent then environment
+                (agent_axis=0). Numerical arrays with all agents of the same
+                dimension are used as is.
+            dims (list of ints): Dimension of each agent
+            agent_axis (int): Axis of the agents in data
+        """
+        if isinstance(data, np.ndarray) and data.dtype != object \
+                and data.ndim == 3 and data.shape[-1] == max(dims):
+            return data if agent_axis == 1 else data.swapaxes(0, 1)
+        if agent_axis == 1:
+            agents_data = [np.vstack(data[:, a_i]) for a_i in range(len(dims))]
+        else:
+            agents_data = [np.asarray(d) for d in data]
+        stacked = np.zeros(
+            (agents_data[0].shape[0], len(dims), max(dims)), dtype=np.float32)
+        for a_i, (d, dim) in enumerate(zip(agents_data, dims)):
+            stacked[:, a_i, :dim] = d
+        return stacked
+
     def push(self, observations, actions, rewards, next_observations, dones):
         nentries = observations.shape[0]  # handle multiple parallel environments
-        if self.curr_i + nentries > self.max_steps:
-            rollover = self.max_steps - self.curr_i # num of indices to roll over
-            for agent_i in range(self.nb_agents):
-                self.obs_buffs[agent_i] = np.roll(self.obs_buffs[agent_i],
-                                                  rollover, axis=0)
-                self.act_buffs[agent_i] = np.roll(self.act_buffs[agent_i],
-                                                 rollover, axis=0)
-                self.rew_buffs[agent_i] = np.roll(self.rew_buffs[agent_i],
-                                                  rollover)
-                self.next_obs_buffs[agent_i] = np.roll(
-                    self.next_obs_buffs[agent_i], rollover, axis=0)
-                self.done_buffs[agent_i] = np.roll(self.done_buffs[agent_i],
-                                                   rollover)
-            self.curr_i = 0
-            self.filled_i = self.max_steps
-        for agent_i in range(self.nb_agents):
-            self.obs_buffs[agent_i][self.curr_i:self.curr_i + nentries] = np.vstack(
-                observations[:, agent_i])
-            # actions are already batched by agent, so they are indexed differently
-            self.act_buffs[agent_i][self.curr_i:self.curr_i + nentries] = actions[agent_i]
-            self.rew_buffs[agent_i][self.curr_i:self.curr_i + nentries] = rewards[:, agent_i]
-            self.next_obs_buffs[agent_i][self.curr_i:self.curr_i + nentries] = np.vstack(
-                next_observations[:, agent_i])
-            self.done_buffs[agent_i][self.curr_i:self.curr_i + nentries] = dones[:, agent_i]
-        self.curr_i += nentries
-        if self.filled_i < self.max_steps:
-            self.filled_i += nentries
-        if self.curr_i == self.max_steps:
-            self.curr_i = 0
+        # Write in at most two contiguous segments, wrapping to the start of
+        # the buffer to overwrite the oldest data
+        end_i = self.curr_i + nentries
+        if end_i > self.max_steps:
+            segments = [
+                (slice(self.curr_i, self.max_steps),
+                 slice(0, self.max_steps - self.curr_i)),
+                (slice(0, end_i - self.max_steps),
+                 slice(self.max_steps - self.curr_i, nentries))]
+        else:
+            segments = [(slice(self.curr_i, end_i), slice(0, nentries))]
+
+        observations = self._stack_agents(observations, self.obs_dims)
+        next_observations = self._stack_agents(
+            next_observations, self.obs_dims)
+        # actions are already batched by agent, so they are indexed differently
+        actions = self._stack_agents(actions, self.ac_dims, agent_axis=0)
+        rewards = np.asarray(rewards, dtype=np.float32)
+        dones = np.asarray(dones, dtype=np.float32)
+        for buff_s, data_s in segments:
+            self.obs_buff[buff_s] = observations[data_s]
+            self.act_buff[buff_s] = actions[data_s]
+            self.next_obs_buff[buff_s] = next_observations[data_s]
+            # Update reward sums, removing the overwritten rewards
+            if self.filled_i == self.max_steps:
+                old_rews = self.rew_buff[buff_s]
+                self.rew_sum -= old_rews.sum(0, dtype=np.float64)
+                self.rew_sq_sum -= np.square(old_rews, dtype=np.float64).sum(0)
+            new_rews = rewards[data_s]
+            self.rew_sum += new_rews.sum(0, dtype=np.float64)
+            self.rew_sq_sum += np.square(new_rews, dtype=np.float64).sum(0)
+            self.rew_buff[buff_s] = new_rews
+            self.done_buff[buff_s] = dones[data_s]
+
+        self.filled_i = min(self.filled_i + nentries, self.max_steps)
+        if end_i >= self.max_steps:
+            # Recompute the sums exactly once per pass over the buffer, so
+            # rounding errors don't accumulate
+            rews = self.rew_buff[:self.filled_i]
+            self.rew_sum = rews.sum(0, dtype=np.float64)
+            self.rew_sq_sum = np.square(rews, dtype=np.float64).sum(0)
+        self.curr_i = end_i % self.max_steps
+
+    def get_reward_stats(self):
+        """
+        Mean and standard deviation of the stored rewards of each agent.
+        Outputs:
+            mean (numpy.ndarray): Reward mean, dim=(nb_agents,)
+            std (numpy.ndarray): Reward standard deviation, dim=(nb_agents,)
+        """
+        mean = self.rew_sum / self.filled_i
+        var = np.maximum(self.rew_sq_sum / self.filled_i - mean ** 2, 0.0)
+        return mean, np.sqrt(var)
 
     def sample(self, N, cuda_device=None, norm_rews=True):
-        inds = np.random.choice(np.arange(self.filled_i), size=N,
-                                replace=False)
+        inds = np.random.choice(self.filled_i, size=N, replace=False)
         if cuda_device is not None:
             cast = lambda x: Tensor(x).to(cuda_device)
         else:
             cast = lambda x: Tensor(x)
+        obs = self.obs_buff[inds]
+        acs = self.act_buff[inds]
+        rews = self.rew_buff[inds]
+        next_obs = self.next_obs_buff[inds]
+        dones = self.done_buff[inds]
         if norm_rews:
-            ret_rews = [cast((self.rew_buffs[i][inds] -
-                              self.rew_buffs[i][:self.filled_i].mean()) /
-                              self.rew_buffs[i][:self.filled_i].std())
-                        for i in range(self.nb_agents)]
-        else:
-            ret_rews = [cast(self.rew_buffs[i][inds]) for i in range(self.nb_agents)]
-        return ([cast(self.obs_buffs[i][inds]) for i in range(self.nb_agents)],
-                [cast(self.act_buffs[i][inds]) for i in range(self.nb_agents)],
-                ret_rews,
-                [cast(self.next_obs_buffs[i][inds]) for i in range(self.nb_agents)],
-                [cast(self.done_buffs[i][inds]) for i in range(self.nb_agents)])
+            mean, std = self.get_reward_stats()
+            rews = ((rews - mean) / std).astype(np.float32)
+        return ([cast(obs[:, i, :self.obs_dims[i]])
+                 for i in range(self.nb_agents)],
+                [cast(acs[:, i, :self.ac_dims[i]])
+                 for i in range(self.nb_agents)],
+                [cast(rews[:, i]) for i in range(self.nb_agents)],
+                [cast(next_obs[:, i, :self.obs_dims[i]])
+                 for i in range(self.nb_agents)],
+                [cast(dones[:, i]) for i in range(self.nb_agents)])
 
     def get_average_rewards(self, N):
         if self.filled_i == self.max_steps:
             inds = np.arange(self.curr_i - N, self.curr_i)  # allow for negative indexing
         else:
             inds = np.arange(max(0, self.curr_i - N), self.curr_i)
-        return [self.rew_buffs[i][inds].sum() for i in range(self.nb_agents)]
+        return list(self.rew_buff[inds].sum(0))
 
 
 class RecReplayBuffer:
@@ -0,0 +1,87 @@
+import time
+import argparse
+import numpy as np
+import torch
+
+from src.mappo.gae import compute_gae
+from src.mappo.nn_modules.valuenorm import ValueNorm
+
+
+def loop_gae(rewards, value_preds, masks, gamma, gae_lambda, value_normalizer):
+    """ Previous implementation: per-step loop, denormalizing at each step. """
+    returns = np.zeros_like(value_preds)
+    gae = 0
+    for step in reversed(range(rewards.shape[0])):
+        delta = rewards[step] + gamma * value_normalizer.denormalize(
+            value_preds[step + 1]) * masks[step + 1] \
+            - value_normalizer.denormalize(value_preds[step])
+        gae = delta + gamma * gae_lambda * masks[step + 1] * gae
+        returns[step] = gae + value_normalizer.denormalize(value_preds[step])
+    return returns
+
+def kernel_gae(rewards, value_preds, masks, gamma, gae_lambda, value_normalizer):
+    returns = np.zeros_like(value_preds)
+    compute_gae(rewards, value_normalizer.denormalize(value_preds), masks,
+                gamma, gae_lambda, returns=returns)
+    return returns
+
+def torch_gae(rewards, value_preds, masks, gamma, gae_lambda, value_normalizer):
+    # Values are denormalized on the device of the value normalizer
+    mean, var = value_normalizer.running_mean_var()
+    values = value_preds * torch.sqrt(var) + mean
+    return compute_gae(rewards, values, masks, gamma, gae_lambda)
+
+def time_fn(fn, inputs, n_repeats):
+    fn(*inputs)
+    start = time.perf_counter()
+    for _ in range(n_repeats):
+        fn(*inputs)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / n_repeats
+
+
+def run(args):
+    device = torch.device(args.device)
+    value_normalizer = ValueNorm(1)
+    value_normalizer.update(torch.randn(1000, 1) * 5.0 + 2.0)
+    value_normalizer_dev = ValueNorm(1).to(device)
+    value_normalizer_dev.load_state_dict(value_normalizer.state_dict())
+
+    print(f"GAE over {args.n_envs} envs x {args.n_agents} agents, "
+          f"times in ms")
+    print(f"{'length':>8} {'loop':>10} {'numpy':>10} {'torch':>10} "
+          f"{'speedup':>8}")
+    for T in args.lengths:
+        shape = (args.n_envs, args.n_agents, 1)
+        rewards = np.random.randn(T, *shape).astype(np.float32)
+        value_preds = np.random.randn(T + 1, *shape).astype(np.float32)
+        masks = (np.random.rand(T + 1, *shape) > 0.02).astype(np.float32)
+        inputs = (rewards, value_preds, masks, args.gamma, args.gae_lambda)
+
+        ref = loop_gae(*inputs, value_normalizer)
+        out = kernel_gae(*inputs, value_normalizer)
+        assert np.allclose(ref[:-1], out[:-1], atol=1e-5)
+
+        t_loop = time_fn(loop_gae, inputs + (value_normalizer,), args.n_repeats)
+        t_np = time_fn(kernel_gae, inputs + (value_normalizer,), args.n_repeats)
+        torch_inputs = tuple(torch.from_numpy(x).to(device) for x in inputs[:3]) \
+            + inputs[3:] + (value_normalizer_dev,)
+        t_torch = time_fn(torch_gae, torch_inputs, args.n_repeats)
+        print(f"{T:>8} {t_loop * 1000:>10.3f} {t_np * 1000:>10.3f} "
+              f"{t_torch * 1000:>10.3f} {t_loop / t_np:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark of returns computation in the buffers.")
+    parser.add_argument("--lengths", type=int, nargs="+",
+                        default=[25, 50, 100, 250, 500, 1000])
+    parser.add_argument("--n_envs", type=int, default=128)
+    parser.add_argument("--n_agents", type=int, default=4)
+    parser.add_argument("--gamma", type=float, default=0.99)
+    parser.add_argument("--gae_lambda", type=float, default=0.95)
+    parser.add_argument("--n_repeats", type=int, default=10)
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+    run(args)
@@ -3,7 +3,7 @@ import numpy as np
 
 from itertools import chain
 
-from .env_wrappers import DummyVecEnv, SubprocVecEnv
+from .env_wrappers import DummyVecEnv, SubprocVecEnv, BatchedWorldVecEnv
 from .mpe.environment import MultiAgentEnv
 
 def _get_env(cfg):
@@ -46,8 +46,16 @@ def make_env(cfg, n_threads, seed=None):
             env.seed(seed + rank * 1000)
             return env
         return init_env
-    if n_threads == 1:
+    if "mpe" in cfg.env_name and cfg.mpe_batched_world:
+        # One process, worlds share the global random state
+        envs = BatchedWorldVecEnv([
+            lambda: _get_env(cfg) for _ in range(n_threads)])
+        envs.envs[0].seed(seed)
+        return envs
+    elif n_threads == 1:
         return DummyVecEnv([get_env_fn(0)])
     else:
         return SubprocVecEnv([
-            get_env_fn(i) for i in range(n_threads)])
\ No newline at end of file
+            get_env_fn(i) for i in range(n_threads)], 
+            shared_memory=cfg.env_shared_memory,
+            envs_per_worker=cfg.envs_per_worker)
\ No newline at end of file
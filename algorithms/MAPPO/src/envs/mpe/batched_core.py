@@ -0,0 +1,182 @@
+import numpy as np
+
+from .core import Walled_World
+
+
+# state of an entity stored as views in the arrays of a BatchedWorld
+class BatchedEntityState(object):
+    def __init__(self, batched_world, env_i, entity_i, c=None):
+        self._bw = batched_world
+        self._env_i = env_i
+        self._entity_i = entity_i
+        # communication utterance (only used by agents)
+        self.c = c
+
+    @property
+    def p_pos(self):
+        return self._bw.pos[self._env_i, self._entity_i]
+
+    @p_pos.setter
+    def p_pos(self, value):
+        if value is not None:
+            self._bw.pos[self._env_i, self._entity_i] = value
+
+    @property
+    def p_vel(self):
+        return self._bw.vel[self._env_i, self._entity_i]
+
+    @p_vel.setter
+    def p_vel(self, value):
+        if value is not None:
+            self._bw.vel[self._env_i, self._entity_i] = value
+
+
+class BatchedWorld(object):
+    """
+    Structure-of-arrays physics backend stepping a batch of MPE worlds at
+    once. The worlds are the ones built by the scenarios, so all scenario code
+    keeps working: the state of each entity is re-bound to views in the
+    (n_envs, n_entities, dim_p) position and velocity arrays. Static entity
+    properties (size, mass, movable, collide, max_speed) are cached as
+    (n_envs, n_entities) arrays and must be re-synced with
+    sync_properties() when a scenario changes them (e.g. on reset).
+    :param worlds: (list) Worlds to step, all built by the same scenario.
+    """
+    def __init__(self, worlds):
+        self.worlds = worlds
+        self.n_envs = len(worlds)
+        w0 = worlds[0]
+        self.n_entities = len(w0.entities)
+        self.n_agents = len(w0.agents)
+        for w in worlds:
+            assert len(w.entities) == self.n_entities, \
+                "All batched worlds must have the same number of entities."
+        self.dim_p = w0.dim_p
+        self.dt = w0.dt
+        self.contact_force = w0.contact_force
+        self.contact_margin = w0.contact_margin
+        # Walls (only orientation and position are assumed shared)
+        if isinstance(w0, Walled_World):
+            self.wall_names = list(w0.walls.keys())
+        else:
+            self.wall_names = []
+
+        # State arrays
+        self.pos = np.zeros((self.n_envs, self.n_entities, self.dim_p))
+        self.vel = np.zeros((self.n_envs, self.n_entities, self.dim_p))
+        # Property arrays
+        self.size = np.zeros((self.n_envs, self.n_entities))
+        self.mass = np.ones((self.n_envs, self.n_entities))
+        self.max_speed = np.full((self.n_envs, self.n_entities), np.inf)
+        self.movable = np.zeros((self.n_envs, self.n_entities), dtype=bool)
+        self.collide = np.zeros((self.n_envs, self.n_entities), dtype=bool)
+        self.damping = np.zeros((self.n_envs, 1, 1))
+        # Pairs of different entities
+        self._not_self = ~np.eye(self.n_entities, dtype=bool)
+
+        self._bind_states()
+        self.sync_properties()
+
+    def _bind_states(self):
+        for e_i, world in enumerate(self.worlds):
+            for ent_i, entity in enumerate(world.entities):
+                old_state = entity.state
+                entity.state = BatchedEntityState(
+                    self, e_i, ent_i, getattr(old_state, "c", None))
+                entity.state.p_pos = old_state.p_pos
+                entity.state.p_vel = old_state.p_vel
+
+    def sync_properties(self, env_ids=None):
+        """
+        Copy the static properties of entities into the property arrays.
+        :param env_ids: (list) Indexes of the worlds to sync, all if None.
+        """
+        if env_ids is None:
+            env_ids = range(self.n_envs)
+        for e_i in env_ids:
+            world = self.worlds[e_i]
+            self.damping[e_i] = world.damping
+            for ent_i, entity in enumerate(world.entities):
+                self.size[e_i, ent_i] = entity.size
+                self.mass[e_i, ent_i] = entity.mass
+                self.movable[e_i, ent_i] = entity.movable
+                self.collide[e_i, ent_i] = entity.collide
+                self.max_speed[e_i, ent_i] = \
+                    np.inf if entity.max_speed is None else entity.max_speed
+
+    # update state of all worlds
+    def step(self):
+        # set actions for scripted agents
+        for world in self.worlds:
+            for agent in world.scripted_agents:
+                agent.action = agent.action_callback(agent, world)
+        # gather forces applied to entities
+        p_force = np.zeros((self.n_envs, self.n_entities, self.dim_p))
+        # apply agent physical controls
+        self.apply_action_force(p_force)
+        # apply environment forces
+        self.apply_environment_force(p_force)
+        # integrate physical state
+        self.integrate_state(p_force)
+        # update agent state
+        for world in self.worlds:
+            for agent in world.agents:
+                world.update_agent_state(agent)
+
+    # gather agent action forces
+    def apply_action_force(self, p_force):
+        for e_i, world in enumerate(self.worlds):
+            for a_i, agent in enumerate(world.agents):
+                if agent.movable:
+                    noise = np.random.randn(*agent.action.u.shape) \
+                        * agent.u_noise if agent.u_noise else 0.0
+                    p_force[e_i, a_i] = agent.action.u + noise
+
+    # gather physical forces acting on entities
+    def apply_environment_force(self, p_force):
+        # (n_envs, n_entities, n_entities, dim_p) position differences
+        delta_pos = self.pos[:, :, None] - self.pos[:, None]
+        dist = np.sqrt(np.sum(np.square(delta_pos), axis=-1))
+        # minimum allowable distance
+        dist_min = self.size[:, :, None] + self.size[:, None]
+        # softmax penetration
+        k = self.contact_margin
+        penetration = np.logaddexp(0, -(dist - dist_min) / k) * k
+        force = self.contact_force * delta_pos / (dist + 1e-6)[..., None] \
+            * penetration[..., None]
+        # only between different colliders, only applied to movable entities
+        mask = self.collide[:, :, None] & self.collide[:, None] \
+            & self._not_self & self.movable[:, :, None]
+        p_force += np.sum(force * mask[..., None], axis=2)
+
+    # integrate physical state
+    def integrate_state(self, p_force):
+        movable = self.movable[..., None]
+        vel = self.vel * (1 - self.damping)
+        vel += (p_force / self.mass[..., None]) * self.dt
+        speed = np.sqrt(np.sum(np.square(vel), axis=-1))
+        too_fast = speed > self.max_speed
+        vel[too_fast] = vel[too_fast] / speed[too_fast, None] \
+            * self.max_speed[too_fast, None]
+        self.vel[:] = np.where(movable, vel, self.vel)
+        # Check for wall collision
+        if len(self.wall_names) > 0:
+            self.block_walls()
+        self.pos += np.where(movable, self.vel * self.dt, 0.0)
+
+    def block_walls(self):
+        temp_pos = self.pos + self.vel * self.dt
+        for name in self.wall_names:
+            wall = self.worlds[0].walls[name]
+            o = wall.orient
+            active = np.array([w.walls[name].active for w in self.worlds])
+            can_block = self.movable & active[:, None]
+            pos_o = self.pos[..., o]
+            above = can_block & (pos_o > wall.position) \
+                & (temp_pos[..., o] - self.size < wall.position)
+            below = can_block & (pos_o < wall.position) \
+                & (temp_pos[..., o] + self.size > wall.position)
+            self.vel[..., o][above | below] = 0.0
+            self.pos[..., o] = np.where(
+                above, wall.position + self.size,
+                np.where(below, wall.position - self.size, pos_o))
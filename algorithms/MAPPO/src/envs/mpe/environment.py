@@ -75,16 +75,22 @@ class MultiAgentEnv(gym.Env):
         self._reset_render()
 
     def step(self, action_n):
-        obs_n = []
-        reward_n = []
-        done_n = []
-        info_n = {'n': []}
+        self.set_actions(action_n)
+        # advance world state
+        self.world.step()
+        return self.get_step_outputs()
+
+    def set_actions(self, action_n):
         self.agents = self.world.policy_agents
         # set action for each agent
         for i, agent in enumerate(self.agents):
             self._set_action(action_n[i], agent, self.action_space[i])
-        # advance world state
-        self.world.step()
+
+    def get_step_outputs(self):
+        obs_n = []
+        reward_n = []
+        done_n = []
+        info_n = {'n': []}
         # record observation for each agent
         for agent in self.agents:
             obs_n.append(self._get_obs(agent))
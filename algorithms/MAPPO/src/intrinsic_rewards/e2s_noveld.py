@@ -4,8 +4,8 @@ from torch.nn import functional as F
 
 from .networks import MLPNetwork
 from .intrinsic_rewards import IntrinsicReward
-from .rnd import RND
-from .e3b import E3B
+from .rnd import RND, GroupedRND
+from .e3b import E3B, GroupedE3B
 
 
 class E2S_NovelD(IntrinsicReward):
@@ -13,7 +13,7 @@ class E2S_NovelD(IntrinsicReward):
 
     def __init__(self, input_dim, act_dim, enc_dim, hidden_dim, 
                  scale_fac=0.5, ridge=0.1, lr=1e-4, device="cpu", 
-                 ablation=None):
+                 ablation=None, e3b_cov_mode="full"):
         assert ablation in [None, "LLEC", "EEC"], "Wrong ablation name, must be in [None, 'LLEC', 'EEC']"
         self.ablation = ablation
         self.device = device
@@ -27,7 +27,8 @@ class E2S_NovelD(IntrinsicReward):
             self.rnd = RND(input_dim, enc_dim, hidden_dim, lr, device)
         if self.ablation in [None, "EEC"]:
             self.e3b = E3B(
-                input_dim, act_dim, enc_dim, hidden_dim, ridge, lr, device)
+                input_dim, act_dim, enc_dim, hidden_dim, ridge, lr, device,
+                e3b_cov_mode)
     
     def init_new_episode(self, n_episodes=1):
         if self.rnd is not None:
@@ -59,7 +60,7 @@ class E2S_NovelD(IntrinsicReward):
             ir_reward (torch.Tensor): Intrinsic rewards for the input states,
                 dim=(batch_size, 1).
         """
-        batch_size = state_batch.shape[0]
+        batch_shape = state_batch.shape[:-1]
         ## NovelD
         if self.rnd is not None:
             # Get RND reward as novelty
@@ -69,20 +70,20 @@ class E2S_NovelD(IntrinsicReward):
             if self.last_nov is not None:
                 noveld_reward = torch.max(
                     nov - self.scale_fac * self.last_nov, 
-                    torch.zeros(batch_size).to(self.device))
+                    torch.zeros(batch_shape, device=self.device))
             else:
-                noveld_reward = torch.Tensor([0.0] * batch_size).to(self.device)
+                noveld_reward = torch.zeros(batch_shape, device=self.device)
 
             self.last_nov = nov
         else:
-            noveld_reward = torch.Tensor([1.0] * batch_size).to(self.device)
+            noveld_reward = torch.ones(batch_shape, device=self.device)
 
         ## E3B
         if self.e3b is not None:
             elliptic_scale = self.e3b.get_reward(state_batch)
             elliptic_scale = torch.sqrt(2 * elliptic_scale)
         else:
-            elliptic_scale = torch.Tensor([1.0] * batch_size).to(self.device)
+            elliptic_scale = torch.ones(batch_shape, device=self.device)
 
         return noveld_reward * elliptic_scale
 
@@ -116,3 +117,29 @@ class E2S_NovelD(IntrinsicReward):
             self.rnd.load_params(params)
         if self.e3b is not None:
             self.e3b.load_params(params)
+
+
+class GroupedE2S_NovelD(E2S_NovelD):
+    """ 
+    Group of E2S_NovelD models with the same architecture (e.g. one per 
+    agent), evaluated and trained together with batched matrix 
+    multiplications. Inputs have a leading dimension of size n_groups.
+    """
+
+    def __init__(self, models):
+        """
+        Inputs:
+            models (list): E2S_NovelD models to group, their parameters are 
+                used for initialisation.
+        """
+        self.n_groups = len(models)
+        self.ablation = models[0].ablation
+        self.device = models[0].device
+        self.scale_fac = models[0].scale_fac
+        self.last_nov = None
+        self.rnd = None
+        self.e3b = None
+        if models[0].rnd is not None:
+            self.rnd = GroupedRND([m.rnd for m in models])
+        if models[0].e3b is not None:
+            self.e3b = GroupedE3B([m.e3b for m in models])
@@ -1,17 +1,27 @@
 import torch
 from torch.nn import functional as F
 
-from .networks import MLPNetwork
+from .networks import MLPNetwork, GroupedMLPNetwork
 from .intrinsic_rewards import IntrinsicReward
 
 
 class E3B(IntrinsicReward):
+    """
+    Elliptical Episodic Bonus. The inverse covariance matrices of all 
+    parallel episodes are stored in one preallocated tensor, updated in place
+    with batched Sherman-Morrison updates.
+    :param cov_mode: (str) "full" for full inverse covariance matrices, or
+        "diag" to keep only their diagonal (for large enc_dim).
+    """
     
     def __init__(self, input_dim, act_dim, enc_dim, 
-            hidden_dim=64, ridge=0.1, lr=1e-4, device="cpu"):
+            hidden_dim=64, ridge=0.1, lr=1e-4, device="cpu", 
+            cov_mode="full"):
+        assert cov_mode in ["full", "diag"], "Wrong cov_mode, must be in ['full', 'diag']"
         self.enc_dim = enc_dim
         self.ridge = ridge
         self.device = device
+        self.cov_mode = cov_mode
         # State encoder
         self.encoder = MLPNetwork(
             input_dim, enc_dim, hidden_dim, norm_in=False)
@@ -20,9 +30,8 @@ class E3B(IntrinsicReward):
             2 * enc_dim, act_dim, hidden_dim, norm_in=False)
         # Inverse covariance matrix
         self.ridge = ridge
-        self.inv_cov = torch.cat([
-            torch.eye(self.enc_dim).unsqueeze(0) for _ in range(1)])
-        self.outer_product_buffer = torch.empty(enc_dim, enc_dim).to(device)
+        self.inv_cov = None
+        self.init_new_episode(1)
         
         # Optimizers
         self.encoder_optim = torch.optim.Adam(
@@ -33,10 +42,19 @@ class E3B(IntrinsicReward):
             lr=lr)
     
     def init_new_episode(self, n_episodes=1):
-        self.inv_cov = torch.cat([
-            torch.eye(self.enc_dim).unsqueeze(0) for _ in range(n_episodes)
-        ]).to(self.device)
-        self.inv_cov *= (1.0 / self.ridge)
+        if self.cov_mode == "full":
+            shape = (n_episodes, self.enc_dim, self.enc_dim)
+        else:
+            shape = (n_episodes, self.enc_dim)
+        # Allocate only when the number of episodes changes
+        if self.inv_cov is None or self.inv_cov.shape != shape:
+            self.inv_cov = torch.empty(shape, device=self.device)
+        # Reset to identity / ridge
+        if self.cov_mode == "full":
+            self.inv_cov.zero_()
+            self.inv_cov.diagonal(dim1=1, dim2=2).fill_(1.0 / self.ridge)
+        else:
+            self.inv_cov.fill_(1.0 / self.ridge)
 
     def set_train(self, device):
         self.encoder.train()
@@ -44,39 +62,47 @@ class E3B(IntrinsicReward):
         self.inv_dyn.train()
         self.inv_dyn = self.inv_dyn.to(device)
         self.inv_cov = self.inv_cov.to(device)
-        self.outer_product_buffer = self.outer_product_buffer.to(device)
         self.device = device
 
     def set_eval(self, device):
         self.encoder.eval()
         self.encoder = self.encoder.to(device)
         self.inv_cov = self.inv_cov.to(device)
-        self.outer_product_buffer = self.outer_product_buffer.to(device)
         self.device = device
         
+    @torch.no_grad()
     def get_reward(self, state_batch):
         """
         Inputs:
             state_batch (torch.Tensor): dim=(batch_size, state_dim)
+        Outputs:
+            int_rewards (torch.Tensor): dim=(batch_size,)
+        """
+        return self._elliptical_bonus(self.encoder(state_batch))
+
+    def _elliptical_bonus(self, enc_state):
+        """
+        Compute the bonus of each episode and update its inverse covariance.
+        Inputs:
+            enc_state (torch.Tensor): dim=(n_episodes, enc_dim)
+        Outputs:
+            int_rewards (torch.Tensor): dim=(n_episodes,)
         """
-        # Encode state
-        enc_state = self.encoder(state_batch).detach().unsqueeze(-1)
-        # Compute the intrinsic reward
-        u = torch.matmul(enc_state.transpose(1, 2), self.inv_cov)
-        int_rewards = torch.matmul(u, enc_state).squeeze()
-        # Update covariance matrix
-        outer_prod = torch.matmul(u.transpose(1, 2), u)
-        batch_size = state_batch.shape[0]
-        if batch_size > 1:
-            self.inv_cov = torch.cat([
-                torch.add(self.inv_cov[e_i], outer_prod[e_i], 
-                    alpha=-(1. / (1. + int_rewards[e_i]))).unsqueeze(0)
-                for e_i in range(batch_size)
-            ])
+        if self.cov_mode == "full":
+            # Compute the intrinsic reward, u = phi^T C^-1
+            u = torch.bmm(enc_state.unsqueeze(1), self.inv_cov)
+            int_rewards = (u.squeeze(1) * enc_state).sum(-1)
+            # Update inverse covariance matrices (Sherman-Morrison), 
+            # C^-1 -= u^T u / (1 + phi^T C^-1 phi)
+            scale = -1.0 / (1.0 + int_rewards)
+            self.inv_cov.baddbmm_(
+                u.transpose(1, 2) * scale.view(-1, 1, 1), u)
         else:
-            torch.add(
-                self.inv_cov, outer_prod, 
-                alpha=-(1. / (1. + int_rewards)), out=self.inv_cov)
+            u = self.inv_cov * enc_state
+            int_rewards = (u * enc_state).sum(-1)
+            # Diagonal of the Sherman-Morrison update
+            self.inv_cov.addcdiv_(
+                u.square(), (1.0 + int_rewards).unsqueeze(-1), value=-1.0)
         return int_rewards
     
     def train(self, state_batch, act_batch):
@@ -114,4 +140,80 @@ class E3B(IntrinsicReward):
         self.encoder.load_state_dict(params['encoder'])
         self.inv_dyn.load_state_dict(params['inv_dyn'])
         self.encoder_optim.load_state_dict(params['encoder_optim'])
-        self.inv_dyn_optim.load_state_dict(params['inv_dyn_optim'])
\ No newline at end of file
+        self.inv_dyn_optim.load_state_dict(params['inv_dyn_optim'])
+
+
+class GroupedE3B(E3B):
+    """ 
+    Group of E3B models with the same architecture (e.g. one per agent), 
+    evaluated and trained together. The inverse covariance matrices of all 
+    models and episodes are updated in one batch.
+    """
+
+    def __init__(self, models):
+        """
+        Inputs:
+            models (list): E3B models to group, their parameters are used for
+                initialisation.
+        """
+        self.n_groups = len(models)
+        self.enc_dim = models[0].enc_dim
+        self.ridge = models[0].ridge
+        self.device = models[0].device
+        self.cov_mode = models[0].cov_mode
+        self.encoder = GroupedMLPNetwork([m.encoder for m in models])
+        self.inv_dyn = GroupedMLPNetwork([m.inv_dyn for m in models])
+        self.inv_cov = None
+        self.init_new_episode(1)
+
+        # Optimizers
+        self.encoder_optim = torch.optim.Adam(
+            self.encoder.parameters(), 
+            lr=models[0].encoder_optim.param_groups[0]["lr"])
+        self.inv_dyn_optim = torch.optim.Adam(
+            self.inv_dyn.parameters(), 
+            lr=models[0].inv_dyn_optim.param_groups[0]["lr"])
+
+    def init_new_episode(self, n_episodes=1):
+        super().init_new_episode(self.n_groups * n_episodes)
+
+    @torch.no_grad()
+    def get_reward(self, state_batch):
+        """
+        Inputs:
+            state_batch (torch.Tensor): dim=(n_groups, batch_size, state_dim)
+        Outputs:
+            int_rewards (torch.Tensor): dim=(n_groups, batch_size)
+        """
+        enc_state = self.encoder(state_batch)
+        return self._elliptical_bonus(
+            enc_state.reshape(-1, self.enc_dim)).reshape(self.n_groups, -1)
+
+    def train(self, state_batch, act_batch):
+        """
+        Inputs:
+            state_batch (torch.Tensor): Batch of states, dim=(n_groups, 
+                episode_length + 1, batch_size, state_dim).
+            act_batch (torch.Tensor): Batch of actions, dim=(n_groups, 
+                episode_length, batch_size, action_dim).
+        Outputs:
+            loss (float): Mean of the losses of all models.
+        """
+        # Encode states
+        enc_all_states_b = self.encoder(state_batch)
+        enc_states_b = enc_all_states_b[:, :-1]
+        enc_next_states_b = enc_all_states_b[:, 1:]
+        # Run inverse dynamics model
+        inv_dyn_inputs = torch.cat((enc_states_b, enc_next_states_b), dim=-1)
+        pred_actions = self.inv_dyn(inv_dyn_inputs)
+        # Sum of the losses of each model, for the same gradients as when 
+        # training them separately
+        losses = F.mse_loss(pred_actions, act_batch, reduction="none").reshape(
+            self.n_groups, -1).mean(-1)
+        # Backward pass
+        self.encoder_optim.zero_grad()
+        self.inv_dyn_optim.zero_grad()
+        losses.sum().backward()
+        self.encoder_optim.step()
+        self.inv_dyn_optim.step()
+        return float(losses.mean())
@@ -1,3 +1,4 @@
+import torch
 from torch import nn
 
 
@@ -101,3 +102,59 @@ class MLPNetwork(nn.Module):
         """
         out = self.mlp(self.in_fn(X))
         return self.out_activ_fn(out)
+
+
+class GroupedMLPNetwork(nn.Module):
+    """
+    Group of MLPNetworks with the same architecture (e.g. one per agent), 
+    evaluated together with batched matrix multiplications. Parameters are 
+    initialised from the given networks.
+    """
+    def __init__(self, networks):
+        """
+        Inputs:
+            :param networks (list): MLPNetworks to group, built with the same
+                parameters and norm_in=False.
+        """
+        super(GroupedMLPNetwork, self).__init__()
+        self.n_groups = len(networks)
+        assert not isinstance(networks[0].in_fn, nn.BatchNorm1d), \
+            "GroupedMLPNetwork does not support input normalisation."
+        
+        layers = [
+            [m for m in net.mlp.modules() if isinstance(m, nn.Linear)]
+            for net in networks]
+        # Weights, dim=(n_groups, in_dim, out_dim), biases, 
+        # dim=(n_groups, 1, out_dim)
+        self.weights = nn.ParameterList([
+            nn.Parameter(torch.stack(
+                [net_layers[l_i].weight.data.t() for net_layers in layers]))
+            for l_i in range(len(layers[0]))])
+        self.biases = nn.ParameterList([
+            nn.Parameter(torch.stack(
+                [net_layers[l_i].bias.data for net_layers in layers]
+            ).unsqueeze(1))
+            for l_i in range(len(layers[0]))])
+
+        self.activ_fn = networks[0].mlp[1]
+        self.out_activ_fn = networks[0].out_activ_fn
+
+    def forward(self, X):
+        """
+        Foward pass of all networks
+        Inputs:
+            X (PyTorch Tensor): Batch of inputs of each network, 
+                dim=(n_groups, ..., input_dim)
+        Outputs:
+            out (PyTorch Tensor): Batch of outputs,
+                dim=(n_groups, ..., output_dim)
+        """
+        batch_shape = X.shape[:-1]
+        out = X.reshape(self.n_groups, -1, X.shape[-1])
+        n_layers = len(self.weights)
+        for l_i in range(n_layers):
+            out = torch.baddbmm(self.biases[l_i], out, self.weights[l_i])
+            if l_i < n_layers - 1:
+                out = self.activ_fn(out)
+        out = self.out_activ_fn(out)
+        return out.reshape(*batch_shape, -1)
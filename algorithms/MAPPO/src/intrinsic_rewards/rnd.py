@@ -1,7 +1,7 @@
 import torch
 from torch.nn import functional as F
 
-from .networks import MLPNetwork
+from .networks import MLPNetwork, GroupedMLPNetwork
 from .intrinsic_rewards import IntrinsicReward
 
 
@@ -89,4 +89,65 @@ class RND(IntrinsicReward):
     def load_params(self, params):
         self.target.load_state_dict(params['target'])
         self.predictor.load_state_dict(params['predictor'])
-        self.optim.load_state_dict(params['optim'])
\ No newline at end of file
+        self.optim.load_state_dict(params['optim'])
+
+class GroupedRND(RND):
+    """ 
+    Group of RND models with the same architecture (e.g. one per agent), 
+    evaluated and trained together.
+    """
+
+    def __init__(self, models):
+        """
+        Inputs:
+            models (list): RND models to group, their parameters are used for
+                initialisation.
+        """
+        self.n_groups = len(models)
+        self.input_dim = models[0].input_dim
+        self.device = models[0].device
+        self.target = GroupedMLPNetwork([m.target for m in models])
+        self.predictor = GroupedMLPNetwork([m.predictor for m in models])
+
+        # Fix weights of target
+        for param in self.target.parameters():
+            param.requires_grad = False
+
+        # Optimizers
+        self.optim = torch.optim.Adam(
+            self.predictor.parameters(), 
+            lr=models[0].optim.param_groups[0]["lr"])
+
+    def get_reward(self, state_batch):
+        """
+        Get intrinsic reward for the given state.
+        Inputs:
+            state_batch (torch.Tensor): States from which to generate the reward,
+                dim=(n_groups, batch_size, state_dim).
+        Outputs:
+            int_reward (torch.Tensor): Intrinsic rewards for the input states,
+                dim=(n_groups, batch_size).
+        """
+        with torch.no_grad():
+            target = self.target(state_batch)
+            pred = self.predictor(state_batch)
+        return torch.norm(pred - target, dim=-1, p=2)
+
+    def train(self, state_batch, _):
+        """
+        Inputs:
+            state_batch (torch.Tensor): Batch of states, dim=(n_groups, 
+                episode_length + 1, batch_size, state_dim).
+        Outputs:
+            loss (float): Mean of the losses of all models.
+        """
+        targets = self.target(state_batch)
+        preds = self.predictor(state_batch)
+        # Sum of the losses of each model, for the same gradients as when 
+        # training them separately
+        losses = F.mse_loss(preds, targets, reduction="none").reshape(
+            self.n_groups, -1).mean(-1)
+        self.optim.zero_grad()
+        losses.sum().backward()
+        self.optim.step()
+        return float(losses.mean())
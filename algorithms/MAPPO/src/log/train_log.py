@@ -100,7 +100,7 @@ class Logger():
                     self.train_data["Step"][-1])
 
         # Log losses
-        if self.log_tensorboard:
+        if self.log_tensorboard and train_losses is not None:
             if type(train_losses) is tuple:
                 losses = {
                     "value_loss": np.mean(
@@ -120,6 +120,16 @@ class Logger():
 
         return int(n_done_steps)
 
+    def log_policy_lag(self, step, policy_lag):
+        """
+        Log the number of updates between the policy that collected the data
+        and the policy trained on it, in pipelined training.
+        :param step: (int) Step number.
+        :param policy_lag: (int) Number of updates.
+        """
+        if self.log_tensorboard:
+            self.log_tb.add_scalar('agent0/policy_lag', policy_lag, step)
+
     def log_eval(self, step, mean_return, success_rate, mean_ep_len):
         self.eval_data["Step"].append(step)
         self.eval_data["Mean return"].append(mean_return)
@@ -3,6 +3,7 @@ import numpy as np
 from collections import defaultdict
 
 from .utils import check, get_shape_from_obs_space, get_shape_from_act_space
+from .gae import compute_gae, compute_discounted_returns
 
 ##########################################################################
 # Code modified from https://github.com/marlbenchmark/on-policy
@@ -12,12 +13,22 @@ def _flatten(T, N, x):
     return x.reshape(T * N, *x.shape[2:])
 
 def _cast(x):
-    return x.transpose(1,0,2).reshape(-1, *x.shape[2:])
+    return x.swapaxes(0, 1).reshape(-1, *x.shape[2:])
 
 class SeparatedReplayBuffer(object):
-    def __init__(self, args, obs_space, share_obs_space, act_space):
+    """
+    Rollout buffer of one policy. All arrays are allocated once and reset in 
+    place at the start of each episode. With args.buffer_pin_memory, the 
+    arrays are NumPy views of (pinned) torch tensors, and the minibatch 
+    generators copy the rollout to the training device once and yield torch
+    tensors gathered on this device.
+    """
+    def __init__(self, args, obs_space, share_obs_space, act_space, 
+                 n_rollout_threads=None, device=torch.device("cpu")):
         self.episode_length = args.episode_length
-        self.n_rollout_threads = args.n_rollout_threads
+        if n_rollout_threads is None:
+            n_rollout_threads = args.n_rollout_threads
+        self.n_rollout_threads = n_rollout_threads
         self.rnn_hidden_size = args.hidden_size
         self.recurrent_N = args.recurrent_N
         self.gamma = args.gamma
@@ -27,12 +38,20 @@ class SeparatedReplayBuffer(object):
         self._use_valuenorm = args.use_valuenorm
         self._use_proper_time_limits = args.use_proper_time_limits
         self.act_space = act_space
+        self.device = device
+
+        self._use_torch_storage = args.buffer_pin_memory
+        self._pin_memory = \
+            self._use_torch_storage and torch.cuda.is_available()
+        # Backing tensors and reset values of the buffer arrays, by name
+        self._storage = {}
+        self._init_values = {}
 
         self.obs_shape = get_shape_from_obs_space(obs_space)
         self.share_obs_shape = get_shape_from_obs_space(share_obs_space)
 
         if act_space.__class__.__name__ == 'Discrete':
-            self.available_actions = np.ones((self.episode_length + 1, self.n_rollout_threads, act_space.n), dtype=np.float32)
+            self._alloc("available_actions", (self.episode_length + 1, self.n_rollout_threads, act_space.n), 1.0)
         else:
             self.available_actions = None
 
@@ -44,104 +63,122 @@ class SeparatedReplayBuffer(object):
         if type(self.share_obs_shape[-1]) == list:
             self.share_obs_shape = self.share_obs_shape[:1]
 
-        self.share_obs = np.zeros((self.episode_length + 1, self.n_rollout_threads, *self.share_obs_shape), dtype=np.float32)
-        self.obs = np.zeros((self.episode_length + 1, self.n_rollout_threads, *self.obs_shape), dtype=np.float32)
+        self._alloc("share_obs", (self.episode_length + 1, self.n_rollout_threads, *self.share_obs_shape))
+        self._alloc("obs", (self.episode_length + 1, self.n_rollout_threads, *self.obs_shape))
 
-        self.rnn_states = np.zeros((self.episode_length + 1, self.n_rollout_threads, self.recurrent_N, self.rnn_hidden_size), dtype=np.float32)
-        self.rnn_states_critic = np.zeros_like(self.rnn_states)
+        self._alloc("rnn_states", (self.episode_length + 1, self.n_rollout_threads, self.recurrent_N, self.rnn_hidden_size))
+        self._alloc("rnn_states_critic", self.rnn_states.shape)
 
-        self.value_preds = np.zeros((self.episode_length + 1, self.n_rollout_threads, 1), dtype=np.float32)
-        self.returns = np.zeros((self.episode_length + 1, self.n_rollout_threads, 1), dtype=np.float32)
+        self._alloc("value_preds", (self.episode_length + 1, self.n_rollout_threads, 1))
+        self._alloc("returns", (self.episode_length + 1, self.n_rollout_threads, 1))
 
-        self.actions = np.zeros((self.episode_length, self.n_rollout_threads, self.act_shape), dtype=np.float32)
-        self.action_log_probs = np.zeros((self.episode_length, self.n_rollout_threads, self.act_shape), dtype=np.float32)
-        self.rewards = np.zeros((self.episode_length, self.n_rollout_threads, 1), dtype=np.float32)
+        self._alloc("actions", (self.episode_length, self.n_rollout_threads, self.act_shape))
+        self._alloc("action_log_probs", (self.episode_length, self.n_rollout_threads, self.act_shape))
+        self._alloc("rewards", (self.episode_length, self.n_rollout_threads, 1))
         
-        self.masks = np.ones((self.episode_length + 1, self.n_rollout_threads, 1), dtype=np.float32)
-        self.bad_masks = np.ones_like(self.masks)
-        self.active_masks = np.ones_like(self.masks)
+        self._alloc("masks", (self.episode_length + 1, self.n_rollout_threads, 1), 1.0)
+        self._alloc("bad_masks", self.masks.shape, 1.0)
+        self._alloc("active_masks", self.masks.shape, 1.0)
 
         self.step = 0
 
+    def _alloc(self, name, shape, value=0.0):
+        """
+        Allocate a float32 buffer array, set as attribute.
+        :param name: (str) name of the attribute.
+        :param shape: (tuple) shape of the array.
+        :param value: (float) value of the array after each reset.
+        """
+        if self._use_torch_storage:
+            tensor = torch.full(shape, value, dtype=torch.float32)
+            if self._pin_memory:
+                tensor = tensor.pin_memory()
+            self._storage[name] = tensor
+            array = tensor.numpy()
+        else:
+            array = np.full(shape, value, dtype=np.float32)
+        self._init_values[name] = value
+        setattr(self, name, array)
+
+    def __getstate__(self):
+        # Arrays backed by tensors are rebuilt from the copied tensors
+        state = self.__dict__.copy()
+        for name in self._storage:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name, tensor in self._storage.items():
+            if self._pin_memory and not tensor.is_pinned():
+                tensor = tensor.pin_memory()
+                self._storage[name] = tensor
+            setattr(self, name, tensor.numpy())
+
+    def _get_data(self, name):
+        """
+        Get data to build minibatches from: the array, or with torch storage,
+        the tensor copied on the training device.
+        """
+        if self._use_torch_storage:
+            return self._storage[name].to(self.device, non_blocking=True)
+        else:
+            return getattr(self, name)
+
+    def _to_data(self, x):
+        """
+        Convert arrays not stored in the buffer (advantages, indexes) like the
+        buffer data.
+        """
+        if self._use_torch_storage:
+            return torch.from_numpy(x).to(self.device)
+        else:
+            return x
+
     def insert(self, share_obs, obs, rnn_states, rnn_states_critic, actions, action_log_probs,
                value_preds, rewards, masks, bad_masks=None, active_masks=None, available_actions=None):
-        self.share_obs[self.step + 1] = share_obs.copy()
-        self.obs[self.step + 1] = obs.copy()
-        self.rnn_states[self.step + 1] = rnn_states.copy()
-        self.rnn_states_critic[self.step + 1] = rnn_states_critic.copy()
-        self.actions[self.step] = actions.copy()
-        self.action_log_probs[self.step] = action_log_probs.copy()
-        self.value_preds[self.step] = value_preds.copy()
-        self.rewards[self.step] = rewards.copy()
-        self.masks[self.step + 1] = masks.copy()
+        # Inputs are copied in the buffer arrays by the assignments
+        self.share_obs[self.step + 1] = share_obs
+        self.obs[self.step + 1] = obs
+        self.rnn_states[self.step + 1] = rnn_states
+        self.rnn_states_critic[self.step + 1] = rnn_states_critic
+        self.actions[self.step] = actions
+        self.action_log_probs[self.step] = action_log_probs
+        self.value_preds[self.step] = value_preds
+        self.rewards[self.step] = rewards
+        self.masks[self.step + 1] = masks
         if bad_masks is not None:
-            self.bad_masks[self.step + 1] = bad_masks.copy()
+            self.bad_masks[self.step + 1] = bad_masks
         if active_masks is not None:
-            self.active_masks[self.step + 1] = active_masks.copy()
+            self.active_masks[self.step + 1] = active_masks
         if available_actions is not None:
-            self.available_actions[self.step + 1] = available_actions.copy()
+            self.available_actions[self.step + 1] = available_actions
         self.step += 1
     
     def reset_episode(self):
-        self.share_obs = np.zeros((self.episode_length + 1, self.n_rollout_threads, *self.share_obs_shape), dtype=np.float32)
-        self.obs = np.zeros((self.episode_length + 1, self.n_rollout_threads, *self.obs_shape), dtype=np.float32)
-        self.rnn_states = np.zeros((self.episode_length + 1, self.n_rollout_threads, self.recurrent_N, self.rnn_hidden_size), dtype=np.float32)
-        self.rnn_states_critic = np.zeros_like(self.rnn_states)
-        self.value_preds = np.zeros((self.episode_length + 1, self.n_rollout_threads, 1), dtype=np.float32)
-        self.returns = np.zeros((self.episode_length + 1, self.n_rollout_threads, 1), dtype=np.float32)
-        self.actions = np.zeros((self.episode_length, self.n_rollout_threads, self.act_shape), dtype=np.float32)
-        self.action_log_probs = np.zeros((self.episode_length, self.n_rollout_threads, self.act_shape), dtype=np.float32)
-        self.rewards = np.zeros((self.episode_length, self.n_rollout_threads, 1), dtype=np.float32)
-        self.masks = np.ones((self.episode_length + 1, self.n_rollout_threads, 1), dtype=np.float32)
-        self.bad_masks = np.ones_like(self.masks)
-        self.active_masks = np.ones_like(self.masks)
-        if self.available_actions is not None:
-            self.available_actions = np.ones((self.episode_length + 1, self.n_rollout_threads, self.act_space.n), dtype=np.float32)
+        for name, value in self._init_values.items():
+            getattr(self, name).fill(value)
         self.step = 0
 
     def compute_returns(self, next_value, value_normalizer=None):
-        if self._use_proper_time_limits:
-            if self._use_gae:
-                self.value_preds[-1] = next_value
-                gae = 0
-                for step in reversed(range(self.rewards.shape[0])):
-                    if self._use_popart or self._use_valuenorm:
-                        delta = self.rewards[step] + self.gamma * value_normalizer.denormalize(self.value_preds[
-                            step + 1]) * self.masks[step + 1] - value_normalizer.denormalize(self.value_preds[step])
-                        gae = delta + self.gamma * self.gae_lambda * self.masks[step + 1] * gae
-                        gae = gae * self.bad_masks[step + 1]
-                        self.returns[step] = gae + value_normalizer.denormalize(self.value_preds[step])
-                    else:
-                        delta = self.rewards[step] + self.gamma * self.value_preds[step + 1] * self.masks[step + 1] - self.value_preds[step]
-                        gae = delta + self.gamma * self.gae_lambda * self.masks[step + 1] * gae
-                        gae = gae * self.bad_masks[step + 1]
-                        self.returns[step] = gae + self.value_preds[step]
+        bad_masks = self.bad_masks if self._use_proper_time_limits else None
+        if self._use_gae:
+            self.value_preds[-1] = next_value
+            # Denormalize all value predictions at once
+            if self._use_popart or self._use_valuenorm:
+                values = value_normalizer.denormalize(self.value_preds)
             else:
-                self.returns[-1] = next_value
-                for step in reversed(range(self.rewards.shape[0])):
-                    if self._use_popart:
-                        self.returns[step] = (self.returns[step + 1] * self.gamma * self.masks[step + 1] + self.rewards[step]) * self.bad_masks[step + 1] \
-                            + (1 - self.bad_masks[step + 1]) * value_normalizer.denormalize(self.value_preds[step])
-                    else:
-                        self.returns[step] = (self.returns[step + 1] * self.gamma * self.masks[step + 1] + self.rewards[step]) * self.bad_masks[step + 1] \
-                            + (1 - self.bad_masks[step + 1]) * self.value_preds[step]
+                values = self.value_preds
+            compute_gae(self.rewards, values, self.masks, self.gamma, 
+                        self.gae_lambda, bad_masks, self.returns)
         else:
-            if self._use_gae:
-                self.value_preds[-1] = next_value
-                gae = 0
-                for step in reversed(range(self.rewards.shape[0])):
-                    if self._use_popart or self._use_valuenorm:
-                        delta = self.rewards[step] + self.gamma * value_normalizer.denormalize(self.value_preds[step + 1]) * self.masks[step + 1] - value_normalizer.denormalize(self.value_preds[step])
-                        gae = delta + self.gamma * self.gae_lambda * self.masks[step + 1] * gae
-                        self.returns[step] = gae + value_normalizer.denormalize(self.value_preds[step])
-                    else:
-                        delta = self.rewards[step] + self.gamma * self.value_preds[step + 1] * self.masks[step + 1] - self.value_preds[step]
-                        gae = delta + self.gamma * self.gae_lambda * self.masks[step + 1] * gae
-                        self.returns[step] = gae + self.value_preds[step]
+            if self._use_proper_time_limits and (self._use_popart):
+                values = value_normalizer.denormalize(self.value_preds)
             else:
-                self.returns[-1] = next_value
-                for step in reversed(range(self.rewards.shape[0])):
-                    self.returns[step] = self.returns[step + 1] * self.gamma * self.masks[step + 1] + self.rewards[step]
+                values = self.value_preds
+            compute_discounted_returns(self.rewards, next_value, self.masks, 
+                                       self.gamma, bad_masks, values, 
+                                       self.returns)
 
     def feed_forward_generator(self, advantages, num_mini_batch=None, mini_batch_size=None):
         episode_length, n_rollout_threads = self.rewards.shape[0:2]
@@ -157,21 +194,21 @@ class SeparatedReplayBuffer(object):
             mini_batch_size = batch_size // num_mini_batch
 
         rand = torch.randperm(batch_size).numpy()
-        sampler = [rand[i*mini_batch_size:(i+1)*mini_batch_size] for i in range(num_mini_batch)]
+        sampler = [self._to_data(rand[i*mini_batch_size:(i+1)*mini_batch_size]) for i in range(num_mini_batch)]
 
-        share_obs = self.share_obs[:-1].reshape(-1, *self.share_obs.shape[2:])
-        obs = self.obs[:-1].reshape(-1, *self.obs.shape[2:])
-        rnn_states = self.rnn_states[:-1].reshape(-1, *self.rnn_states.shape[2:])
-        rnn_states_critic = self.rnn_states_critic[:-1].reshape(-1, *self.rnn_states_critic.shape[2:])
-        actions = self.actions.reshape(-1, self.actions.shape[-1])
+        share_obs = self._get_data("share_obs")[:-1].reshape(-1, *self.share_obs.shape[2:])
+        obs = self._get_data("obs")[:-1].reshape(-1, *self.obs.shape[2:])
+        rnn_states = self._get_data("rnn_states")[:-1].reshape(-1, *self.rnn_states.shape[2:])
+        rnn_states_critic = self._get_data("rnn_states_critic")[:-1].reshape(-1, *self.rnn_states_critic.shape[2:])
+        actions = self._get_data("actions").reshape(-1, self.actions.shape[-1])
         if self.available_actions is not None:
-            available_actions = self.available_actions[:-1].reshape(-1, self.available_actions.shape[-1])
-        value_preds = self.value_preds[:-1].reshape(-1, 1)
-        returns = self.returns[:-1].reshape(-1, 1)
-        masks = self.masks[:-1].reshape(-1, 1)
-        active_masks = self.active_masks[:-1].reshape(-1, 1)
-        action_log_probs = self.action_log_probs.reshape(-1, self.action_log_probs.shape[-1])
-        advantages = advantages.reshape(-1, 1)
+            available_actions = self._get_data("available_actions")[:-1].reshape(-1, self.available_actions.shape[-1])
+        value_preds = self._get_data("value_preds")[:-1].reshape(-1, 1)
+        returns = self._get_data("returns")[:-1].reshape(-1, 1)
+        masks = self._get_data("masks")[:-1].reshape(-1, 1)
+        active_masks = self._get_data("active_masks")[:-1].reshape(-1, 1)
+        action_log_probs = self._get_data("action_log_probs").reshape(-1, self.action_log_probs.shape[-1])
+        advantages = self._to_data(advantages).reshape(-1, 1)
 
         for indices in sampler:
             # obs size [T+1 N Dim]-->[T N Dim]-->[T*N,Dim]-->[index,Dim]
@@ -204,54 +241,41 @@ class SeparatedReplayBuffer(object):
             "PPO mini batches ({}).".format(n_rollout_threads, num_mini_batch))
         num_envs_per_batch = n_rollout_threads // num_mini_batch
         perm = torch.randperm(n_rollout_threads).numpy()
+
+        share_obs = self._get_data("share_obs")
+        obs = self._get_data("obs")
+        rnn_states = self._get_data("rnn_states")
+        rnn_states_critic = self._get_data("rnn_states_critic")
+        actions = self._get_data("actions")
+        if self.available_actions is not None:
+            available_actions = self._get_data("available_actions")
+        value_preds = self._get_data("value_preds")
+        returns = self._get_data("returns")
+        masks = self._get_data("masks")
+        active_masks = self._get_data("active_masks")
+        action_log_probs = self._get_data("action_log_probs")
+        advantages = self._to_data(advantages)
+
         for start_ind in range(0, n_rollout_threads, num_envs_per_batch):
-            share_obs_batch = []
-            obs_batch = []
-            rnn_states_batch = []
-            rnn_states_critic_batch = []
-            actions_batch = []
-            available_actions_batch = []
-            value_preds_batch = []
-            return_batch = []
-            masks_batch = []
-            active_masks_batch = []
-            old_action_log_probs_batch = []
-            adv_targ = []
-
-            for offset in range(num_envs_per_batch):
-                ind = perm[start_ind + offset]
-                share_obs_batch.append(self.share_obs[:-1, ind])
-                obs_batch.append(self.obs[:-1, ind])
-                rnn_states_batch.append(self.rnn_states[0:1, ind])
-                rnn_states_critic_batch.append(self.rnn_states_critic[0:1, ind])
-                actions_batch.append(self.actions[:, ind])
-                if self.available_actions is not None:
-                    available_actions_batch.append(self.available_actions[:-1, ind])
-                value_preds_batch.append(self.value_preds[:-1, ind])
-                return_batch.append(self.returns[:-1, ind])
-                masks_batch.append(self.masks[:-1, ind])
-                active_masks_batch.append(self.active_masks[:-1, ind])
-                old_action_log_probs_batch.append(self.action_log_probs[:, ind])
-                adv_targ.append(advantages[:, ind])
-
-            # [N[T, dim]]
+            inds = self._to_data(perm[start_ind:start_ind + num_envs_per_batch])
+
+            # [T, N, dim]
             T, N = self.episode_length, num_envs_per_batch
-            # These are all from_numpys of size (T, N, -1)
-            share_obs_batch = np.stack(share_obs_batch, 1)
-            obs_batch = np.stack(obs_batch, 1)
-            actions_batch = np.stack(actions_batch, 1)
+            share_obs_batch = share_obs[:-1, inds]
+            obs_batch = obs[:-1, inds]
+            actions_batch = actions[:, inds]
             if self.available_actions is not None:
-                available_actions_batch = np.stack(available_actions_batch, 1)
-            value_preds_batch = np.stack(value_preds_batch, 1)
-            return_batch = np.stack(return_batch, 1)
-            masks_batch = np.stack(masks_batch, 1)
-            active_masks_batch = np.stack(active_masks_batch, 1)
-            old_action_log_probs_batch = np.stack(old_action_log_probs_batch, 1)
-            adv_targ = np.stack(adv_targ, 1)
-
-            # States is just a (N, -1) from_numpy [N[1,dim]]
-            rnn_states_batch = np.stack(rnn_states_batch, 1).reshape(N, *self.rnn_states.shape[2:])
-            rnn_states_critic_batch = np.stack(rnn_states_critic_batch, 1).reshape(N, *self.rnn_states_critic.shape[2:])
+                available_actions_batch = available_actions[:-1, inds]
+            value_preds_batch = value_preds[:-1, inds]
+            return_batch = returns[:-1, inds]
+            masks_batch = masks[:-1, inds]
+            active_masks_batch = active_masks[:-1, inds]
+            old_action_log_probs_batch = action_log_probs[:, inds]
+            adv_targ = advantages[:, inds]
+
+            # States is just a (N, -1) from_numpy
+            rnn_states_batch = rnn_states[0, inds]
+            rnn_states_critic_batch = rnn_states_critic[0, inds]
 
             # Flatten the (T, N, ...) from_numpys to (T * N, ...)
             share_obs_batch = _flatten(T, N, share_obs_batch)
@@ -285,81 +309,47 @@ class SeparatedReplayBuffer(object):
         rand = torch.randperm(data_chunks).numpy()
         sampler = [rand[i*mini_batch_size:(i+1)*mini_batch_size] for i in range(num_mini_batch)]
 
-        if len(self.share_obs.shape) > 3:
-            share_obs = self.share_obs[:-1].transpose(1, 0, 2, 3, 4).reshape(-1, *self.share_obs.shape[2:])
-            obs = self.obs[:-1].transpose(1, 0, 2, 3, 4).reshape(-1, *self.obs.shape[2:])
-        else:
-            share_obs = _cast(self.share_obs[:-1])
-            obs = _cast(self.obs[:-1])
-
-        actions = _cast(self.actions)
-        action_log_probs = _cast(self.action_log_probs)
-        advantages = _cast(advantages)
-        value_preds = _cast(self.value_preds[:-1])
-        returns = _cast(self.returns[:-1])
-        masks = _cast(self.masks[:-1])
-        active_masks = _cast(self.active_masks[:-1])
-        # rnn_states = _cast(self.rnn_states[:-1])
-        # rnn_states_critic = _cast(self.rnn_states_critic[:-1])
-        rnn_states = self.rnn_states[:-1].transpose(1, 0, 2, 3).reshape(-1, *self.rnn_states.shape[2:])
-        rnn_states_critic = self.rnn_states_critic[:-1].transpose(1, 0, 2, 3).reshape(-1, *self.rnn_states_critic.shape[2:])
+        # size [T+1 N Dim]-->[T N Dim]-->[N T Dim]-->[T*N,Dim]
+        share_obs = _cast(self._get_data("share_obs")[:-1])
+        obs = _cast(self._get_data("obs")[:-1])
+        actions = _cast(self._get_data("actions"))
+        action_log_probs = _cast(self._get_data("action_log_probs"))
+        advantages = _cast(self._to_data(advantages))
+        value_preds = _cast(self._get_data("value_preds")[:-1])
+        returns = _cast(self._get_data("returns")[:-1])
+        masks = _cast(self._get_data("masks")[:-1])
+        active_masks = _cast(self._get_data("active_masks")[:-1])
+        rnn_states = _cast(self._get_data("rnn_states")[:-1])
+        rnn_states_critic = _cast(self._get_data("rnn_states_critic")[:-1])
 
         if self.available_actions is not None:
-            available_actions = _cast(self.available_actions[:-1])
+            available_actions = _cast(self._get_data("available_actions")[:-1])
 
+        L, N = data_chunk_length, mini_batch_size
         for indices in sampler:
-            share_obs_batch = []
-            obs_batch = []
-            rnn_states_batch = []
-            rnn_states_critic_batch = []
-            actions_batch = []
-            available_actions_batch = []
-            value_preds_batch = []
-            return_batch = []
-            masks_batch = []
-            active_masks_batch = []
-            old_action_log_probs_batch = []
-            adv_targ = []
-
-            for index in indices:
-                ind = index * data_chunk_length
-                # size [T+1 N M Dim]-->[T N Dim]-->[N T Dim]-->[T*N,Dim]-->[L,Dim]
-                share_obs_batch.append(share_obs[ind:ind+data_chunk_length])
-                obs_batch.append(obs[ind:ind+data_chunk_length])
-                actions_batch.append(actions[ind:ind+data_chunk_length])
-                if self.available_actions is not None:
-                    available_actions_batch.append(available_actions[ind:ind+data_chunk_length])
-                value_preds_batch.append(value_preds[ind:ind+data_chunk_length])
-                return_batch.append(returns[ind:ind+data_chunk_length])
-                masks_batch.append(masks[ind:ind+data_chunk_length])
-                active_masks_batch.append(active_masks[ind:ind+data_chunk_length])
-                old_action_log_probs_batch.append(action_log_probs[ind:ind+data_chunk_length])
-                adv_targ.append(advantages[ind:ind+data_chunk_length])
-                # size [T+1 N Dim]-->[T N Dim]-->[T*N,Dim]-->[1,Dim]
-                rnn_states_batch.append(rnn_states[ind])
-                rnn_states_critic_batch.append(rnn_states_critic[ind])
-
-            L, N = data_chunk_length, mini_batch_size
-
-            # These are all from_numpys of size (N, L, Dim)
-            share_obs_batch = np.stack(share_obs_batch)
-            obs_batch = np.stack(obs_batch)
-
-            actions_batch = np.stack(actions_batch)
+            # Indexes of the steps in each chunk, [N, L]
+            starts = indices * data_chunk_length
+            chunk_inds = self._to_data(starts[:, None] + np.arange(L))
+            starts = self._to_data(starts)
+
+            # These are all of size (N, L, Dim)
+            share_obs_batch = share_obs[chunk_inds]
+            obs_batch = obs[chunk_inds]
+            actions_batch = actions[chunk_inds]
             if self.available_actions is not None:
-                available_actions_batch = np.stack(available_actions_batch)
-            value_preds_batch = np.stack(value_preds_batch)
-            return_batch = np.stack(return_batch)
-            masks_batch = np.stack(masks_batch)
-            active_masks_batch = np.stack(active_masks_batch)
-            old_action_log_probs_batch = np.stack(old_action_log_probs_batch)
-            adv_targ = np.stack(adv_targ)
-
-            # States is just a (N, -1) from_numpy
-            rnn_states_batch = np.stack(rnn_states_batch).reshape(N, *self.rnn_states.shape[2:])
-            rnn_states_critic_batch = np.stack(rnn_states_critic_batch).reshape(N, *self.rnn_states_critic.shape[2:])
-
-            # Flatten the (L, N, ...) from_numpys to (L * N, ...)
+                available_actions_batch = available_actions[chunk_inds]
+            value_preds_batch = value_preds[chunk_inds]
+            return_batch = returns[chunk_inds]
+            masks_batch = masks[chunk_inds]
+            active_masks_batch = active_masks[chunk_inds]
+            old_action_log_probs_batch = action_log_probs[chunk_inds]
+            adv_targ = advantages[chunk_inds]
+
+            # States is just a (N, -1), taken at the start of each chunk
+            rnn_states_batch = rnn_states[starts]
+            rnn_states_critic_batch = rnn_states_critic[starts]
+
+            # Flatten the (N, L, ...) arrays to (L * N, ...)
             share_obs_batch = _flatten(L, N, share_obs_batch)
             obs_batch = _flatten(L, N, obs_batch)
             actions_batch = _flatten(L, N, actions_batch)
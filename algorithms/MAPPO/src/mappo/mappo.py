@@ -1,3 +1,4 @@
+import copy
 import torch
 import numpy as np
 import torch.nn as nn
@@ -396,13 +397,25 @@ class MAPPO():
         else:
             raise NotImplementedError
 
+        # With a shared policy, a single policy is trained on the data of all
+        # agents, stored in one buffer as additional parallel threads
+        self.share_policy = self.args.share_policy
+        if self.share_policy:
+            n_policies = 1
+            n_buffer_threads = self.args.n_rollout_threads * self.n_agents
+        else:
+            n_policies = self.n_agents
+            n_buffer_threads = self.args.n_rollout_threads
+
         # Init agent policies
         self.policy = []
-        for a_id in range(self.n_agents):
+        self.trainer = []
+        self.buffer = []
+        for a_id in range(n_policies):
             if self.use_centralized_V:
                 shared_observation_space = self.shared_obs_space[a_id]
             else:
-                shared_observation_space = self.observation_space[a_id]
+                shared_observation_space = self.obs_space[a_id]
             # policy network
             po = R_MAPPOPolicy(self.args,
                 self.obs_space[a_id],
@@ -410,40 +423,124 @@ class MAPPO():
                 self.act_space[a_id],
                 device=device)
             self.policy.append(po)
-
-        self.trainer = []
-        self.buffer = []
-        for a_id in range(self.n_agents):
             # algorithm
             tr = R_MAPPOTrainAlgo(
                 self.args, self.policy[a_id], device=device)
+            self.trainer.append(tr)
             # buffer
-            if self.use_centralized_V:
-                shared_observation_space = self.shared_obs_space[a_id]
-            else:
-                shared_observation_space = self.observation_space[a_id]
             bu = SeparatedReplayBuffer(self.args, 
                 self.obs_space[a_id], 
                 shared_observation_space, 
-                self.act_space[a_id])
+                self.act_space[a_id],
+                n_buffer_threads,
+                device=device)
             self.buffer.append(bu)
-            self.trainer.append(tr)
+
+        # Pipelined training: rollouts are collected in one set of buffers 
+        # with a copy of the policies, while the trainers update the policies
+        # on the other set of buffers
+        self.pipelined = self.args.pipelined_training
+        if self.pipelined:
+            self.rollout_policy = [copy.deepcopy(po) for po in self.policy]
+            self.train_buffer = [copy.deepcopy(bu) for bu in self.buffer]
+        else:
+            self.rollout_policy = self.policy
+            self.train_buffer = self.buffer
+        # Number of updates done, of the rollout policy and of the policy 
+        # that collected the data in train_buffer
+        self.train_version = 0
+        self.rollout_version = 0
+        self.train_buffer_version = 0
+        # Number of updates between the policy that collected the training 
+        # data and the one trained on it during the last training
+        self.policy_lag = 0
 
     def prep_rollout(self, device=None):
         if device is None:
             device = self.train_device
-        for tr in self.trainer:
-            tr.prep_rollout(device)
+        if self.pipelined:
+            # Trained policies may be in use by the learner
+            for po in self.rollout_policy:
+                for net in [po.actor, po.critic]:
+                    net.eval()
+                    net.to(device)
+                    net.tpdv["device"] = device
+        else:
+            for tr in self.trainer:
+                tr.prep_rollout(device)
+
+    def swap_buffers(self):
+        """
+        Pipelined training: make the last collected rollout the training data
+        and collect the next rollout in the other buffers.
+        """
+        self.buffer, self.train_buffer = self.train_buffer, self.buffer
+        self.train_buffer_version = self.rollout_version
+
+    def sync_rollout_policy(self):
+        """
+        Pipelined training: copy the trained parameters in the policies used
+        for collecting rollouts. Must not be called during training.
+        """
+        for po, ro_po in zip(self.policy, self.rollout_policy):
+            ro_po.actor.load_state_dict(po.actor.state_dict())
+            ro_po.critic.load_state_dict(po.critic.state_dict())
+        self.rollout_version = self.train_version
 
     def prep_training(self):
         for tr in self.trainer:
             tr.prep_training(self.train_device)
 
+    def _flatten_agents(self, x):
+        """
+        Merge environment and agent dimensions, to store data of all agents in
+        the buffer of the shared policy.
+        :param x: (numpy.ndarray) data, dim=(n_envs, n_agents, ...)
+
+        :return x: (numpy.ndarray) data, dim=(n_envs * n_agents, ...)
+        """
+        return x.reshape(-1, *x.shape[2:])
+
+    def _get_share_obs(self, obs):
+        """
+        Get inputs of the critic(s) from observations.
+        :param obs: (numpy.ndarray) observations, dim=(n_envs, n_agents, ...)
+
+        :return share_obs: (numpy.ndarray) critic inputs, for the shared 
+            policy: dim=(n_envs * n_agents, ...), else: dim=(n_envs, ...)
+        """
+        if not self.use_centralized_V:
+            return self._flatten_agents(obs)
+        share_obs = obs.reshape(obs.shape[0], -1)
+        if self.share_policy:
+            share_obs = np.repeat(share_obs, self.n_agents, axis=0)
+        return share_obs
+
+    def get_buffer_data(self, name):
+        """
+        Get data of all agents from the buffers.
+        :param name: (str) name of the buffer attribute, e.g. "obs"
+
+        :return data: (numpy.ndarray) data, dim=(T, n_envs, n_agents, ...)
+        """
+        if self.share_policy:
+            data = getattr(self.buffer[0], name)
+            return data.reshape(
+                data.shape[0], -1, self.n_agents, *data.shape[2:])
+        else:
+            return np.stack(
+                [getattr(bu, name) for bu in self.buffer], axis=2)
+
     def start_episode(self, obs, _):
         """
         Initialize the buffer with first observations.
         :param obs: (numpy.ndarray) first observations
         """
+        if self.share_policy:
+            self.buffer[0].reset_episode()
+            self.buffer[0].share_obs[0] = self._get_share_obs(obs)
+            self.buffer[0].obs[0] = self._flatten_agents(obs)
+            return
         share_obs = obs.reshape(obs.shape[0], -1)
         for a_id in range(self.n_agents):
             self.buffer[a_id].reset_episode()
@@ -452,8 +549,31 @@ class MAPPO():
             self.buffer[a_id].share_obs[0] = share_obs.copy()
             self.buffer[a_id].obs[0] = obs[:, a_id].copy()
 
+    @torch.no_grad()
+    def get_shared_actions(self, step_i):
+        """
+        Get actions of all agents with the shared policy, in a single forward
+        pass with inputs of dim=(n_envs * n_agents, dim).
+        """
+        buffer = self.buffer[0]
+        outputs = self.rollout_policy[0].get_actions(
+            buffer.share_obs[step_i],
+            buffer.obs[step_i],
+            buffer.rnn_states[step_i],
+            buffer.rnn_states_critic[step_i],
+            buffer.masks[step_i])
+        # [envs, agents, dim]
+        values, actions, action_log_probs, rnn_states, rnn_states_critic = [
+            torch2numpy(out).reshape(-1, self.n_agents, *out.shape[1:])
+            for out in outputs]
+
+        return values, actions, action_log_probs, rnn_states, \
+               rnn_states_critic, actions
+
     @torch.no_grad()
     def get_actions(self, step_i):
+        if self.share_policy:
+            return self.get_shared_actions(step_i)
         values = []
         actions = []
         temp_actions_env = []
@@ -463,7 +583,7 @@ class MAPPO():
 
         for a_id in range(self.n_agents):
             value, action, action_log_prob, rnn_state, rnn_state_critic \
-                = self.trainer[a_id].policy.get_actions(
+                = self.rollout_policy[a_id].get_actions(
                     self.buffer[a_id].share_obs[step_i],
                     self.buffer[a_id].obs[step_i],
                     self.buffer[a_id].rnn_states[step_i],
@@ -507,6 +627,14 @@ class MAPPO():
         masks[dones == True] = np.zeros(
             ((dones == True).sum(), 1), dtype=np.float32)
 
+        if self.share_policy:
+            self.buffer[0].insert(
+                self._get_share_obs(obs),
+                *[self._flatten_agents(x) for x in [
+                    obs, rnn_states, rnn_states_critic, actions, 
+                    action_log_probs, values, rewards, masks]])
+            return
+
         share_obs = obs.reshape(obs.shape[0], -1)
 
         for a_id in range(self.n_agents):
@@ -524,37 +652,39 @@ class MAPPO():
                 masks[:, a_id])
 
     @torch.no_grad()
-    def compute_last_value(self):
-        for a_id in range(self.n_agents):
-            next_value = self.trainer[a_id].policy.get_values(
-                self.buffer[a_id].share_obs[-1], 
-                self.buffer[a_id].rnn_states_critic[-1],
-                self.buffer[a_id].masks[-1])
+    def compute_last_value(self, buffer):
+        for tr, bu in zip(self.trainer, buffer):
+            next_value = tr.policy.get_values(
+                bu.share_obs[-1], 
+                bu.rnn_states_critic[-1],
+                bu.masks[-1])
             next_value = torch2numpy(next_value)
-            self.buffer[a_id].compute_returns(
-                next_value, self.trainer[a_id].value_normalizer)
+            bu.compute_returns(next_value, tr.value_normalizer)
 
     def train(self):
+        if self.pipelined:
+            self.policy_lag = self.train_version - self.train_buffer_version
         # Compute last value
-        self.compute_last_value()
+        self.compute_last_value(self.train_buffer)
         # Train
         self.prep_training()
         train_infos = []
-        for a_id in range(self.n_agents):
-            train_info = self.trainer[a_id].train(self.buffer[a_id])
+        for tr, bu in zip(self.trainer, self.train_buffer):
+            train_info = tr.train(bu)
             train_infos.append(train_info)
+        self.train_version += 1
         return train_infos
 
     def _get_save_dict(self):
         self.prep_rollout("cpu")
         agents_params = []
-        for a_id in range(self.n_agents):
+        for tr in self.trainer:
             params = {
-                "actor": self.trainer[a_id].policy.actor.state_dict(),
-                "critic": self.trainer[a_id].policy.critic.state_dict()
+                "actor": tr.policy.actor.state_dict(),
+                "critic": tr.policy.critic.state_dict()
             }
-            if self.trainer[a_id]._use_valuenorm:
-                params["vnorm"] = self.trainer[a_id].value_normalizer.state_dict()
+            if tr._use_valuenorm:
+                params["vnorm"] = tr.value_normalizer.state_dict()
             agents_params.append(params)
         save_dict = {
             "agents_params": agents_params
@@ -3,7 +3,7 @@ import numpy as np
 
 from .mappo import MAPPO
 from .utils import get_shape_from_obs_space, get_shape_from_act_space
-from ..intrinsic_rewards.e2s_noveld import E2S_NovelD
+from ..intrinsic_rewards.e2s_noveld import E2S_NovelD, GroupedE2S_NovelD
 
 def get_ir_class_params(args):
     pass
@@ -20,6 +20,7 @@ class MAPPO_IR(MAPPO):
         self.device = device
         self.ir_mode = args.ir_mode
         self.ir_algo = args.ir_algo
+        self.ir_grouped = False
         if self.ir_algo == "e2s_noveld":
             if self.ir_mode == "central":
                 obs_dim = get_shape_from_obs_space(shared_obs_space[0])[0]
@@ -34,7 +35,8 @@ class MAPPO_IR(MAPPO):
                     args.ir_ridge,
                     args.ir_lr, 
                     device,
-                    args.ir_ablation)
+                    args.ir_ablation,
+                    args.ir_e3b_cov_mode)
             elif self.ir_mode == "local":
                 self.ir_model = [
                     E2S_NovelD(
@@ -46,8 +48,19 @@ class MAPPO_IR(MAPPO):
                         args.ir_ridge,
                         args.ir_lr, 
                         device,
-                        args.ir_ablation)
+                        args.ir_ablation,
+                        args.ir_e3b_cov_mode)
                     for a_i in range(self.n_agents)]
+                # Agents with the same spaces have their models evaluated 
+                # and trained together
+                self.ir_grouped = all(
+                    get_shape_from_obs_space(sp) == 
+                        get_shape_from_obs_space(obs_space[0])
+                    and get_shape_from_act_space(a_sp) == 
+                        get_shape_from_act_space(act_space[0])
+                    for sp, a_sp in zip(obs_space, act_space))
+                if self.ir_grouped:
+                    self.ir_model = GroupedE2S_NovelD(self.ir_model)
         else:
             print("Wrong intrinsic reward algo")
             raise NotImplementedError
@@ -59,6 +72,10 @@ class MAPPO_IR(MAPPO):
             # Initialise intrinsic reward model with first observation
             share_obs = obs.reshape(obs.shape[0], -1)
             self.ir_model.get_reward(torch.Tensor(share_obs).to(self.device))
+        elif self.ir_grouped:
+            self.ir_model.init_new_episode(n_episodes)
+            self.ir_model.get_reward(
+                torch.Tensor(obs.transpose((1, 0, 2))).to(self.device))
         elif self.ir_mode == "local":
             # Reshape observations by agents
             obs = torch.Tensor(obs.transpose((1, 0, 2))).to(self.device)
@@ -83,6 +100,10 @@ class MAPPO_IR(MAPPO):
             int_rewards = self.ir_model.get_reward(
                 torch.Tensor(next_share_obs).to(self.device))
             intr_rewards = int_rewards.unsqueeze(-1).repeat(1, self.n_agents)
+        elif self.ir_grouped:
+            # Rewards of all agents in one pass, dim=(n_agents, batch_size)
+            intr_rewards = self.ir_model.get_reward(torch.Tensor(
+                next_obs.transpose((1, 0, 2))).to(self.device)).T
         elif self.ir_mode == "local":
             intr_rewards = []
             # Reshape observations by agents
@@ -98,15 +119,26 @@ class MAPPO_IR(MAPPO):
         mappo_losses = super().train()
 
         if self.ir_mode == "central":
-            share_obs = torch.Tensor(self.buffer[0].share_obs).to(self.device)
-            share_acts = torch.Tensor(np.concatenate(
-                [buff.actions for buff in self.buffer], axis=-1)).to(self.device)
+            share_obs = torch.Tensor(
+                self.get_buffer_data("share_obs")[:, :, 0]).to(self.device)
+            actions = self.get_buffer_data("actions")
+            share_acts = torch.Tensor(actions.reshape(
+                *actions.shape[:2], -1)).to(self.device)
             ir_losses = self.ir_model.train(share_obs, share_acts)
+        elif self.ir_grouped:
+            # Agents first, dim=(n_agents, episode_length, n_envs, dim)
+            obs = torch.Tensor(
+                self.get_buffer_data("obs")).to(self.device).movedim(2, 0)
+            actions = torch.Tensor(
+                self.get_buffer_data("actions")).to(self.device).movedim(2, 0)
+            ir_losses = self.ir_model.train(obs, actions)
         elif self.ir_mode == "local":
+            obs = self.get_buffer_data("obs")
+            actions = self.get_buffer_data("actions")
             losses = [
                 self.ir_model[a_i].train(
-                    torch.Tensor(self.buffer[a_i].obs).to(self.device),
-                    torch.Tensor(self.buffer[a_i].actions).to(self.device))
+                    torch.Tensor(obs[:, :, a_i]).to(self.device),
+                    torch.Tensor(actions[:, :, a_i]).to(self.device))
                 for a_i in range(self.n_agents)]
             ir_losses = {
                 "rnd_loss": np.mean([l["rnd_loss"] for l in losses]),
@@ -118,7 +150,7 @@ class MAPPO_IR(MAPPO):
             device = self.device
         super().prep_rollout(device)
         self.device = device
-        if self.ir_mode == "central":
+        if self.ir_mode == "central" or self.ir_grouped:
             self.ir_model.set_eval(device)
         elif self.ir_mode == "local":
             for a_ir in self.ir_model:
@@ -129,14 +161,14 @@ class MAPPO_IR(MAPPO):
             device = self.train_device
         super().prep_training()
         self.device = device
-        if self.ir_mode == "central":
+        if self.ir_mode == "central" or self.ir_grouped:
             self.ir_model.set_train(device)
         elif self.ir_mode == "local":
             for a_ir in self.ir_model:
                 a_ir.set_train(device)
 
     def _get_ir_params(self):
-        if self.ir_mode == "central":
+        if self.ir_mode == "central" or self.ir_grouped:
             return self.ir_model.get_params()
         elif self.ir_mode == "local":
             return [a_ir.get_params() for a_ir in self.ir_model]
@@ -39,7 +39,7 @@ def get_config():
     
     Network parameters:
         --share_policy
-            by default True, all agents will share the same network; set to make training agents use different policies. 
+            by default False, each agent has its own network; set to make all agents share the same network, evaluated in a single batched pass for all agents. 
         --use_centralized_V
             by default True, use centralized training mode; or else will decentralized training mode.
         --stacked_frames <int>
@@ -178,8 +178,8 @@ def get_config():
                         default=100, help="Max length for any episode")
 
     # network parameters
-    parser.add_argument("--share_policy", action='store_false',
-                        default=True, help='Whether agent share the same policy')
+    parser.add_argument("--share_policy", action='store_true',
+                        default=False, help='Whether agent share the same policy')
     parser.add_argument("--use_centralized_V", action='store_false',
                         default=True, help="Whether to use centralized V function")
     parser.add_argument("--stacked_frames", type=int, default=1,
@@ -254,6 +254,10 @@ def get_config():
     # run parameters
     parser.add_argument("--use_linear_lr_decay", action='store_true',
                         default=False, help='use a linear schedule on the learning rate')
+    parser.add_argument("--pipelined_training", action='store_true', default=False, 
+                        help='train on the last rollout while collecting the next one with the policy from the previous update')
+    parser.add_argument("--buffer_pin_memory", action='store_true', default=False, 
+                        help='store rollouts in pinned torch tensors, copied once per training to the training device')
     # save parameters
     parser.add_argument("--save_interval", type=int, default=10000, help="number of steps between models saving")
 
@@ -281,6 +285,12 @@ def get_config():
     parser.add_argument("--ro_optim_diff_coeff", type=float, default=30.0, help="state dimension in the rel_overgen environment.")
     parser.add_argument("--ro_suboptim_diff_coeff", type=float, default=0.08)
     parser.add_argument("--ro_save_visited_states", action="store_true", default=False)
+    parser.add_argument("--mpe_batched_world", action="store_true", default=False,
+                        help="Step all MPE envs in one process with a batched physics engine.")
+    parser.add_argument("--env_shared_memory", action="store_true", default=False,
+                        help="Return env steps through shared memory instead of pipes.")
+    parser.add_argument("--envs_per_worker", type=int, default=1,
+                        help="Number of envs stepped by each env worker process.")
 
     # Intrinsic rewards parameters
     parser.add_argument("--ir_algo", type=str, default="none")
@@ -292,5 +302,8 @@ def get_config():
     parser.add_argument("--ir_scale_fac", type=float, default=0.5)
     parser.add_argument("--ir_ridge", type=float, default=0.1)
     parser.add_argument("--ir_ablation", type=str, default=None)
+    parser.add_argument("--ir_e3b_cov_mode", type=str, default="full", 
+                        choices=["full", "diag"], 
+                        help="E3B inverse covariance: full matrices, or only their diagonal for large ir_enc_dim")
 
     return parser
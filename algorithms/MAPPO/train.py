@@ -5,6 +5,7 @@ import random
 import numpy as np
 
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 from src.utils.config import get_config
 from src.utils.eval import perform_eval
@@ -67,6 +68,9 @@ def run():
         eval_envs = make_env(cfg, cfg.n_eval_threads, seed=cfg.seed * 10)
 
     # Create model
+    if cfg.pipelined_training:
+        assert cfg.ir_algo == "none", \
+            "Pipelined training is not supported with intrinsic rewards."
     if "ppo" in cfg.algorithm_name:
         if cfg.ir_algo == "none":
             algo = MAPPO(
@@ -88,6 +92,11 @@ def run():
     obs = envs.reset()
     algo.prep_rollout()
     algo.start_episode(obs, cfg.n_rollout_threads)
+    # In pipelined mode, training runs in a separate thread while the next 
+    # rollout is collected
+    if cfg.pipelined_training:
+        learner_thread = ThreadPoolExecutor(max_workers=1)
+    learner = None
     while step_i < cfg.n_steps:
         progress.print_progress(step_i)
         # Perform step
@@ -120,7 +129,18 @@ def run():
 
         # If end of episode
         if done:
-            train_losses = algo.train()
+            if cfg.pipelined_training:
+                # Wait for the update on the previous rollout, then train on
+                # this one while the next one is collected
+                train_losses = None
+                if learner is not None:
+                    train_losses = learner.result()
+                    logger.log_policy_lag(step_i, algo.policy_lag)
+                algo.swap_buffers()
+                algo.sync_rollout_policy()
+                learner = learner_thread.submit(algo.train)
+            else:
+                train_losses = algo.train()
             # Log train data
             step_i += logger.log_train(step_i, train_losses)
             # Reset env (env, buffer, log)
@@ -141,11 +161,16 @@ def run():
         # Save
         if step_i - last_save_step > cfg.save_interval:
             last_save_step = step_i
+            if learner is not None:
+                learner.result()
             algo.save(run_dir / "incremental" / ('model_ep%i.pt' % (step_i)))
             logger.save()
             algo.prep_rollout(device)
 
     progress.print_end()
+    if learner is not None:
+        learner.result()
+        learner_thread.shutdown()
     envs.close()
     # Save model and training data
     algo.save(run_dir / "model_ep.pt")
@@ -15,7 +15,8 @@ from tqdm import tqdm
 from models.qmix_mrp import QMIX_MRP
 from utils.buffer import RecReplayBuffer
 from utils.prio_buffer import PrioritizedRecReplayBuffer
-from utils.make_env import get_paths, load_scenario_config, make_env, make_env_parser
+from utils.make_env import get_paths, load_scenario_config, make_env, make_env_parser, \
+    make_parallel_env
 from utils.eval import perform_eval_scenar
 from utils.decay import ParameterDecay
 
@@ -68,6 +69,10 @@ def run(cfg):
         env = make_env(cfg.env_path, sce_conf, discrete_action=True)
         obs_dim = env.observation_space[0].shape[0]
         act_dim = env.action_space[0].n
+    # Parallel training environments, the first one is env when there is 
+    # only one
+    envs = make_parallel_env(cfg, sce_conf, discrete_action=True, env=env)
+    n_envs = cfg.n_parallel_envs
 
     # Create model
     nb_agents = sce_conf["nb_agents"]
@@ -131,6 +136,7 @@ def run(cfg):
     # Start training
     print(f"Starting training for {cfg.n_frames} frames")
     print(f"                  updates every {cfg.frames_per_update} frames")
+    print(f"                  in {n_envs} parallel environments")
     print(f"                  with seed {cfg.seed}")
     train_data_dict = {
         "Step": [],
@@ -140,26 +146,29 @@ def run(cfg):
         "Success": [],
         "Episode length": []
     }
-    # Reset episode data and environment
-    ep_step_i = 0
-    ep_ext_returns = np.zeros(nb_agents)
-    ep_int_returns = np.zeros(nb_agents)
-    ep_success = False
-    obs = env.reset()
+    env_ids = np.arange(n_envs)
+    # Reset episode data and environments
+    ep_step_i = np.zeros(n_envs, dtype=int)
+    ep_ext_returns = np.zeros((n_envs, nb_agents))
+    ep_int_returns = np.zeros((n_envs, nb_agents))
+    obs = envs.reset()
     # Init episode data for saving in replay buffer
     ep_obs, ep_shared_obs, ep_acts, ep_rews, ep_dones = \
-        buffer.init_episode_arrays()
+        buffer.init_episode_arrays(n_envs)
     # Get initial last actions and hidden states
-    last_actions, qnets_hidden_states = qmix.get_init_model_inputs()
-    for step_i in tqdm(range(cfg.n_frames)):
+    last_actions, qnets_hidden_states = qmix.get_init_model_inputs(n_envs)
+    # Each iteration steps all environments once, so n_envs frames
+    for step_i in tqdm(range(0, cfg.n_frames, n_envs)):
         qmix.set_explo_rate(eps_decay.get_param(step_i))
 
-        # Get actions
+        # Get actions of all environments at once
         actions, qnets_hidden_states = qmix.get_actions(
-            obs, last_actions, qnets_hidden_states, explore=True)
+            obs.swapaxes(0, 1), last_actions, qnets_hidden_states, 
+            explore=True)
         last_actions = actions
-        actions = [a.cpu().squeeze().data.numpy() for a in actions]
-        next_obs, ext_rewards, dones, _ = env.step(actions)
+        env_actions = [a.cpu().numpy() for a in actions]
+        next_obs, ext_rewards, dones, _ = envs.step(
+            [[a[e_i] for a in env_actions] for e_i in range(n_envs)])
 
         # Compute intrinsic rewards
         int_rewards = qmix.get_intrinsic_rewards(next_obs)
@@ -167,108 +176,135 @@ def run(cfg):
             coeff = cfg.int_reward_coeff
         else:
             coeff = int_reward_coeff.get_param(step_i)
-        rewards = np.array([ext_rewards]) + coeff * np.array([int_rewards])
-        rewards = rewards.T
+        rewards = ext_rewards + coeff * int_rewards
 
         # Save experience for replay buffer
-        ep_obs[ep_step_i, 0, :] = np.stack(obs)
-        ep_shared_obs[ep_step_i, 0, :] = np.tile(
-            np.concatenate(obs), (nb_agents, 1))
-        ep_acts[ep_step_i, 0, :] = np.stack(actions)
-        ep_rews[ep_step_i, 0, :] = rewards
-        ep_dones[ep_step_i, 0, :] = np.vstack(dones)
+        ep_obs[ep_step_i, env_ids] = obs
+        ep_shared_obs[ep_step_i, env_ids] = np.tile(
+            obs.reshape(n_envs, 1, -1), (1, nb_agents, 1))
+        ep_acts[ep_step_i, env_ids] = np.stack(env_actions, axis=1)
+        ep_rews[ep_step_i, env_ids] = rewards[..., np.newaxis]
+        ep_dones[ep_step_i, env_ids] = dones[..., np.newaxis]
 
         ep_ext_returns += ext_rewards
         ep_int_returns += int_rewards
-        if any(dones):
-            ep_success = True
+        ep_success = dones.any(axis=1)
         
-        # Check for end of episode
-        if ep_success or ep_step_i + 1 == cfg.episode_length:
+        # Check for end of episodes
+        ended = np.where(
+            ep_success | (ep_step_i + 1 == cfg.episode_length))[0]
+        if len(ended) > 0:
             # Store next state observations for last step
-            ep_obs[ep_step_i + 1, 0, :] = np.stack(next_obs)
-            ep_shared_obs[ep_step_i + 1, 0, :] = np.tile( 
-                np.concatenate(next_obs), (nb_agents, 1))
-            # Store episode in replay buffer
-            buffer.store(ep_obs, ep_shared_obs, ep_acts, ep_rews, ep_dones)
-            # Log training data
-            train_data_dict["Step"].append(step_i)
-            train_data_dict["Episode return"].append(
-                np.sum(ep_rews) / nb_agents)
-            train_data_dict["Episode extrinsic return"].append(
-                np.mean(ep_ext_returns))
-            train_data_dict["Episode intrinsic return"].append(
-                np.mean(ep_int_returns))
-            train_data_dict["Success"].append(int(ep_success))
-            train_data_dict["Episode length"].append(ep_step_i + 1)
-            # Log Tensorboard
-            logger.add_scalar(
-                'agent0/episode_return', 
-                train_data_dict["Episode return"][-1], 
-                train_data_dict["Step"][-1])
-            logger.add_scalar(
-                'agent0/episode_ext_return', 
-                train_data_dict["Episode extrinsic return"][-1], 
-                train_data_dict["Step"][-1])
-            logger.add_scalar(
-                'agent0/episode_int_return', 
-                train_data_dict["Episode intrinsic return"][-1], 
-                train_data_dict["Step"][-1])
-            # Reset episode data
-            ep_ext_returns = np.zeros(nb_agents)
-            ep_int_returns = np.zeros(nb_agents)
-            ep_step_i = 0
-            ep_success = False
-            # Init episode data for saving in replay buffer
-            ep_obs, ep_shared_obs, ep_acts, ep_rews, ep_dones = \
-                buffer.init_episode_arrays()
-            # Get initial last actions and hidden states
-            last_actions, qnets_hidden_states = qmix.get_init_model_inputs()
-            # Reset environment
-            obs = env.reset()
-            qmix.reset_int_reward(obs)
-        else:
-            ep_step_i += 1
-            obs = next_obs
+            ep_obs[ep_step_i[ended] + 1, ended] = next_obs[ended]
+            ep_shared_obs[ep_step_i[ended] + 1, ended] = np.tile(
+                next_obs[ended].reshape(len(ended), 1, -1), 
+                (1, nb_agents, 1))
+            # Store episodes in replay buffer
+            buffer.store(
+                ep_obs[:, ended], 
+                ep_shared_obs[:, ended], 
+                ep_acts[:, ended], 
+                ep_rews[:, ended], 
+                ep_dones[:, ended])
+            for e_i in ended:
+                # Log training data
+                train_data_dict["Step"].append(step_i)
+                train_data_dict["Episode return"].append(
+                    np.sum(ep_rews[:, e_i]) / nb_agents)
+                train_data_dict["Episode extrinsic return"].append(
+                    np.mean(ep_ext_returns[e_i]))
+                train_data_dict["Episode intrinsic return"].append(
+                    np.mean(ep_int_returns[e_i]))
+                train_data_dict["Success"].append(int(ep_success[e_i]))
+                train_data_dict["Episode length"].append(ep_step_i[e_i] + 1)
+                # Log Tensorboard
+                logger.add_scalar(
+                    'agent0/episode_return', 
+                    train_data_dict["Episode return"][-1], 
+                    train_data_dict["Step"][-1])
+                logger.add_scalar(
+                    'agent0/episode_ext_return', 
+                    train_data_dict["Episode extrinsic return"][-1], 
+                    train_data_dict["Step"][-1])
+                logger.add_scalar(
+                    'agent0/episode_int_return', 
+                    train_data_dict["Episode intrinsic return"][-1], 
+                    train_data_dict["Step"][-1])
+            # Reset episode data of ended environments
+            ep_ext_returns[ended] = 0.0
+            ep_int_returns[ended] = 0.0
+            for ep_array in (ep_obs, ep_shared_obs, ep_acts, ep_rews, 
+                             ep_dones):
+                ep_array[:, ended] = 0.0
+            # Reset last actions and hidden states of ended environments
+            keep = torch.ones(n_envs, device=last_actions[0].device)
+            keep[ended] = 0.0
+            last_actions = [la * keep[:, None] for la in last_actions]
+            qnets_hidden_states = [
+                h * keep[None, :, None] for h in qnets_hidden_states]
+            # Reset ended environments
+            next_obs[ended] = envs.reset(ended)
+            qmix.reset_int_reward(next_obs[ended], ended)
+        ep_step_i += 1
+        ep_step_i[ended] = 0
+        obs = next_obs
 
-        # Training
-        if ((step_i + 1) % cfg.frames_per_update == 0 and
-                len(buffer) >= cfg.batch_size):
+        # Training, once for each update period crossed by these frames
+        n_updates = (step_i + n_envs) // cfg.frames_per_update \
+            - step_i // cfg.frames_per_update
+        if n_updates > 0 and len(buffer) >= cfg.batch_size:
             qmix.prep_training(device=device)
-            # Get samples
-            if cfg.use_per:
-                b = beta.get_param(step_i)
-                sample_batch = buffer.sample(cfg.batch_size, b, device)
-            else:
-                sample_batch = buffer.sample(cfg.batch_size, device)
-            # Train
-            qmix_loss, int_reward_loss, new_prio = qmix.train(sample_batch)
+            for _ in range(n_updates):
+                # Get samples
+                if cfg.use_per:
+                    b = beta.get_param(step_i)
+                    sample_batch = buffer.sample(cfg.batch_size, b, device)
+                else:
+                    sample_batch = buffer.sample(cfg.batch_size, device)
+                # Train
+                qmix_loss, int_reward_loss, new_prio = qmix.train(
+                    sample_batch)
 
-            if cfg.use_per:
-                buffer.update_priorities(sample_batch[-1], new_prio)
+                if cfg.use_per:
+                    buffer.update_priorities(sample_batch[-1], new_prio)
 
-            loss_dict = {
-                "qtot_loss": qmix_loss,
-                "int_reward_loss": int_reward_loss}
-            # Log
-            logger.add_scalars('agent0/losses', loss_dict, step_i)
-            qmix.update_all_targets()
+                loss_dict = {
+                    "qtot_loss": qmix_loss,
+                    "int_reward_loss": int_reward_loss}
+                # Log
+                logger.add_scalars('agent0/losses', loss_dict, step_i)
+                qmix.update_all_targets()
             qmix.prep_rollouts(device=device)
             
         # Evaluation
-        if cfg.eval_every is not None and (step_i + 1) % cfg.eval_every == 0:
+        if cfg.eval_every is not None and (step_i + n_envs) // cfg.eval_every \
+                > step_i // cfg.eval_every:
             eval_return, eval_success_rate, eval_ep_len = perform_eval_scenar(
                 env, qmix, eval_scenar, cfg.episode_length, recurrent=True)
-            eval_data_dict["Step"].append(step_i + 1)
+            eval_data_dict["Step"].append(step_i + n_envs)
             eval_data_dict["Mean return"].append(eval_return)
             eval_data_dict["Success rate"].append(eval_success_rate)
             eval_data_dict["Mean episode length"].append(eval_ep_len)
             # Save eval data
             eval_df = pd.DataFrame(eval_data_dict)
             eval_df.to_csv(str(run_dir / 'evaluation_data.csv'))
+            if n_envs == 1:
+                # The training episode ran in the evaluation environment, 
+                # start a new one
+                ep_ext_returns[:] = 0.0
+                ep_int_returns[:] = 0.0
+                ep_step_i[:] = 0
+                for ep_array in (ep_obs, ep_shared_obs, ep_acts, ep_rews, 
+                                 ep_dones):
+                    ep_array[:] = 0.0
+                last_actions, qnets_hidden_states = \
+                    qmix.get_init_model_inputs(n_envs)
+                obs = envs.reset()
+                qmix.reset_int_reward(obs)
 
         # Save model
-        if (step_i + 1) % cfg.save_interval == 0:
+        if (step_i + n_envs) // cfg.save_interval \
+                > step_i // cfg.save_interval:
             os.makedirs(run_dir / 'incremental', exist_ok=True)
             qmix.save(run_dir / 'incremental' / ('model_ep%i.pt' % (step_i)))
             qmix.save(model_cp_path)
@@ -277,7 +313,11 @@ def run(cfg):
             train_df = pd.DataFrame(train_data_dict)
             train_df.to_csv(str(run_dir / 'training_data.csv'))
 
-    env.close()
+    if "rel_overgen.py" in cfg.env_path and cfg.save_visited_states:
+        visited_states = []
+        for env_visited_states in envs.get_attr("visited_states"):
+            visited_states += env_visited_states[:-1]
+    envs.close()
     # Save model
     qmix.save(model_cp_path)
     # Log Tensorboard
@@ -291,7 +331,7 @@ def run(cfg):
         eval_df.to_csv(str(run_dir / 'evaluation_data.csv'))
     if "rel_overgen.py" in cfg.env_path and cfg.save_visited_states:
         with open(str(run_dir / "visited_states.json"), 'w') as f:
-            json.dump(env.visited_states[:-1], f)
+            json.dump(visited_states, f)
     print("Model saved in dir", run_dir)
 
 
@@ -315,6 +355,8 @@ if __name__ == '__main__':
     parser.add_argument("--batch_size", default=32, type=int,
                         help="Number of episodes to sample from replay buffer for training.")
     parser.add_argument("--save_interval", default=100000, type=int)
+    parser.add_argument("--n_parallel_envs", default=1, type=int,
+                        help="Number of environments run in parallel")
     # Replay Buffer
     parser.add_argument("--buffer_length", default=5000, type=int,
                         help="Max number of episodes stored in replay buffer.")
@@ -0,0 +1,153 @@
+"""
+Vectorized multi-agent environments, modified from OpenAI Baselines code.
+Environments are not reset automatically at the end of episodes, the training
+loop resets the environments it needs with reset(env_ids).
+"""
+import numpy as np
+
+from multiprocessing import Process, Pipe
+
+
+class CloudpickleWrapper(object):
+    """
+    Uses cloudpickle to serialize contents (otherwise multiprocessing tries
+    to use pickle)
+    """
+    def __init__(self, x):
+        self.x = x
+
+    def __getstate__(self):
+        import cloudpickle
+        return cloudpickle.dumps(self.x)
+
+    def __setstate__(self, ob):
+        import pickle
+        self.x = pickle.loads(ob)
+
+
+def worker(remote, parent_remote, env_fn_wrapper):
+    parent_remote.close()
+    env = env_fn_wrapper.x()
+    while True:
+        cmd, data = remote.recv()
+        if cmd == 'step':
+            remote.send(env.step(data))
+        elif cmd == 'reset':
+            remote.send(env.reset())
+        elif cmd == 'get_attr':
+            remote.send(getattr(env, data))
+        elif cmd == 'close':
+            remote.close()
+            break
+        elif cmd == 'get_spaces':
+            remote.send((env.observation_space, env.action_space))
+        else:
+            raise NotImplementedError
+
+
+class SubprocVecEnv(object):
+    def __init__(self, env_fns):
+        """
+        Runs each environment in its own subprocess.
+        Inputs:
+            env_fns (list): Functions creating the environments.
+        """
+        self.closed = False
+        self.n_envs = len(env_fns)
+        self.remotes, self.work_remotes = zip(
+            *[Pipe() for _ in range(self.n_envs)])
+        self.ps = [
+            Process(
+                target=worker,
+                args=(work_remote, remote, CloudpickleWrapper(env_fn)))
+            for (work_remote, remote, env_fn)
+            in zip(self.work_remotes, self.remotes, env_fns)]
+        for p in self.ps:
+            # if the main process crashes, we should not cause things to hang
+            p.daemon = True
+            p.start()
+        for remote in self.work_remotes:
+            remote.close()
+
+        self.remotes[0].send(('get_spaces', None))
+        self.observation_space, self.action_space = self.remotes[0].recv()
+
+    def step(self, actions):
+        """
+        Step all environments.
+        Inputs:
+            actions (list): Actions of each environment.
+        Outputs:
+            obs (numpy.ndarray): Next observations, dim=(n_envs, nb_agents,
+                obs_dim).
+            rews (numpy.ndarray): Rewards, dim=(n_envs, nb_agents).
+            dones (numpy.ndarray): Done states, dim=(n_envs, nb_agents).
+            infos (tuple): Info returned by each environment.
+        """
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        results = [remote.recv() for remote in self.remotes]
+        obs, rews, dones, infos = zip(*results)
+        return np.stack(obs), np.stack(rews), np.stack(dones), infos
+
+    def reset(self, env_ids=None):
+        """
+        Reset environments.
+        Inputs:
+            env_ids (list): Indexes of the environments to reset, all if None.
+        Outputs:
+            obs (numpy.ndarray): First observations of the reset
+                environments, dim=(len(env_ids), nb_agents, obs_dim).
+        """
+        if env_ids is None:
+            env_ids = range(self.n_envs)
+        for e_i in env_ids:
+            self.remotes[e_i].send(('reset', None))
+        return np.stack([self.remotes[e_i].recv() for e_i in env_ids])
+
+    def get_attr(self, name):
+        """ Returns the list of values of an attribute in each environment. """
+        for remote in self.remotes:
+            remote.send(('get_attr', name))
+        return [remote.recv() for remote in self.remotes]
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+        self.closed = True
+
+
+class DummyVecEnv(object):
+    def __init__(self, env_fns):
+        """
+        Runs all environments sequentially in the main process.
+        Inputs:
+            env_fns (list): Functions creating the environments.
+        """
+        self.envs = [fn() for fn in env_fns]
+        self.n_envs = len(self.envs)
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+
+    def step(self, actions):
+        """ See SubprocVecEnv.step. """
+        results = [env.step(a) for (a, env) in zip(actions, self.envs)]
+        obs, rews, dones, infos = zip(*results)
+        return np.stack(obs), np.stack(rews), np.stack(dones), infos
+
+    def reset(self, env_ids=None):
+        """ See SubprocVecEnv.reset. """
+        if env_ids is None:
+            env_ids = range(self.n_envs)
+        return np.stack([self.envs[e_i].reset() for e_i in env_ids])
+
+    def get_attr(self, name):
+        return [getattr(env, name) for env in self.envs]
+
+    def close(self):
+        for env in self.envs:
+            env.close()
@@ -6,6 +6,8 @@ import re
 from pathlib import Path
 from shutil import copyfile
 
+from .env_wrappers import SubprocVecEnv, DummyVecEnv
+
 def make_env(scenario_path, sce_conf={}, discrete_action=False):
     '''
     Creates a MultiAgentEnv object as env. This can be used similar to a gym
@@ -36,6 +38,38 @@ def make_env(scenario_path, sce_conf={}, discrete_action=False):
         discrete_action=discrete_action)
     return env
 
+def make_parallel_env(cfg, sce_conf={}, discrete_action=False, env=None):
+    """
+    Creates cfg.n_parallel_envs environments stepped together, in 
+    subprocesses if there are more than one.
+    Inputs:
+        cfg (argparse.Namespace): Config, with the path of the scenario in 
+            cfg.env_path.
+        sce_conf (dict): Scenario config.
+        discrete_action (bool): Whether the environments use discrete actions.
+        env (object): Already created environment, used as is when only one
+            environment is needed.
+    Outputs:
+        envs (SubprocVecEnv or DummyVecEnv): Vectorized environments.
+    """
+    def get_env_fn(rank):
+        def init_env():
+            # Different random streams in each subprocess
+            np.random.seed(cfg.seed + rank * 1000)
+            env = make_env(
+                cfg.env_path, sce_conf, discrete_action=discrete_action)
+            if hasattr(env, "seed"):
+                env.seed(cfg.seed + rank * 1000)
+            return env
+        return init_env
+    if cfg.n_parallel_envs == 1:
+        if env is not None:
+            return DummyVecEnv([lambda: env])
+        return DummyVecEnv([get_env_fn(0)])
+    else:
+        return SubprocVecEnv(
+            [get_env_fn(i) for i in range(cfg.n_parallel_envs)])
+
 def make_env_parser(scenario_path, sce_conf={}, discrete_action=False):
     from multiagent.environment import MultiAgentEnv
 
@@ -30,34 +30,21 @@ class SegmentTree(object):
             b) user has access to an efficient ( O(log segment size) )
                `reduce` operation which reduces `operation` over
                a contiguous subsequence of items in the array.
+        Nodes are stored in a flat array, node i having children 2i and
+        2i + 1, so ranges of items can be set with one vectorized operation
+        per level of the tree (see `set_range`).
         :param capacity: (int) Total size of the array - must be a power of two.
-        :param operation: (lambda (Any, Any): Any) operation for combining elements (eg. sum, max) must form a
+        :param operation: (numpy.ufunc) operation for combining elements (eg. sum, max) must form a
             mathematical group together with the set of possible values for array elements (i.e. be associative)
         :param neutral_element: (Any) neutral element for the operation above. eg. float('-inf') for max and 0 for sum.
         """
         assert capacity > 0 and capacity & (
             capacity - 1) == 0, "capacity must be positive and a power of 2."
         self._capacity = capacity
-        self._value = [neutral_element for _ in range(2 * capacity)]
+        self._value = np.full(2 * capacity, neutral_element, dtype=np.float64)
         self._operation = operation
         self.neutral_element = neutral_element
 
-    def _reduce_helper(self, start, end, node, node_start, node_end):
-        if start == node_start and end == node_end:
-            return self._value[node]
-        mid = (node_start + node_end) // 2
-        if end <= mid:
-            return self._reduce_helper(start, end, 2 * node, node_start, mid)
-        else:
-            if mid + 1 <= start:
-                return self._reduce_helper(start, end, 2 * node + 1, mid + 1, node_end)
-            else:
-                return self._operation(
-                    self._reduce_helper(start, mid, 2 * node, node_start, mid),
-                    self._reduce_helper(
-                        mid + 1, end, 2 * node + 1, mid + 1, node_end)
-                )
-
     def reduce(self, start=0, end=None):
         """
         Returns result of applying `self.operation`
@@ -72,16 +59,77 @@ class SegmentTree(object):
         if end < 0:
             end += self._capacity
         end -= 1
-        return self._reduce_helper(start, end, 1, 0, self._capacity - 1)
+        if start == 0 and end == self._capacity - 1:
+            return self._value[1]
+        # Walk up from the leaves bounding the range [start, end], gathering
+        # the nodes that cover it, then reduce them at once
+        left = start + self._capacity
+        right = end + self._capacity + 1
+        nodes = []
+        while left < right:
+            if left & 1:
+                nodes.append(left)
+                left += 1
+            if right & 1:
+                right -= 1
+                nodes.append(right)
+            left //= 2
+            right //= 2
+        if len(nodes) == 0:
+            return self.neutral_element
+        return self._operation.reduce(self._value[nodes])
+
+    def _update_range(self, start, end):
+        """
+        Recompute the ancestors of the leaves of items [start, end).
+        :param start: (int) first item of the range.
+        :param end: (int) end of the range, excluded.
+        """
+        # Parents of a contiguous range of nodes are contiguous
+        start = (start + self._capacity) // 2
+        end = (end - 1 + self._capacity) // 2 + 1
+        while start > 0:
+            self._value[start:end] = self._operation(
+                self._value[2 * start:2 * end:2],
+                self._value[2 * start + 1:2 * end:2])
+            start //= 2
+            end = (end - 1) // 2 + 1
+
+    def set_range(self, start, end, val, size=None):
+        """
+        Set the items of a range of consecutive indexes, updating each level
+        of the tree with one vectorized operation.
+        :param start: (int) first index of the range.
+        :param end: (int) end of the range, excluded. If greater than size,
+            the range wraps around to the start of the array.
+        :param val: (float or np.ndarray) values to set, one for each index
+            of the range or a single value for all.
+        :param size: (int) size of the array for wrapping around, e.g. the
+            size of the buffer, default is the capacity of the tree.
+        """
+        if size is None:
+            size = self._capacity
+        assert 0 <= start < size and start <= end <= start + size
+        if end <= size:
+            segments = [(start, end)]
+        else:
+            segments = [(start, size), (0, end - size)]
+        val = np.broadcast_to(val, (end - start,))
+        n_set = 0
+        for seg_start, seg_end in segments:
+            if seg_end == seg_start:
+                continue
+            self._value[self._capacity + seg_start:self._capacity + seg_end] \
+                = val[n_set:n_set + seg_end - seg_start]
+            n_set += seg_end - seg_start
+            self._update_range(seg_start, seg_end)
 
     def __setitem__(self, idx, val):
         # indexes of the leaf
-        idxs = idx + self._capacity
+        idxs = np.atleast_1d(idx + self._capacity)
         self._value[idxs] = val
-        if isinstance(idxs, int):
-            idxs = np.array([idxs])
         # go up one level in the tree and remove duplicate indexes
-        idxs = unique(idxs // 2)
+        idxs = unique(np.sort(idxs // 2))
         while len(idxs) > 1 or idxs[0] > 0:
             # as long as there are non-zero indexes, update the corresponding values
             self._value[idxs] = self._operation(
@@ -104,7 +152,6 @@ class SumSegmentTree(SegmentTree):
             operation=np.add,
             neutral_element=0.0
         )
-        self._value = np.array(self._value)
 
     def sum(self, start=0, end=None):
         """
@@ -156,7 +203,6 @@ class MinSegmentTree(SegmentTree):
             operation=np.minimum,
             neutral_element=float('inf')
         )
-        self._value = np.array(self._value)
 
     def min(self, start=0, end=None):
         """
@@ -186,14 +232,17 @@ class PrioritizedRecReplayBuffer(RecReplayBuffer):
     def store(self, ep_obs, ep_shared_obs, ep_acts, ep_rews, ep_dones):
         """See parent class."""
         super().store(ep_obs, ep_shared_obs, ep_acts, ep_rews, ep_dones)
-        n_entries = ep_obs[0].shape[1]
+        n_entries = ep_obs.shape[1]
         id_end = self.buffer_size if self.curr_i == 0 else self.curr_i
-        id_start = id_end - n_entries
-        if id_start < 0:
-            print("LOOOOOOL")
-        for idx in range(id_start, id_end):
-                self._it_sums[idx] = self.max_priorities ** self.alpha
-                self._it_mins[idx] = self.max_priorities ** self.alpha
+        # Episodes were written just before curr_i, possibly wrapping around
+        # the end of the buffer
+        id_start = (id_end - n_entries) % self.buffer_size
+        self._it_sums.set_range(
+            id_start, id_start + n_entries,
+            self.max_priorities ** self.alpha, self.buffer_size)
+        self._it_mins.set_range(
+            id_start, id_start + n_entries,
+            self.max_priorities ** self.alpha, self.buffer_size)
 
     def _sample_proportional(self, batch_size):
         total = self._it_sums.sum(0, len(self) - 1)
@@ -73,6 +73,50 @@ class QMix(Trainer):
         if self.args.use_double_q:
             print("double Q learning will be used")
 
+        # previous actions fed to the q networks during training, allocated
+        # once per policy and reused across batches
+        self.prev_act_buffers = {}
+
+    def _get_valid_length(self, dones_env_batch):
+        """
+        Get the number of steps to unroll so that all valid transitions of
+        the sampled episodes are included. Transitions after a terminal step
+        are masked out of the loss, so later steps can be skipped.
+        :param dones_env_batch: (torch.Tensor) environment terminal status,
+            dim=(episode_length, batch_size, 1).
+
+        :return valid_length: (int) number of steps to unroll.
+        """
+        if not self.args.truncate_episodes:
+            return self.episode_length
+        not_done_steps = torch.nonzero(
+            (dones_env_batch == 0).any(dim=-1).any(dim=-1))
+        if len(not_done_steps) == 0:
+            return 1
+        # step after the last non terminal step is the last valid one
+        return min(int(not_done_steps[-1]) + 2, self.episode_length)
+
+    def _get_prev_act_buffer(self, p_id, stacked_act_batch):
+        """
+        Get previous actions of a sequence of actions, i.e. the actions
+        shifted by one step with zeros as first previous actions, written in
+        a preallocated buffer.
+        :param p_id: (str) id of the policy.
+        :param stacked_act_batch: (torch.Tensor) actions taken,
+            dim=(seq_len, batch_size, act_dim).
+
+        :return prev_act_buffer_seq: (torch.Tensor) previous actions,
+            dim=(seq_len + 1, batch_size, act_dim).
+        """
+        seq_len, batch_size, act_dim = stacked_act_batch.shape
+        buffer = self.prev_act_buffers.get(p_id)
+        if buffer is None or buffer.shape[1:] != (batch_size, act_dim):
+            buffer = torch.zeros(
+                self.episode_length + 1, batch_size, act_dim, **self.tpdv)
+            self.prev_act_buffers[p_id] = buffer
+        buffer[1:seq_len + 1] = stacked_act_batch
+        return buffer[:seq_len + 1]
+
     def train_policy_on_batch(self, batch, update_policy_id=None):
         """See parent class."""
         # unpack the batch
@@ -82,10 +126,13 @@ class QMix(Trainer):
         avail_act_batch, \
         importance_weights, idxes = batch
 
-        choose_agent_id = 0
-        cent_obs_batch = to_torch(cent_obs_batch[self.policy_ids[0]][choose_agent_id])
-
         dones_env_batch = to_torch(dones_env_batch[self.policy_ids[0]]).to(**self.tpdv)
+        # only unroll up to the last valid step of the sampled episodes
+        seq_len = self._get_valid_length(dones_env_batch)
+        dones_env_batch = dones_env_batch[:seq_len]
+
+        choose_agent_id = 0
+        cent_obs_batch = to_torch(cent_obs_batch[self.policy_ids[0]][choose_agent_id][:seq_len + 1])
 
         # individual agent q value sequences: each element is of shape (ep_len, batch_size, 1)
         agent_q_seq = []
@@ -97,27 +144,23 @@ class QMix(Trainer):
             policy = self.policies[p_id]
             target_policy = self.target_policies[p_id]
             # get data related to the policy id
-            pol_obs_batch = to_torch(obs_batch[p_id])
-            curr_act_batch = to_torch(act_batch[p_id]).to(**self.tpdv)
+            pol_obs_batch = to_torch(obs_batch[p_id][:, :seq_len + 1]).to(**self.tpdv)
+            curr_act_batch = to_torch(act_batch[p_id][:, :seq_len]).to(**self.tpdv)
 
             # stack over policy's agents to process them at once
-            stacked_act_batch = torch.cat(list(curr_act_batch), dim=-2)
-            stacked_obs_batch = torch.cat(list(pol_obs_batch), dim=-2)
+            # [num_agents, episode_length, episodes, dim] -> [episode_length, num_agents * episodes, dim]
+            n_pol_agents, _, batch_size = pol_obs_batch.shape[:3]
+            total_batch_size = batch_size * n_pol_agents
+            stacked_act_batch = curr_act_batch.transpose(0, 1).reshape(seq_len, total_batch_size, -1)
+            stacked_obs_batch = pol_obs_batch.transpose(0, 1).reshape(seq_len + 1, total_batch_size, -1)
 
             if avail_act_batch[p_id] is not None:
-                curr_avail_act_batch = to_torch(avail_act_batch[p_id])
+                curr_avail_act_batch = to_torch(avail_act_batch[p_id][:, :seq_len + 1])
                 stacked_avail_act_batch = torch.cat(list(curr_avail_act_batch), dim=-2)
             else:
                 stacked_avail_act_batch = None
 
-            # [num_agents, episode_length, episodes, dim]
-            batch_size = pol_obs_batch.shape[2]
-            total_batch_size = batch_size * len(self.policy_agents[p_id])
-
-            sum_act_dim = int(sum(policy.act_dim)) if policy.multidiscrete else policy.act_dim
-
-            pol_prev_act_buffer_seq = torch.cat((torch.zeros(1, total_batch_size, sum_act_dim).to(**self.tpdv),
-                                                 stacked_act_batch))
+            pol_prev_act_buffer_seq = self._get_prev_act_buffer(p_id, stacked_act_batch)
 
             # sequence of q values for all possible actions
             pol_all_q_seq, _ = policy.get_q_values(stacked_obs_batch, pol_prev_act_buffer_seq,
@@ -132,6 +175,8 @@ class QMix(Trainer):
             agent_q_seq.append(torch.cat(agent_q_out_sequence, dim=-1))
 
             with torch.no_grad():
+                # single target unroll, double q reuses the live q values above
+                # instead of unrolling the live network again
                 if self.args.use_double_q:
                     # choose greedy actions from live, but get corresponding q values from target
                     greedy_actions, _ = policy.actions_from_q(pol_all_q_seq, available_actions=stacked_avail_act_batch)
@@ -152,9 +197,9 @@ class QMix(Trainer):
         next_step_Q_tot_seq = self.target_mixer(agent_nq_seq, cent_obs_batch[1:]).squeeze(-1)
 
         # agents share reward
-        rewards = to_torch(rew_batch[self.policy_ids[0]][0]).to(**self.tpdv)
+        rewards = to_torch(rew_batch[self.policy_ids[0]][0][:seq_len]).to(**self.tpdv)
         # form bad transition mask
-        bad_transitions_mask = torch.cat((torch.zeros(1, batch_size, 1).to(**self.tpdv), dones_env_batch[:self.episode_length - 1, :, :]))
+        bad_transitions_mask = torch.cat((torch.zeros(1, batch_size, 1).to(**self.tpdv), dones_env_batch[:seq_len - 1, :, :]))
 
         # bootstrapped targets
         Q_tot_target_seq = rewards + (1 - dones_env_batch) * self.args.gamma * next_step_Q_tot_seq
@@ -173,7 +218,8 @@ class QMix(Trainer):
 
             # new priorities are a combination of the maximum TD error across sequence and the mean TD error across sequence (see R2D2 paper)
             td_errors = error.abs().cpu().detach().numpy()
-            new_priorities = ((1 - self.args.per_nu) * td_errors.mean(axis=0) +
+            # truncated steps have no error, average over the full episode length
+            new_priorities = ((1 - self.args.per_nu) * td_errors.sum(axis=0) / self.episode_length +
                               self.args.per_nu * td_errors.max(axis=0)).flatten() + self.per_eps
         else:
             if self.use_huber_loss:
@@ -191,7 +237,7 @@ class QMix(Trainer):
         train_info = {}
         train_info['loss'] = loss
         train_info['grad_norm'] = grad_norm
-        train_info['Q_tot'] = (Q_tot_seq * (1 - bad_transitions_mask)).mean()
+        train_info['Q_tot'] = (Q_tot_seq * (1 - bad_transitions_mask)).sum() / (self.episode_length * Q_tot_seq.shape[1])
 
         return train_info, new_priorities, idxes
 
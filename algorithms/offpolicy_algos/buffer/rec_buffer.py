@@ -1,6 +1,6 @@
 import numpy as np
 from offpolicy.utils.util import get_dim_from_space
-from offpolicy.utils.segment_tree import SumSegmentTree, MinSegmentTree
+from utils.segment_tree import SumSegmentTree, MinSegmentTree
 
 
 def _cast(x):
@@ -249,6 +249,7 @@ class PrioritizedRecReplayBuffer(RecReplayBuffer):
                                                          episode_length, use_same_share_obs, use_avail_acts,
                                                          use_reward_normalization)
         self.alpha = alpha
+        self.buffer_size = buffer_size
         self.policy_info = policy_info
         it_capacity = 1
         while it_capacity < buffer_size:
@@ -263,10 +264,11 @@ class PrioritizedRecReplayBuffer(RecReplayBuffer):
     def insert(self, num_insert_episodes, obs, share_obs, acts, rewards, dones, dones_env, avail_acts=None):
         """See parent class."""
         idx_range = super().insert(num_insert_episodes, obs, share_obs, acts, rewards, dones, dones_env, avail_acts)
-        for idx in range(idx_range[0], idx_range[1]):
-            for p_id in self.policy_info.keys():
-                self._it_sums[p_id][idx] = self.max_priorities[p_id] ** self.alpha
-                self._it_mins[p_id][idx] = self.max_priorities[p_id] ** self.alpha
+        # idx_range holds consecutive indexes, possibly wrapping around the end of the buffer
+        start, end = idx_range[0], idx_range[0] + len(idx_range)
+        for p_id in self.policy_info.keys():
+            self._it_sums[p_id].set_range(start, end, self.max_priorities[p_id] ** self.alpha, self.buffer_size)
+            self._it_mins[p_id].set_range(start, end, self.max_priorities[p_id] ** self.alpha, self.buffer_size)
 
         return idx_range
 
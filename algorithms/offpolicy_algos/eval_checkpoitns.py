@@ -5,15 +5,119 @@ import os
 import numpy as np
 import pandas as pd
 
+from multiprocessing import Pool
+
 from algo.qmix.QMixPolicy import QMixPolicy
 from utils.make_env import make_env
 
 from offpolicy.utils.util import get_dim_from_space
 
 
+# Environments and policy of the evaluation process, created once by init_eval
+eval_context = {}
+
+def init_eval(args, sce_conf, init_pos_scenars):
+    """
+    Creates the environments, one per initial position, and the policy used
+    to evaluate checkpoints in the current process.
+    """
+    torch.set_num_threads(1)
+    envs = [
+        make_env(args.env_path, discrete_action=args.discrete_action, 
+                 sce_conf=sce_conf)
+        for _ in range(len(init_pos_scenars))]
+    policy_config = {
+            "cent_obs_dim": get_dim_from_space(
+                                envs[0].share_observation_space[0]),
+            "obs_space": envs[0].observation_space[0],
+            "act_space": envs[0].action_space[0]
+    }
+    config = {
+        "args": args,
+        "device": torch.device("cpu")
+    }
+    eval_context["envs"] = envs
+    eval_context["policy"] = QMixPolicy(config, policy_config, train=False)
+    eval_context["nb_agents"] = sce_conf["nb_agents"]
+    eval_context["init_pos_scenars"] = init_pos_scenars
+    eval_context["episode_length"] = args.episode_length
+
+@torch.no_grad()
+def eval_checkpoint(cp):
+    """
+    Evaluates a checkpoint on all initial positions, with one environment 
+    per initial position stepped in lockstep. Each step is one forward pass
+    of the policy on all agents of the running environments.
+    Inputs:
+        cp (str): Path of the checkpoint.
+    Outputs:
+        mean_return (float): Mean return of the episodes.
+        success_rate (float): Rate of successful episodes.
+        mean_ep_length (float): Mean length of the episodes.
+    """
+    envs = eval_context["envs"]
+    qmix_policy = eval_context["policy"]
+    nb_agents = eval_context["nb_agents"]
+    init_pos_scenars = eval_context["init_pos_scenars"]
+    n_episodes = len(init_pos_scenars)
+    # Load parameters in model
+    qmix_policy.load_state(cp)
+    qmix_policy.q_network.eval()
+
+    # Execute all episodes
+    tot_return = 0.0
+    n_success = 0.0
+    tot_ep_length = 0.0
+    rnn_states_batch = np.zeros(
+        (n_episodes * nb_agents, qmix_policy.hidden_size), dtype=np.float32)
+    last_acts_batch = np.zeros(
+        (n_episodes * nb_agents, qmix_policy.output_dim), dtype=np.float32)
+    # Reset environments with initial positions
+    obs = [envs[ep_i].reset(init_pos=init_pos_scenars[ep_i]) 
+           for ep_i in range(n_episodes)]
+    running = np.arange(n_episodes)
+    for step_i in range(eval_context["episode_length"]):
+        # Rows of the agents of running environments
+        rows = (running[:, np.newaxis] * nb_agents 
+                + np.arange(nb_agents)).flatten()
+        obs_batch = np.concatenate([np.array(obs[ep_i]) for ep_i in running])
+        acts_batch, new_rnn_states, _ = qmix_policy.get_actions(
+            obs_batch,
+            last_acts_batch[rows],
+            rnn_states_batch[rows])
+        acts_batch = acts_batch if isinstance(acts_batch, np.ndarray) \
+                        else acts_batch.cpu().detach().numpy()
+        # update rnn hidden state
+        new_rnn_states = new_rnn_states \
+            if isinstance(new_rnn_states, np.ndarray) \
+            else new_rnn_states.cpu().detach().numpy()
+        rnn_states_batch[rows] = new_rnn_states.reshape(len(rows), -1)
+        last_acts_batch[rows] = acts_batch
+
+        # Environments step
+        still_running = []
+        for b_i, ep_i in enumerate(running):
+            next_obs, rewards, dones, infos = envs[ep_i].step(
+                acts_batch[b_i * nb_agents:(b_i + 1) * nb_agents])
+            tot_return += rewards[0]
+            if dones[0]:
+                n_success += 1
+                tot_ep_length += step_i + 1
+            else:
+                obs[ep_i] = next_obs
+                still_running.append(ep_i)
+        running = np.array(still_running, dtype=int)
+        if len(running) == 0:
+            break
+    tot_ep_length += len(running) * eval_context["episode_length"]
+
+    return tot_return / n_episodes, n_success / n_episodes, \
+        tot_ep_length / n_episodes
+
+
 def run(args):
     output_file_path = os.path.join(args.model_dir, "eval_perfs.csv")
-    eval_perfs_df = pd.DataFrame(columns=["Training Eps", "Mean Return", "Success rate", "Mean Ep Length", "Name"])
+    eval_perfs_list = []
 
     # Load scenario config
     sce_conf_path = os.path.join(args.model_dir, "run1", "sce_config.json")
@@ -28,23 +132,6 @@ def run(args):
     with open(args.init_pos_file, 'r') as f:
         init_pos_scenars = json.load(f)
 
-    # Create environment
-    env = make_env(args.env_path, discrete_action=args.discrete_action, 
-                    sce_conf=sce_conf)
-
-    # Create model
-    policy_config = {
-            "cent_obs_dim": get_dim_from_space(
-                                env.share_observation_space[0]),
-            "obs_space": env.observation_space[0],
-            "act_space": env.action_space[0]
-    }
-    config = {
-        "args": args,
-        "device": torch.device("cpu")
-    }
-    qmix_policy = QMixPolicy(config, policy_config, train=False)
-
     # Get list of run directories
     run_dirs = os.listdir(args.model_dir)
     # Clean
@@ -52,7 +139,8 @@ def run(args):
         if len(r) > 5:
             run_dirs.remove(r)
     
-    # Evaluate each run
+    # Get checkpoints of each run
+    eval_cps = []
     for run in run_dirs:
         run_dir = os.path.join(args.model_dir, run)
         print("\nEvaluating run", run_dir)
@@ -64,60 +152,34 @@ def run(args):
             checkpoints_paths.append(os.path.join(run_dir, "incremental", cp))
         checkpoints_paths.append(os.path.join(run_dir, "model.pt"))
         
-        # Evaluate each checkpoint
         for cp_i, cp in enumerate(checkpoints_paths):
-            # Load parameters in model
-            qmix_policy.load_state(cp)
-            qmix_policy.q_network.eval()
-
-            # Execute all episodes
-            tot_return = 0.0
-            n_success = 0.0
-            tot_ep_length = 0.0
-            for ep_i in range(len(init_pos_scenars)):
-                rnn_states_batch = np.zeros(
-                    (sce_conf["nb_agents"], qmix_policy.hidden_size), 
-                    dtype=np.float32)
-                last_acts_batch = np.zeros(
-                    (sce_conf["nb_agents"], qmix_policy.output_dim), 
-                    dtype=np.float32)
-                # Reset environment with initial positions
-                obs = env.reset(init_pos=init_pos_scenars[ep_i])
-                for step_i in range(args.episode_length):
-                    obs_batch = np.array(obs)
-                    # get actions for all agents to step the env with exploration noise
-                    acts_batch, rnn_states_batch, _ = qmix_policy.get_actions(
-                        obs_batch,
-                        last_acts_batch,
-                        rnn_states_batch)
-                    acts_batch = acts_batch if isinstance(acts_batch, np.ndarray) \
-                                    else acts_batch.cpu().detach().numpy()
-                    # update rnn hidden state
-                    rnn_states_batch = rnn_states_batch \
-                        if isinstance(rnn_states_batch, np.ndarray) \
-                        else rnn_states_batch.cpu().detach().numpy()
-                    last_acts_batch = acts_batch
-                    
-                    # Environment step
-                    next_obs, rewards, dones, infos = env.step(acts_batch)
-                    tot_return += rewards[0]
-
-                    if dones[0]:
-                        n_success += 1
-                        break
-                    obs = next_obs
-                tot_ep_length += step_i + 1
-
-            # Save evaluation performance
-            eval_perfs = {
-                "Training Eps": cp_i * 10000,
-                "Mean Return": tot_return / len(init_pos_scenars), 
-                "Success rate": n_success / len(init_pos_scenars),
-                "Mean Ep Length": tot_ep_length / len(init_pos_scenars), 
-                "Name": args.model_dir.split('/')[-1]
-            }
-            eval_perfs_df = eval_perfs_df.append(eval_perfs, ignore_index=True)
+            eval_cps.append((cp_i, cp))
+
+    # Evaluate all checkpoints, distributed over the worker processes
+    cps = [cp for _, cp in eval_cps]
+    if args.n_workers > 1:
+        with Pool(args.n_workers, initializer=init_eval, 
+                  initargs=(args, sce_conf, init_pos_scenars)) as pool:
+            results = pool.map(eval_checkpoint, cps)
+    else:
+        init_eval(args, sce_conf, init_pos_scenars)
+        results = [eval_checkpoint(cp) for cp in cps]
+
+    # Save evaluation performance
+    for (cp_i, _), (mean_return, success_rate, mean_ep_length) in zip(
+            eval_cps, results):
+        eval_perfs = {
+            "Training Eps": cp_i * 10000,
+            "Mean Return": mean_return, 
+            "Success rate": success_rate,
+            "Mean Ep Length": mean_ep_length, 
+            "Name": args.model_dir.split('/')[-1]
+        }
+        eval_perfs_list.append(eval_perfs)
     # Save perfs in csv
+    eval_perfs_df = pd.DataFrame(eval_perfs_list, columns=[
+        "Training Eps", "Mean Return", "Success rate", "Mean Ep Length", 
+        "Name"])
     print("Saving evaluation performance to", output_file_path)
     eval_perfs_df.to_csv(output_file_path, index=False)
         
@@ -139,6 +201,9 @@ if __name__ == '__main__':
     # Environment
     parser.add_argument("--episode_length", default=100, type=int)
     parser.add_argument("--discrete_action", action='store_false') 
+    # Evaluation processes
+    parser.add_argument("--n_workers", default=1, type=int,
+                        help="Number of processes evaluating checkpoints")
     # recurrent parameters
     parser.add_argument('--prev_act_inp', action='store_true', default=False,
                         help="Whether the actor input takes in previous \
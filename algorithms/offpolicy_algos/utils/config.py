@@ -157,6 +157,8 @@ def get_config(args, parser=None):
     # qmix parameters
     parser.add_argument('--use_double_q', action='store_false',
                         default=True, help="Whether to use double q learning")
+    parser.add_argument('--truncate_episodes', action='store_false',
+                        default=True, help="Whether to unroll the Q-networks only up to the last valid step of the sampled episodes")
     parser.add_argument('--hypernet_layers', type=int, default=2,
                         help="Number of layers for hypernetworks. Must be either 1 or 2")
     parser.add_argument('--mixer_hidden_dim', type=int, default=32,
@@ -0,0 +1,211 @@
+import numpy as np
+
+
+def unique(sorted_array):
+    """
+    More efficient implementation of np.unique for sorted arrays
+    :param sorted_array: (np.ndarray)
+    :return:(np.ndarray) sorted_array without duplicate elements
+    """
+    if len(sorted_array) == 1:
+        return sorted_array
+    left = sorted_array[:-1]
+    right = sorted_array[1:]
+    uniques = np.append(right != left, True)
+    return sorted_array[uniques]
+
+
+class SegmentTree(object):
+    def __init__(self, capacity, operation, neutral_element):
+        """
+        Build a Segment Tree data structure.
+        https://en.wikipedia.org/wiki/Segment_tree
+        Can be used as regular array that supports Index arrays, but with two
+        important differences:
+            a) setting item's value is slightly slower.
+               It is O(lg capacity) instead of O(1).
+            b) user has access to an efficient ( O(log segment size) )
+               `reduce` operation which reduces `operation` over
+               a contiguous subsequence of items in the array.
+        Nodes are stored in a flat array, node i having children 2i and
+        2i + 1, so ranges of items can be set with one vectorized operation
+        per level of the tree (see `set_range`).
+        :param capacity: (int) Total size of the array - must be a power of two.
+        :param operation: (numpy.ufunc) operation for combining elements (eg. sum, max) must form a
+            mathematical group together with the set of possible values for array elements (i.e. be associative)
+        :param neutral_element: (Any) neutral element for the operation above. eg. float('-inf') for max and 0 for sum.
+        """
+        assert capacity > 0 and capacity & (
+            capacity - 1) == 0, "capacity must be positive and a power of 2."
+        self._capacity = capacity
+        self._value = np.full(2 * capacity, neutral_element, dtype=np.float64)
+        self._operation = operation
+        self.neutral_element = neutral_element
+
+    def reduce(self, start=0, end=None):
+        """
+        Returns result of applying `self.operation`
+        to a contiguous subsequence of the array.
+            self.operation(arr[start], operation(arr[start+1], operation(... arr[end])))
+        :param start: (int) beginning of the subsequence
+        :param end: (int) end of the subsequences
+        :return: (Any) result of reducing self.operation over the specified range of array elements.
+        """
+        if end is None:
+            end = self._capacity
+        if end < 0:
+            end += self._capacity
+        end -= 1
+        if start == 0 and end == self._capacity - 1:
+            return self._value[1]
+        # Walk up from the leaves bounding the range [start, end], gathering
+        # the nodes that cover it, then reduce them at once
+        left = start + self._capacity
+        right = end + self._capacity + 1
+        nodes = []
+        while left < right:
+            if left & 1:
+                nodes.append(left)
+                left += 1
+            if right & 1:
+                right -= 1
+                nodes.append(right)
+            left //= 2
+            right //= 2
+        if len(nodes) == 0:
+            return self.neutral_element
+        return self._operation.reduce(self._value[nodes])
+
+    def _update_range(self, start, end):
+        """
+        Recompute the ancestors of the leaves of items [start, end).
+        :param start: (int) first item of the range.
+        :param end: (int) end of the range, excluded.
+        """
+        # Parents of a contiguous range of nodes are contiguous
+        start = (start + self._capacity) // 2
+        end = (end - 1 + self._capacity) // 2 + 1
+        while start > 0:
+            self._value[start:end] = self._operation(
+                self._value[2 * start:2 * end:2],
+                self._value[2 * start + 1:2 * end:2])
+            start //= 2
+            end = (end - 1) // 2 + 1
+
+    def set_range(self, start, end, val, size=None):
+        """
+        Set the items of a range of consecutive indexes, updating each level
+        of the tree with one vectorized operation.
+        :param start: (int) first index of the range.
+        :param end: (int) end of the range, excluded. If greater than size,
+            the range wraps around to the start of the array.
+        :param val: (float or np.ndarray) values to set, one for each index
+            of the range or a single value for all.
+        :param size: (int) size of the array for wrapping around, e.g. the
+            size of the buffer, default is the capacity of the tree.
+        """
+        if size is None:
+            size = self._capacity
+        assert 0 <= start < size and start <= end <= start + size
+        if end <= size:
+            segments = [(start, end)]
+        else:
+            segments = [(start, size), (0, end - size)]
+        val = np.broadcast_to(val, (end - start,))
+        n_set = 0
+        for seg_start, seg_end in segments:
+            if seg_end == seg_start:
+                continue
+            self._value[self._capacity + seg_start:self._capacity + seg_end] \
+                = val[n_set:n_set + seg_end - seg_start]
+            n_set += seg_end - seg_start
+            self._update_range(seg_start, seg_end)
+
+    def __setitem__(self, idx, val):
+        # indexes of the leaf
+        idxs = np.atleast_1d(idx + self._capacity)
+        self._value[idxs] = val
+        # go up one level in the tree and remove duplicate indexes
+        idxs = unique(np.sort(idxs // 2))
+        while len(idxs) > 1 or idxs[0] > 0:
+            # as long as there are non-zero indexes, update the corresponding values
+            self._value[idxs] = self._operation(
+                self._value[2 * idxs],
+                self._value[2 * idxs + 1]
+            )
+            # go up one level in the tree and remove duplicate indexes
+            idxs = unique(idxs // 2)
+
+    def __getitem__(self, idx):
+        assert np.max(idx) < self._capacity
+        assert 0 <= np.min(idx)
+        return self._value[self._capacity + idx]
+
+
+class SumSegmentTree(SegmentTree):
+    def __init__(self, capacity):
+        super(SumSegmentTree, self).__init__(
+            capacity=capacity,
+            operation=np.add,
+            neutral_element=0.0
+        )
+
+    def sum(self, start=0, end=None):
+        """
+        Returns arr[start] + ... + arr[end]
+        :param start: (int) start position of the reduction (must be >= 0)
+        :param end: (int) end position of the reduction (must be < len(arr), can be None for len(arr) - 1)
+        :return: (Any) reduction of SumSegmentTree
+        """
+        return super(SumSegmentTree, self).reduce(start, end)
+
+    def find_prefixsum_idx(self, prefixsum):
+        """
+        Find the highest index `i` in the array such that
+            sum(arr[0] + arr[1] + ... + arr[i - i]) <= prefixsum for each entry in prefixsum
+        if array values are probabilities, this function
+        allows to sample indexes according to the discrete
+        probability efficiently.
+        :param prefixsum: (np.ndarray) float upper bounds on the sum of array prefix
+        :return: (np.ndarray) highest indexes satisfying the prefixsum constraint
+        """
+        if isinstance(prefixsum, float):
+            prefixsum = np.array([prefixsum])
+        assert 0 <= np.min(prefixsum)
+        assert np.max(prefixsum) <= self.sum() + 1e-5
+        assert isinstance(prefixsum[0], float)
+
+        idx = np.ones(len(prefixsum), dtype=int)
+        cont = np.ones(len(prefixsum), dtype=bool)
+
+        while np.any(cont):  # while not all nodes are leafs
+            idx[cont] = 2 * idx[cont]
+            prefixsum_new = np.where(
+                self._value[idx] <= prefixsum, prefixsum - self._value[idx], prefixsum)
+            # prepare update of prefixsum for all right children
+            idx = np.where(np.logical_or(
+                self._value[idx] > prefixsum, np.logical_not(cont)), idx, idx + 1)
+            # Select child node for non-leaf nodes
+            prefixsum = prefixsum_new
+            # update prefixsum
+            cont = idx < self._capacity
+            # collect leafs
+        return idx - self._capacity
+
+
+class MinSegmentTree(SegmentTree):
+    def __init__(self, capacity):
+        super(MinSegmentTree, self).__init__(
+            capacity=capacity,
+            operation=np.minimum,
+            neutral_element=float('inf')
+        )
+
+    def min(self, start=0, end=None):
+        """
+        Returns min(arr[start], ...,  arr[end])
+        :param start: (int) start position of the reduction (must be >= 0)
+        :param end: (int) end position of the reduction (must be < len(arr), can be None for len(arr) - 1)
+        :return: (Any) reduction of MinSegmentTree
+        """
+        return super(MinSegmentTree, self).reduce(start, end)